@@ -0,0 +1,3 @@
+@echo off
+
+python.exe %~dp0%~n0 %1 %2 %3 %4 %5 %6 %7 %8 
@@ -0,0 +1,584 @@
+#!/usr/bin/env python
+"""
+Compiler of Larch AST representation to Python closures.
+
+Each AST node is compiled once into a closure that does what
+Interpreter.run() does for that node: the handler for the node type
+is found when compiling instead of at every execution, child nodes
+are already compiled, and constant nodes need no work at all.  The
+compiled code keeps the semantics of the Interpreter, including how
+errors are recorded, and how break, continue and return are handled.
+
+Nodes that are rarely in loops (import, delete, raise, print, ...)
+are compiled to a call of the Interpreter's handler for the node,
+which runs its child nodes with Interpreter.run().
+"""
+from __future__ import division, print_function
+import ast
+import numpy
+import six
+from six.moves import builtins as py_builtins
+
+from .larchlib import ReturnedNone
+from .symboltable import isgroup
+
+# node types whose compiled code never returns an ndarray or enumerate,
+# and so do not need the conversions of Interpreter.run()
+PLAIN_NODES = ('arg', 'assert', 'assign', 'augassign', 'break', 'bytes',
+               'continue', 'dict', 'ellipsis', 'extslice', 'for', 'if',
+               'interrupt', 'list', 'listcomp', 'nameconstant', 'num',
+               'pass', 'repr', 'return', 'slice', 'str', 'try',
+               'tryexcept', 'tryfinally', 'tuple', 'while')
+
+# node types whose compiled code cannot raise an exception
+CONST_NODES = ('bytes', 'ellipsis', 'nameconstant', 'num', 'pass', 'str')
+
+def _none():
+    return None
+
+def _fix_objarray(out):
+    """for some cases (especially when using Parameter objects),
+    a calculation returns an otherwise numeric array, but with
+    dtype 'object'. fix here, trying (float, complex, list)."""
+    try:
+        return out.astype(float)
+    except TypeError:
+        try:
+            return out.astype(complex)
+        except TypeError:
+            return list(out)
+
+class CompiledCode(object):
+    """compiled AST node: call run() to execute it, as with
+    Interpreter.run(node)"""
+    def __init__(self, node, run):
+        self.node = node
+        self.run = run
+
+    def __repr__(self):
+        return "<CompiledCode %s>" % (self.node.__class__.__name__)
+
+class ASTCompiler(object):
+    """compile Larch AST nodes to Python closures, for an Interpreter"""
+    def __init__(self, interp):
+        from .interpreter import OPERATORS, UNSAFE_ATTRS
+        self.interp = interp
+        self.operators = OPERATORS
+        self.unsafe_attrs = UNSAFE_ATTRS
+
+    def compile(self, node):
+        """compile AST node to CompiledCode, for a node run
+        as with Interpreter.run(node, fname=..., lineno=...)"""
+        return CompiledCode(node, self._compile(node, toplevel=True))
+
+    def _compile(self, node, toplevel=False):
+        """compile AST node to closure that returns the value of
+        Interpreter.run(node)"""
+        interp = self.interp
+        if node is None:
+            return _none
+        nodetype = node.__class__.__name__.lower()
+        if nodetype not in interp.node_handlers:
+            return lambda: interp.unimplemented(node)
+
+        method = getattr(self, 'c_%s' % nodetype, None)
+        impl = None
+        if method is not None:
+            impl = method(node)
+        if impl is None:
+            handler = interp.node_handlers[nodetype]
+            impl = lambda: handler(node)
+
+        if method is not None and nodetype in CONST_NODES:
+            def run():
+                if not toplevel:
+                    interp.func = None
+                return impl()
+            return run
+
+        if method is not None and nodetype in PLAIN_NODES:
+            def run():
+                if not toplevel:
+                    interp.func = None
+                try:
+                    return impl()
+                except:
+                    interp.raise_exception(node, expr=interp.expr,
+                                           fname=interp.fname,
+                                           lineno=interp.lineno)
+            return run
+
+        ndarray, objtype = numpy.ndarray, numpy.object
+        converted = (ndarray, enumerate)
+        def run():
+            if not toplevel:
+                interp.func = None
+            try:
+                out = impl()
+            except:
+                interp.raise_exception(node, expr=interp.expr,
+                                       fname=interp.fname,
+                                       lineno=interp.lineno)
+                return None
+            if isinstance(out, converted):
+                if isinstance(out, enumerate):
+                    out = list(out)
+                elif out.dtype == objtype:
+                    out = _fix_objarray(out)
+            return out
+        return run
+
+    def _compile_body(self, nodes):
+        return [self._compile(tnode) for tnode in nodes]
+
+    def _compile_target(self, node):
+        """compile assignment to a target node, as Interpreter.node_assign,
+        to a closure taking the value to assign"""
+        interp = self.interp
+        cls = node.__class__
+        if cls == ast.Name:
+            name = node.id
+            def assign(val):
+                if len(interp.error) > 0:
+                    return
+                interp.symtable.set_symbol(name, value=val)
+        elif cls == ast.Attribute:
+            value = self._compile(node.value)
+            attr = node.attr
+            is_load = node.ctx.__class__ == ast.Load
+            def assign(val):
+                if len(interp.error) > 0:
+                    return
+                if is_load:
+                    errmsg = "cannot assign to attribute %s" % attr
+                    interp.raise_exception(node, exc=AttributeError,
+                                           msg=errmsg)
+                setattr(value(), attr, val)
+        elif cls == ast.Subscript:
+            value = self._compile(node.value)
+            xslice = self._compile(node.slice)
+            stype = node.slice.__class__
+            def assign(val):
+                if len(interp.error) > 0:
+                    return
+                sym = value()
+                xsl = xslice()
+                if stype == ast.Index:
+                    sym[xsl] = val
+                elif stype == ast.Slice:
+                    sym[slice(xsl.start, xsl.stop)] = val
+                elif stype == ast.ExtSlice:
+                    sym[(xsl)] = val
+        elif cls in (ast.Tuple, ast.List):
+            elts = [self._compile_target(tnode) for tnode in node.elts]
+            nelts = len(elts)
+            def assign(val):
+                if len(interp.error) > 0:
+                    return
+                if len(val) == nelts:
+                    for telem, tval in zip(elts, val):
+                        telem(tval)
+                else:
+                    raise ValueError('too many values to unpack')
+        else:
+            def assign(val):
+                return None
+        return assign
+
+    # compilers for node types, returning closures that do the
+    # work of the Interpreter's handler for a node
+    def c_expr(self, node):
+        return self._compile(node.value)
+
+    c_index = c_expr
+
+    def c_return(self, node):
+        interp = self.interp
+        value = self._compile(node.value)
+        def impl():
+            ret = value()
+            if ret is None:
+                ret = ReturnedNone
+            interp.retval = ret
+        return impl
+
+    def c_repr(self, node):
+        value = self._compile(node.value)
+        return lambda: repr(value())
+
+    def c_module(self, node):
+        body = self._compile_body(node.body)
+        def impl():
+            out = None
+            for tnode in body:
+                out = tnode()
+            return out
+        return impl
+
+    c_expression = c_module
+
+    def c_pass(self, node):
+        return _none
+
+    def c_ellipsis(self, node):
+        return lambda: Ellipsis
+
+    def c_interrupt(self, node):
+        interp = self.interp
+        def impl():
+            interp._interrupt = node
+            return node
+        return impl
+
+    c_break = c_continue = c_interrupt
+
+    def c_arg(self, node):
+        arg = node.arg
+        return lambda: arg
+
+    def c_assert(self, node):
+        interp = self.interp
+        test = self._compile(node.test)
+        def impl():
+            if not test():
+                interp.raise_exception(node, exc=AssertionError,
+                                       msg=node.msg)
+            return True
+        return impl
+
+    def c_list(self, node):
+        elts = self._compile_body(node.elts)
+        return lambda: [elt() for elt in elts]
+
+    def c_tuple(self, node):
+        elts = self._compile_body(node.elts)
+        return lambda: tuple([elt() for elt in elts])
+
+    def c_dict(self, node):
+        items = [(self._compile(k), self._compile(v))
+                 for k, v in zip(node.keys, node.values)]
+        return lambda: dict([(k(), v()) for k, v in items])
+
+    def c_num(self, node):
+        val = node.n
+        return lambda: val
+
+    def c_str(self, node):
+        val = node.s
+        return lambda: val
+
+    c_bytes = c_str
+
+    def c_nameconstant(self, node):
+        val = node.value
+        return lambda: val
+
+    def c_name(self, node):
+        interp = self.interp
+        name = node.id
+        ctx = node.ctx.__class__
+        if ctx == ast.Del:
+            return lambda: interp.symtable.del_symbol(name)
+        elif ctx == ast.Param:
+            name = str(name)
+            return lambda: name
+        msg = "name '%s' is not defined" % name
+        def impl():
+            try:
+                return interp.symtable.get_symbol(name)
+            except (NameError, LookupError):
+                interp.raise_exception(node, msg=msg)
+        return impl
+
+    def c_attribute(self, node):
+        interp = self.interp
+        if node.ctx.__class__ == ast.Del:
+            return None
+        value = self._compile(node.value)
+        attr = node.attr
+        safe = attr not in self.unsafe_attrs
+        def impl():
+            sym = value()
+            if safe:
+                try:
+                    return getattr(sym, attr)
+                except AttributeError:
+                    pass
+            obj = value()
+            fmt = "%s does not have member '%s'"
+            if not isgroup(obj):
+                obj = obj.__class__
+                fmt = "%s does not have attribute '%s'"
+            interp.raise_exception(node, exc=AttributeError,
+                                   msg=fmt % (obj, attr))
+        return impl
+
+    def c_assign(self, node):
+        interp = self.interp
+        value = self._compile(node.value)
+        targets = [self._compile_target(tnode) for tnode in node.targets]
+        def impl():
+            val = value()
+            if len(interp.error) > 0:
+                return
+            for target in targets:
+                target(val)
+        return impl
+
+    def c_augassign(self, node):
+        interp = self.interp
+        value = self._compile(ast.BinOp(left=node.target, op=node.op,
+                                        right=node.value))
+        target = self._compile_target(node.target)
+        def impl():
+            val = value()
+            if len(interp.error) > 0:
+                return
+            target(val)
+        return impl
+
+    def c_slice(self, node):
+        lower = self._compile(node.lower)
+        upper = self._compile(node.upper)
+        step = self._compile(node.step)
+        return lambda: slice(lower(), upper(), step())
+
+    def c_extslice(self, node):
+        dims = self._compile_body(node.dims)
+        return lambda: tuple([dim() for dim in dims])
+
+    def c_subscript(self, node):
+        interp = self.interp
+        value = self._compile(node.value)
+        nslice = self._compile(node.slice)
+        ctx = node.ctx.__class__
+        if ctx not in (ast.Load, ast.Store):
+            def impl():
+                value()
+                nslice()
+                interp.raise_exception(node,
+                                       msg="subscript with unknown context")
+        elif isinstance(node.slice, (ast.Index, ast.Slice, ast.Ellipsis)):
+            def impl():
+                val = value()
+                return val.__getitem__(nslice())
+        elif isinstance(node.slice, ast.ExtSlice):
+            def impl():
+                val = value()
+                return val[(nslice())]
+        else:
+            def impl():
+                value()
+                nslice()
+        return impl
+
+    def c_unaryop(self, node):
+        op = self.operators[node.op.__class__]
+        operand = self._compile(node.operand)
+        return lambda: op(operand())
+
+    def c_binop(self, node):
+        op = self.operators[node.op.__class__]
+        left = self._compile(node.left)
+        right = self._compile(node.right)
+        return lambda: op(left(), right())
+
+    def c_boolop(self, node):
+        op = self.operators[node.op.__class__]
+        first = self._compile(node.values[0])
+        rest = self._compile_body(node.values[1:])
+        is_and = ast.And == node.op.__class__
+        def impl():
+            val = first()
+            if (is_and and val) or (not is_and and not val):
+                for tnode in rest:
+                    val = op(val, tnode())
+                    if (is_and and not val) or (not is_and and val):
+                        break
+            return val
+        return impl
+
+    def c_compare(self, node):
+        left = self._compile(node.left)
+        comps = [(self.operators[oper.__class__], self._compile(rnode))
+                 for oper, rnode in zip(node.ops, node.comparators)]
+        def impl():
+            lval = left()
+            out = True
+            for comp, rnode in comps:
+                rval = rnode()
+                out = comp(lval, rval)
+                lval = rval
+                if not hasattr(out, 'any') and not out:
+                    break
+            return out
+        return impl
+
+    def c_if(self, node):
+        test = self._compile(node.test)
+        body = self._compile_body(node.body)
+        orelse = self._compile_body(node.orelse)
+        def impl():
+            block = body
+            if not test():
+                block = orelse
+            for tnode in block:
+                tnode()
+        return impl
+
+    def c_ifexp(self, node):
+        test = self._compile(node.test)
+        body = self._compile(node.body)
+        orelse = self._compile(node.orelse)
+        def impl():
+            if test():
+                return body()
+            return orelse()
+        return impl
+
+    def c_while(self, node):
+        interp = self.interp
+        test = self._compile(node.test)
+        body = self._compile_body(node.body)
+        orelse = self._compile_body(node.orelse)
+        Break = ast.Break
+        def impl():
+            while test():
+                interp._interrupt = None
+                for tnode in body:
+                    tnode()
+                    if interp._interrupt is not None:
+                        break
+                if isinstance(interp._interrupt, Break):
+                    break
+            else:
+                for tnode in orelse:
+                    tnode()
+            interp._interrupt = None
+        return impl
+
+    def c_for(self, node):
+        interp = self.interp
+        iterator = self._compile(node.iter)
+        target = self._compile_target(node.target)
+        body = self._compile_body(node.body)
+        orelse = self._compile_body(node.orelse)
+        Break = ast.Break
+        def impl():
+            for val in iterator():
+                target(val)
+                if len(interp.error) > 0:
+                    return
+                interp._interrupt = None
+                for tnode in body:
+                    tnode()
+                    if len(interp.error) > 0:
+                        return
+                    if interp._interrupt is not None:
+                        break
+                if isinstance(interp._interrupt, Break):
+                    break
+            else:
+                for tnode in orelse:
+                    tnode()
+            interp._interrupt = None
+        return impl
+
+    def c_listcomp(self, node):
+        interp = self.interp
+        elt = self._compile(node.elt)
+        generators = []
+        for tnode in node.generators:
+            if tnode.__class__ == ast.comprehension:
+                generators.append((self._compile(tnode.iter),
+                                   self._compile_target(tnode.target),
+                                   self._compile_body(tnode.ifs)))
+        def impl():
+            out = []
+            for iterator, target, ifs in generators:
+                for val in iterator():
+                    target(val)
+                    if len(interp.error) > 0:
+                        return
+                    add = True
+                    for cond in ifs:
+                        add = add and cond()
+                    if add:
+                        out.append(elt())
+            return out
+        return impl
+
+    def c_tryexcept(self, node):
+        interp = self.interp
+        body = self._compile_body(node.body)
+        handlers = [(hnd, self._compile_target(hnd.name),
+                     self._compile_body(hnd.body)) for hnd in node.handlers]
+        orelse = self._compile_body(getattr(node, 'orelse', []))
+        finalbody = self._compile_body(getattr(node, 'finalbody', []))
+        def impl():
+            no_errors = True
+            for tnode in body:
+                tnode()
+                no_errors = no_errors and len(interp.error) == 0
+                if interp.error:
+                    e_type, e_value, e_tb = interp.error[-1].exc_info
+                    this_exc = e_type()
+                    for hnd, target, hbody in handlers:
+                        htype = None
+                        if hnd.type is not None:
+                            htype = getattr(py_builtins, hnd.type.id, None)
+                        if htype is None or isinstance(this_exc, htype):
+                            interp.error = []
+                            interp._interrupt = None
+                            if hnd.name is not None:
+                                target(e_value)
+                            for tline in hbody:
+                                tline()
+                            break
+            if no_errors:
+                for tnode in orelse:
+                    tnode()
+            for tnode in finalbody:
+                tnode()
+        return impl
+
+    c_try = c_tryfinally = c_tryexcept
+
+    def c_call(self, node):
+        interp = self.interp
+        func = self._compile(node.func)
+        args = self._compile_body(node.args)
+        starargs = getattr(node, 'starargs', None)
+        if starargs is not None:
+            starargs = self._compile(starargs)
+        keywords = [(key, self._compile(getattr(key, 'value', None)))
+                    for key in node.keywords]
+        kwargs = getattr(node, 'kwargs', None)
+        if kwargs is not None:
+            kwargs = self._compile(kwargs)
+        def impl():
+            fcn = func()
+            if not callable(fcn):
+                msg = "'%s' is not callable!!" % (fcn)
+                interp.raise_exception(node, exc=TypeError, msg=msg)
+            fargs = [arg() for arg in args]
+            if starargs is not None:
+                fargs = fargs + starargs()
+            fkws = {}
+            if six.PY3 and fcn == print:
+                fkws['file'] = interp.writer
+            for key, value in keywords:
+                if not isinstance(key, ast.keyword):
+                    msg = "keyword error in function call '%s'" % (fcn)
+                    interp.raise_exception(node, msg=msg)
+                if key.arg is None:
+                    fkws.update(value())
+                else:
+                    fkws[key.arg] = value()
+            if kwargs is not None:
+                fkws.update(kwargs())
+            try:
+                return fcn(*fargs, **fkws)
+            except:
+                interp.raise_exception(node, msg="Error running %s" % (fcn))
+        return impl
@@ -194,12 +194,16 @@ def _help(*args, **kws):
     else:
         return helper.getbuffer()
 
-def _addplugin(plugin, _larch=None, verbose=False, **kws):
-    """add plugin components from plugin directory"""
+def _addplugin(plugin, _larch=None, verbose=False, lazy=False, **kws):
+    """add plugin components from plugin directory
+
+    with lazy=True, plugin modules found in the plugin manifest are
+    imported when one of their symbols is first used"""
     if _larch is None:
         raise Warning("cannot add plugins. larch broken?")
     symtable = _larch.symtable
     write = _larch.writer.write
+    manifest = _larch.plugins.manifest
     errmsg = 'is not a valid larch plugin\n'
     pjoin = os.path.join
     path = site_config.plugins_path
@@ -283,8 +287,56 @@ def _addplugin(plugin, _larch=None, verbose=False, **kws):
                         return False
         return True
 
-    def _plugin_file(plugin, path=None):
-        "defined here to allow recursive imports for packages"
+    def _find_package_modules(plugin, pkgpath):
+        """find modules for a plugin folder, as (requirements_ok, modules)
+        with modules a list of (filename, modpath, desc), from the
+        plugin manifest if the folder has not changed.  desc is None
+        for sub-packages, and modpath None for files not found"""
+        files, reqfile = (PLUGINSTXT,), PLUGINSREQ
+        cached = manifest.get_package(pkgpath, files=files, reqfile=reqfile)
+        if cached is not None:
+            return cached
+        if not _check_requirements(plugin):
+            manifest.put_package(pkgpath, False, [], files=files,
+                                 reqfile=reqfile)
+            return False, []
+        filelist = []
+        if PLUGINSTXT in sorted(os.listdir(pkgpath)):
+            pfile = os.path.abspath(os.path.join(pkgpath, PLUGINSTXT))
+            try:
+                with open(pfile, 'r') as pluginsfile:
+                    for name in pluginsfile:
+                        name = name[:-1].strip()
+                        if (not name.startswith('#') and
+                            name.endswith('.py') and len(name) > 3):
+                            filelist.append(name)
+            except:
+                write("Warning:: Error reading plugin file:\n %s\n" %
+                      pfile)
+        if len(filelist) == 0:
+            for fname in sorted(os.listdir(pkgpath)):
+                if fname.endswith('.py') and len(fname) > 3:
+                    filelist.append(fname)
+
+        modules = []
+        for fname in filelist:
+            modpath, desc = None, None
+            if fname[:-3] != '__init__':
+                is_pkg, mod = _find_plugin(fname[:-3], pkgpath)
+                if is_pkg:
+                    modpath = mod
+                elif mod is not None:
+                    fh, modpath, desc = mod
+                    if fh is not None:
+                        fh.close()
+            modules.append((fname, modpath, desc))
+        manifest.put_package(pkgpath, True, modules, files=files,
+                             reqfile=reqfile)
+        return True, modules
+
+    def _plugin_file(plugin, path=None, found=None):
+        """defined here to allow recursive imports for packages.
+        found is (is_pkg, mod) as from _find_plugin, if already known"""
         fh = None
         if plugin == '__init__':
             return
@@ -297,10 +349,13 @@ def _addplugin(plugin, _larch=None, verbose=False, **kws):
             except:
                 path = site_config.plugins_path
 
-        for p_path in path:
-            is_pkg, mod = _find_plugin(plugin, p_path)
-            if is_pkg is not None:
-                break
+        if found is not None:
+            is_pkg, mod = found
+        else:
+            for p_path in path:
+                is_pkg, mod = _find_plugin(plugin, p_path)
+                if is_pkg is not None:
+                    break
         if is_pkg is None and mod is None:
             write('Warning: plugin %s not found\n' % plugin)
             return False
@@ -308,31 +363,19 @@ def _addplugin(plugin, _larch=None, verbose=False, **kws):
         retval = True
         out = None
         if is_pkg:
-            if _check_requirements(plugin):
-                filelist = []
-                if PLUGINSTXT in sorted(os.listdir(mod)):
-                    pfile = os.path.abspath(os.path.join(mod, PLUGINSTXT))
-                    try:
-                        with open(pfile, 'r') as pluginsfile:
-                            for name in pluginsfile:
-                                name = name[:-1].strip()
-                                if (not name.startswith('#') and
-                                    name.endswith('.py') and len(name) > 3):
-                                    filelist.append(name)
-                    except:
-                        write("Warning:: Error reading plugin file:\n %s\n" %
-                              pfile)
-                if len(filelist) == 0:
-                    for fname in sorted(os.listdir(mod)):
-                        if fname.endswith('.py') and len(fname) > 3:
-                            filelist.append(fname)
-
+            requirements_ok, modules = _find_package_modules(plugin, mod)
+            if requirements_ok:
                 retvals = []
-                for fname in filelist:
+                for fname, modpath, desc in modules:
                     if not symtable._sys.import_ok:
                         return
+                    found = (None, None)
+                    if desc is not None:
+                        found = (False, (None, modpath, desc))
+                    elif modpath is not None:
+                        found = (True, modpath)
                     try:
-                        ret =  _plugin_file(fname[:-3], path=[mod])
+                        ret =  _plugin_file(fname[:-3], path=[mod], found=found)
                     except:
                         err, exc, tback = sys.exc_info()
                         write('Warning: %s is =not= a valid plugin\n' %
@@ -344,10 +387,12 @@ def _addplugin(plugin, _larch=None, verbose=False, **kws):
                 retval = all(retvals)
         else:
             fh, modpath, desc = mod
+            registry = _larch.plugins
             try:
-                out = imp.load_module(plugin, fh, modpath, desc)
-                ret = symtable.add_plugin(out, on_error, **kws)
-                symtable._sys.last_import = ret
+                if not (lazy and registry.add_lazy(plugin, modpath, desc)):
+                    ret = registry.load_module(plugin, fh, modpath, desc,
+                                               on_error, **kws)
+                    symtable._sys.last_import = ret
             except:
                 err, exc, tback = sys.exc_info()
                 lineno = getattr(exc, 'lineno', 0)
@@ -93,7 +93,8 @@ class ParameterGroup(Group):
             self.__params__.add(name, value=val.value, vary=val.vary, min=val.min,
                               max=val.max, expr=val.expr, brute_step=val.brute_step)
             val = self.__params__[name]
-        self.__dict__[name] = val
+        # Group.__setattr__ marks the name as changed for symbol lookups
+        Group.__setattr__(self, name, val)
 
     def __add(self, name, value=None, vary=True, min=-np.inf, max=np.inf,
               expr=None, stderr=None, correl=None, brute_step=None):
@@ -105,7 +106,7 @@ class ParameterGroup(Group):
                               expr=expr, brute_step=brute_step)
             self.__params__[name].stderr = stderr
             self.__params__[name].correl = correl
-            self.__dict__[name] = self.__params__[name]
+            Group.__setattr__(self, name, self.__params__[name])
 
 
 def param_group(_larch=None, **kws):
@@ -10,6 +10,8 @@ import six
 from collections import deque
 from copy import copy
 
+from .utils import LRUCache
+
 OPENS  = '{(['
 CLOSES = '})]'
 PARENS = dict(zip(OPENS, CLOSES))
@@ -183,7 +185,7 @@ class HistoryBuffer(object):
 class InputText:
     """input text for larch, with history"""
     def __init__(self, _larch=None, historyfile=None, maxhistory=5000,
-                 prompt='larch> ',prompt2 = ".....> "):
+                 prompt='larch> ',prompt2 = ".....> ", maxcache=1000):
         self.deque = deque()
         self.filename = '<stdin>'
         self.lineno = 0
@@ -195,6 +197,8 @@ class InputText:
         self.prompt = prompt
         self.prompt2 = prompt2
         self.saved_text = BLANK_TEXT
+        self.valid_commands = []
+        self.putcache = LRUCache(maxsize=maxcache)
         self.history = HistoryBuffer(filename=historyfile,
                                      maxlines=maxhistory)
 
@@ -230,13 +234,15 @@ class InputText:
         self.curtext = ''
         self.blocks = []
 
-    def putfile(self, filename):
+    def putfile(self, filename, entries=None):
         """add the content of a file at the top of the stack
         that is, to be run next, as for   run('myscript.lar')
 
         Parameters
         ----------
         filename  : file object or string of filename
+        entries   : list of lines for the file, as queued by put(),
+                    to use instead of reading the file [None]
 
         Returns
         -------
@@ -245,6 +251,13 @@ class InputText:
         """
 
         text = None
+        if entries is not None:
+            current = copy(self.deque)
+            self.deque.clear()
+            self.deque.extend(entries)
+            self.deque.extend(current)
+            return
+
         try:
             if isinstance(filename, FILETYPE):
                 text = filename.read()
@@ -282,6 +295,21 @@ class InputText:
         if self.history is not None and add_history:
             self.history.add(text)
 
+        # text put with no incomplete input pending is queued
+        # the same way each time, so use the cached lines if found
+        cachekey = None
+        if len(self.curtext) == 0 and len(self.blocks) == 0:
+            cachekey = (text, self.filename, self.lineno,
+                        tuple(self.valid_commands))
+            cached = self.putcache.get(cachekey, None)
+            if cached is not None:
+                entries, state = cached
+                self.deque.extend(entries)
+                self.lineno, self.curline, self.curtext, blocks = state
+                self.blocks = list(blocks)
+                return
+        nqueued = len(self.deque)
+
         for txt in text.split('\n'):
             self.lineno += 1
             if len(self.curtext) == 0:
@@ -329,6 +357,12 @@ class InputText:
 
                 self.curtext = ''
 
+        if cachekey is not None:
+            entries = list(self.deque)[nqueued:]
+            state = (self.lineno, self.curline, self.curtext,
+                     tuple(self.blocks))
+            self.putcache[cachekey] = (entries, state)
+
     @property
     def complete(self):
         return len(self.curtext)==0 and len(self.blocks)==0
@@ -22,7 +22,10 @@ from .inputText import InputText, BLANK_TEXT
 from .larchlib import (LarchExceptionHolder, ReturnedNone,
                        Procedure, StdWriter, enable_plugins)
 from .fitting  import isParameter
-from .utils import Closure
+from .utils import Closure, LRUCache
+from .astcompiler import ASTCompiler, CompiledCode
+from .parsecache import ParseCache
+from .pluginregistry import PluginRegistry
 
 UNSAFE_ATTRS = ('__subclasses__', '__bases__', '__code__',
                 '__closure__', '__globals__', 'func_code',
@@ -94,7 +97,9 @@ class Interpreter:
                        'tryfinally', 'tuple', 'unaryop', 'while')
 
     def __init__(self, symtable=None, input=None, writer=None,
-                 with_plugins=True, historyfile=None, maxhistory=5000):
+                 with_plugins=True, historyfile=None, maxhistory=5000,
+                 use_compiler=False, maxcompiled=1000, maxparsed=1000,
+                 lazy_plugins=False):
 
         self.symtable   = symtable or SymbolTable(larch=self)
         self.input      = input or InputText(_larch=self,
@@ -108,6 +113,12 @@ class Interpreter:
         self.func       = None
         self.fname      = '<stdin>'
         self.lineno     = 0
+        self.use_compiler = use_compiler
+        self.compiled     = LRUCache(maxsize=maxcompiled)
+        self.parsecache   = ParseCache(maxsize=maxparsed,
+                                       cachedir=site_config.parsecache_dir)
+        self.plugins      = PluginRegistry(self.symtable,
+                                           manifest=site_config.plugin_manifest)
         builtingroup    = self.symtable._builtin
         mathgroup       = self.symtable._math
         setattr(mathgroup, 'j', 1j)
@@ -145,22 +156,28 @@ class Interpreter:
         self.on_tryfinally = self.on_tryexcept
         self.node_handlers = dict(((node, getattr(self, "on_%s" % node))
                                    for node in self.supported_nodes))
+        self.compiler = ASTCompiler(self)
 
+        # plugin modules in the plugin manifest may be imported on first use
+        lazy_plugins = lazy_plugins or site_config.lazy_plugins
         if with_plugins: # add all plugins in standard plugins folder
             plugins_dir = os.path.join(site_config.larchdir, 'plugins')
             loaded_plugins = []
             for pname in site_config.core_plugins:
                 pdir = os.path.join(plugins_dir, pname)
                 if os.path.isdir(pdir):
-                    builtins._addplugin(pdir, _larch=self)
+                    builtins._addplugin(pdir, _larch=self,
+                                        lazy=lazy_plugins)
                     loaded_plugins.append(pname)
 
             for pname in sorted(os.listdir(plugins_dir)):
                 if pname not in loaded_plugins:
                     pdir = os.path.join(plugins_dir, pname)
                     if os.path.isdir(pdir):
-                        builtins._addplugin(pdir, _larch=self)
+                        builtins._addplugin(pdir, _larch=self,
+                                            lazy=lazy_plugins)
                         loaded_plugins.append(pname)
+            self.plugins.save()
 
         reset_fiteval = getattr(mathgroup, 'reset_fiteval', None)
         if callable(reset_fiteval):
@@ -207,8 +224,13 @@ class Interpreter:
     def parse(self, text, fname=None, lineno=-1):
         """parse statement/expression to Ast representation    """
         self.expr  = text
+        node = self.parsecache.get(text, fname)
+        if node is not None:
+            return node
         try:
-            return ast.parse(text)
+            node = ast.parse(text)
+            self.parsecache.put(text, fname, node)
+            return node
         except:
             etype, exc, tb = sys.exc_info()
             if (isinstance(exc, SyntaxError) and
@@ -226,6 +248,20 @@ class Interpreter:
             self.raise_exception(None, exc=SyntaxError, msg='Syntax Error',
                                  expr=text, fname=fname, lineno=lineno)
 
+    def compile(self, text, fname=None, lineno=-1):
+        """parse and compile statement/expression to CompiledCode,
+        caching compiled code by source text"""
+        code = self.compiled.get(text, None)
+        if code is not None:
+            self.expr = text
+            return code
+        node = self.parse(text, fname=fname, lineno=lineno)
+        if node is None:
+            return None
+        code = self.compiler.compile(node)
+        self.compiled[text] = code
+        return code
+
     def run(self, node, expr=None, func=None,
             fname=None, lineno=None, with_raise=False):
         """executes parsed Ast representation for an expression"""
@@ -245,6 +281,10 @@ class Interpreter:
         # if func is not None:
         self.func = func
 
+        # compiled code runs itself, including error handling
+        if isinstance(node, CompiledCode):
+            return node.run()
+
         # get handler for this node:
         #   on_xxx with handle nodes of type 'xxx', etc
         if node.__class__.__name__.lower() not in self.node_handlers:
@@ -307,7 +347,10 @@ class Interpreter:
                 continue
             call_stack[-1] = (text, fname, lineno)
             try:
-                node = self.parse(text, fname=fname, lineno=lineno)
+                if self.use_compiler:
+                    node = self.compile(text, fname=fname, lineno=lineno)
+                else:
+                    node = self.parse(text, fname=fname, lineno=lineno)
                 ret =  self.run(node, expr=text, fname=fname, lineno=lineno)
             except RuntimeError:
                 pass
@@ -320,7 +363,15 @@ class Interpreter:
         """
         run the larch code held in a file, possibly as 'module'
         """
-        ret = self.input.putfile(filename)
+        # parsed statements of larch files are cached on disk
+        entries, commands = None, ()
+        use_cache = isinstance(filename, six.string_types)
+        if use_cache:
+            commands = self.symtable.get_symbol('_sys.valid_commands',
+                                                create=True)
+            entries = self.parsecache.load_file(filename, commands=commands)
+        nqueued = len(self.input)
+        ret = self.input.putfile(filename, entries=entries)
         if ret is not None:
             exc, msg = ret
             err = LarchExceptionHolder(node=None, exc=IOError,
@@ -349,6 +400,10 @@ class Interpreter:
             self.symtable._sys.last_error = err
             return
 
+        if use_cache and entries is None:
+            entries = list(self.input.deque)[:len(self.input)-nqueued]
+            self.parsecache.save_file(filename, entries, commands=commands)
+
         thismod = None
         if new_module is not None:
             # save current module group
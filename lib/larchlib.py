@@ -146,6 +146,7 @@ class LarchExceptionHolder:
                     ('ast.py' in tb[0] or
                      os.path.join('larch', 'utils') in tb[0] or
                      os.path.join('larch', 'interpreter') in tb[0] or
+                     os.path.join('larch', 'astcompiler') in tb[0] or
                      os.path.join('larch', 'symboltable') in tb[0])):
                 tblist.append(tb)
         if len(tblist) > 0:
@@ -220,6 +221,7 @@ class Procedure(object):
         self.lineno   = lineno
         self.__file__ = fname
         self.__name__ = name
+        self.compiled = None
 
     def __repr__(self):
         return "<Procedure %s, file=%s>" % (self.name, self.__file__)
@@ -330,8 +332,15 @@ class Procedure(object):
         retval = None
         self._larch.retval = None
         self._larch.debug = True
-        for node in self.body:
-            self._larch.run(node, fname=self.__file__, func=self,
+        body = self.body
+        if getattr(self._larch, 'use_compiler', False):
+            if self.compiled is None:
+                self.compiled = [self._larch.compiler.compile(node)
+                                 for node in self.body]
+            body = self.compiled
+        for code in body:
+            node = getattr(code, 'node', code)
+            self._larch.run(code, fname=self.__file__, func=self,
                             lineno=node.lineno+self.lineno-1, with_raise=False)
             if len(self._larch.error) > 0:
                 break
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Cache of parsed Larch code.
+
+In memory, parsed AST representations are held in an LRU cache
+keyed by source text and file name, so that repeated commands are
+parsed only once.
+
+On disk, the statements of larch files run with run() or import are
+saved with their AST representations, keyed by the modification time
+and size of the file, so that large files of macros are not scanned
+and parsed again until they change.
+"""
+import os
+import sys
+import ast
+import hashlib
+import pickle
+
+from .utils import LRUCache
+
+# increment when the format of cache files changes
+CACHE_VERSION = 1
+
+def group_statements(entries):
+    """join lines queued by InputText.put() into statements, as
+    returned by InputText.get(), as list of (text, fname, lineno)"""
+    out, lines = [], []
+    fname, lineno = None, None
+    for text, fn, ln, done in entries:
+        if len(lines) == 0:
+            fname, lineno = fn, ln
+        lines.append(text)
+        if done:
+            out.append(("\n".join(lines), fname, lineno))
+            lines = []
+    return out
+
+class ParseCache(object):
+    """cache of parsed Larch code
+
+    Parameters
+    ----------
+    maxsize :   maximum number of parsed statements held in memory [1000]
+    cachedir :  folder for cache files of larch files, or None to
+                not cache larch files on disk [None]
+    """
+    def __init__(self, maxsize=1000, cachedir=None):
+        self.parsed = LRUCache(maxsize=maxsize)
+        self.cachedir = cachedir
+
+    def get(self, text, fname=None):
+        "AST for text from fname, or None if not cached"
+        return self.parsed.get((text, fname), None)
+
+    def put(self, text, fname, node):
+        "save AST for text from fname"
+        self.parsed[(text, fname)] = node
+
+    def clear(self):
+        self.parsed.clear()
+
+    def cachefile(self, filename):
+        "name of cache file for a larch file"
+        key = os.path.abspath(filename).encode('utf-8')
+        return os.path.join(self.cachedir,
+                            '%s.pkl' % hashlib.sha1(key).hexdigest())
+
+    def _filekey(self, filename, commands):
+        stat = os.stat(filename)
+        return (CACHE_VERSION, tuple(sys.version_info[:3]),
+                os.path.abspath(filename), stat.st_mtime, stat.st_size,
+                tuple(commands))
+
+    def load_file(self, filename, commands=()):
+        """return queued lines for a larch file from its cache file,
+        adding its parsed statements to the memory cache, or None if
+        the file is not cached or has changed since it was cached.
+
+        commands is the list of valid commands for InputText"""
+        if self.cachedir is None:
+            return None
+        try:
+            key = self._filekey(filename, commands)
+            with open(self.cachefile(filename), 'rb') as fh:
+                cache = pickle.load(fh)
+        except Exception:
+            return None
+        if not isinstance(cache, dict) or cache.get('key', None) != key:
+            return None
+        for text, node in cache['parsed']:
+            self.put(text, filename, node)
+        return cache['entries']
+
+    def save_file(self, filename, entries, commands=()):
+        """save queued lines for a larch file and their parsed
+        statements to its cache file, adding the parsed statements
+        to the memory cache.  Returns whether the cache file was written.
+
+        entries is the list of lines queued by InputText.put() for the
+        file, and commands the list of valid commands for InputText"""
+        parsed = []
+        for text, fname, lineno in group_statements(entries):
+            node = self.get(text, fname)
+            if node is None:
+                try:
+                    node = ast.parse(text)
+                except Exception:
+                    return False
+                self.put(text, fname, node)
+            parsed.append((text, node))
+        if self.cachedir is None:
+            return False
+        try:
+            cache = {'key': self._filekey(filename, commands),
+                     'entries': list(entries), 'parsed': parsed}
+            if not os.path.exists(self.cachedir):
+                os.makedirs(self.cachedir)
+            cfile = self.cachefile(filename)
+            tmpfile = '%s.%i' % (cfile, os.getpid())
+            with open(tmpfile, 'wb') as fh:
+                pickle.dump(cache, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            getattr(os, 'replace', os.rename)(tmpfile, cfile)
+        except Exception:
+            return False
+        return True
@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+"""
+Registry of Larch plugins, with lazy import of plugin modules.
+
+When a plugin module is imported, the names it registers with
+registerLarchPlugin() are saved to a manifest file, keyed by the
+modification time and size of the module.  When the interpreter
+starts, plugin modules found unchanged in the manifest are not
+imported: their symbols are added as LazySymbol placeholders, and the
+module is imported on first use of any of its symbols.
+
+Modules that define initializeLarchPlugin() or registerLarchGroups(),
+or that register values that are not functions, are always imported
+at startup.  Modules that register nothing are not imported at all
+once they are in the manifest.
+
+The manifest also holds the modules found in each plugin folder and
+whether the folder's requirements are met, keyed by the modification
+times of the folder and its plugins.txt and requirements.txt files,
+and of the site-packages folders for the requirements.  Unchanged
+plugin folders are then added without listing the folder, finding
+each module, or importing the required packages.
+
+The time taken to import and register each plugin module is kept,
+and can be shown with PluginRegistry.report().
+"""
+import os
+import sys
+import imp
+import json
+import time
+from collections import OrderedDict
+
+# increment when the format of the manifest file changes
+MANIFEST_VERSION = 2
+
+def _mtime(fname):
+    try:
+        return os.stat(fname).st_mtime
+    except OSError:
+        return None
+
+class LazySymbol(object):
+    """placeholder for a symbol of a plugin module that has not been
+    imported yet: the module is imported when the symbol is called,
+    or looked up by name with SymbolTable.get_symbol()"""
+    def __init__(self, plugin, name):
+        self._plugin = plugin
+        self._name = name
+
+    def resolve(self):
+        "import plugin module, and return the real symbol"
+        self._plugin.load()
+        try:
+            return self._plugin.symbols[self._name]
+        except KeyError:
+            raise NameError("plugin '%s' does not define '%s'" %
+                            (self._plugin.modpath, self._name))
+
+    def __call__(self, *args, **kws):
+        return self.resolve()(*args, **kws)
+
+    def __getattr__(self, attr):
+        if attr.startswith('__') or attr in ('_plugin', '_name'):
+            raise AttributeError(attr)
+        return getattr(self.resolve(), attr)
+
+    @property
+    def __doc__(self):
+        return self.resolve().__doc__
+
+    def __repr__(self):
+        return "<function %s, file=%s (not imported)>" % (self._name,
+                                                          self._plugin.modpath)
+    __str__ = __repr__
+
+class LazyPlugin(object):
+    """plugin module registered from the manifest, imported on
+    first use of one of its symbols"""
+    def __init__(self, registry, name, modpath, desc, group, names):
+        self.registry = registry
+        self.name = name
+        self.modpath = modpath
+        self.desc = desc
+        self.group = group
+        self.names = names
+        self.symbols = None
+
+    def register(self):
+        "add group and placeholder symbols to symbol table"
+        symtable = self.registry.symtable
+        if self.group is None:
+            return
+        if not symtable.has_group(self.group):
+            symtable.new_group(self.group)
+        if self.group not in symtable._sys.searchGroups:
+            symtable._sys.searchGroups.append(self.group)
+        symtable._fix_searchGroups(force=True)
+        for key in self.names:
+            symtable.set_symbol("%s.%s" % (self.group, key),
+                                LazySymbol(self, key))
+
+    def load(self):
+        """import plugin module, replacing its placeholder symbols
+        that have not been changed since they were registered"""
+        if self.symbols is not None:
+            return
+        symtable = self.registry.symtable
+        t0 = time.time()
+        try:
+            with open(self.modpath, self.desc[1]) as fh:
+                module = imp.load_module(self.name, fh, self.modpath,
+                                         self.desc)
+            groupname, syms = module.registerLarchPlugin()
+        except Exception:
+            # import the module at the next startup, to report the error
+            self.registry.manifest.remove(self.modpath)
+            self.registry.save()
+            self.registry.add_profile(self.modpath, self.name, self.group,
+                                      'failed', time.time()-t0, 0.0)
+            exc = sys.exc_info()[1]
+            raise ImportError("cannot import plugin '%s': %s: %s" %
+                              (self.modpath, exc.__class__.__name__, exc))
+        t1 = time.time()
+        group = symtable.get_group(groupname)
+        symbols = {}
+        for key, val in syms.items():
+            val = symtable.plugin_symbol(key, val)
+            current = getattr(group, key, None)
+            if current is None or (isinstance(current, LazySymbol) and
+                                   current._plugin is self):
+                symtable.set_symbol("%s.%s" % (groupname, key), val)
+            symbols[key] = val
+        self.symbols = symbols
+        self.registry.add_profile(self.modpath, self.name, groupname,
+                                  'loaded', t1-t0, time.time()-t1)
+
+class PluginManifest(object):
+    """names registered by plugin modules, saved to a manifest file
+
+    Parameters
+    ----------
+    filename :  name of manifest file, or None to not save [None]
+    """
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.entries = {}
+        self.packages = {}
+        self.changed = False
+        self._sitekey = None
+        self.read()
+
+    def _header(self):
+        return {'version': MANIFEST_VERSION, 'python': sys.version,
+                'executable': sys.executable}
+
+    def _filekey(self, modpath):
+        stat = os.stat(modpath)
+        return [stat.st_mtime, stat.st_size]
+
+    def _pkgkey(self, pkgpath, files):
+        return [_mtime(os.path.join(pkgpath, f)) for f in ('',) + files]
+
+    def _site(self):
+        "mtimes of site-packages folders, changed as packages are installed"
+        if self._sitekey is None:
+            self._sitekey = [[dname, _mtime(dname)] for dname in sys.path
+                             if os.path.basename(dname) in ('site-packages',
+                                                            'dist-packages')]
+        return self._sitekey
+
+    def read(self):
+        "read manifest file, ignoring manifests from other Pythons"
+        if self.filename is None:
+            return
+        try:
+            with open(self.filename, 'r') as fh:
+                manifest = json.load(fh)
+        except Exception:
+            return
+        if (isinstance(manifest, dict) and
+            manifest.get('header', None) == self._header()):
+            self.entries = manifest.get('modules', {})
+            self.packages = manifest.get('packages', {})
+
+    def save(self):
+        "save manifest file, if changed.  Returns whether it was written"
+        if self.filename is None or not self.changed:
+            return False
+        try:
+            dirname = os.path.dirname(self.filename)
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+            tmpfile = '%s.%i' % (self.filename, os.getpid())
+            with open(tmpfile, 'w') as fh:
+                json.dump({'header': self._header(),
+                           'modules': self.entries,
+                           'packages': self.packages}, fh,
+                          indent=1, sort_keys=True)
+            getattr(os, 'replace', os.rename)(tmpfile, self.filename)
+        except Exception:
+            return False
+        self.changed = False
+        return True
+
+    def get(self, modpath):
+        "entry for plugin module, or None if not known or changed"
+        entry = self.entries.get(modpath, None)
+        try:
+            if entry is None or entry['key'] != self._filekey(modpath):
+                return None
+        except (OSError, KeyError, TypeError):
+            return None
+        return entry
+
+    def put(self, modpath, module, registered):
+        """save entry for plugin module, from the module and the
+        (groupname, symbols) it registered, or None"""
+        lazy = not (hasattr(module, 'initializeLarchPlugin') or
+                    hasattr(module, 'registerLarchGroups'))
+        group, names = None, []
+        if registered is not None:
+            group, syms = registered
+            names = sorted(syms.keys())
+            lazy = lazy and all(callable(v) for v in syms.values())
+        try:
+            key = self._filekey(modpath)
+        except OSError:
+            return
+        self.entries[modpath] = {'key': key, 'group': group,
+                                 'names': names, 'lazy': lazy}
+        self.changed = True
+
+    def remove(self, modpath):
+        "remove entry for plugin module"
+        if self.entries.pop(modpath, None) is not None:
+            self.changed = True
+
+    def get_package(self, pkgpath, files=(), reqfile=None):
+        """modules found in plugin folder, as (requirements_ok, modules),
+        or None if not known or changed.
+
+        files are the names of files in the folder that change the
+        modules found, and reqfile the name of the requirements file.
+        modules is a list of (filename, modpath, desc) as found with
+        imp.find_module(), with desc None for sub-packages, and modpath
+        and desc None for files that were not found"""
+        entry = self.packages.get(pkgpath, None)
+        try:
+            if (entry is None or
+                entry['key'] != self._pkgkey(pkgpath, files + (reqfile,))):
+                return None
+            if entry['key'][-1] is not None and entry['site'] != self._site():
+                return None
+            modules = [(fname, modpath, tuple(desc) if desc else None)
+                       for fname, modpath, desc in entry['modules']]
+        except (KeyError, TypeError, ValueError):
+            return None
+        return entry['requirements'], modules
+
+    def put_package(self, pkgpath, requirements_ok, modules,
+                    files=(), reqfile=None):
+        "save entry for plugin folder, with arguments as for get_package()"
+        self.packages[pkgpath] = {'key': self._pkgkey(pkgpath,
+                                                      files + (reqfile,)),
+                                  'site': self._site(),
+                                  'requirements': requirements_ok,
+                                  'modules': [list(m) for m in modules]}
+        self.changed = True
+
+class PluginRegistry(object):
+    """plugin modules added to a symbol table, lazily imported
+    when found in the plugin manifest
+
+    Parameters
+    ----------
+    symtable :  symbol table for plugin symbols
+    manifest :  name of plugin manifest file, or None [None]
+    """
+    def __init__(self, symtable, manifest=None):
+        self.symtable = symtable
+        self.manifest = PluginManifest(manifest)
+        self.lazy_plugins = {}
+        self.profile = OrderedDict()
+
+    def add_profile(self, modpath, name, group, mode, t_import, t_register):
+        "record how a plugin module was added, and the time taken"
+        self.profile[modpath] = {'name': name, 'group': group, 'mode': mode,
+                                 'import': t_import, 'register': t_register}
+
+    def load_module(self, name, fh, modpath, desc, on_error, **kws):
+        """import plugin module and add its symbols, saving the
+        registered names to the manifest.  fh is the open module file,
+        or None to open modpath.  Returns (groupname, symbols) as from
+        SymbolTable.add_plugin()"""
+        t0 = time.time()
+        if fh is None:
+            with open(modpath, desc[1]) as fh:
+                module = imp.load_module(name, fh, modpath, desc)
+        else:
+            module = imp.load_module(name, fh, modpath, desc)
+        t1 = time.time()
+        ret = self.symtable.add_plugin(module, on_error, **kws)
+        group = None if ret is None else ret[0]
+        self.add_profile(modpath, name, group, 'imported', t1-t0, time.time()-t1)
+        self.manifest.put(modpath, module, ret)
+        return ret
+
+    def add_lazy(self, name, modpath, desc):
+        """add plugin module without importing it, if it is
+        found in the manifest.  Returns whether it was added"""
+        entry = self.manifest.get(modpath)
+        if entry is None or not entry['lazy']:
+            return False
+        t0 = time.time()
+        plugin = LazyPlugin(self, name, modpath, desc,
+                            entry['group'], entry['names'])
+        plugin.register()
+        self.lazy_plugins[modpath] = plugin
+        self.add_profile(modpath, name, entry['group'], 'lazy',
+                         0.0, time.time()-t0)
+        return True
+
+    def save(self):
+        "save plugin manifest"
+        return self.manifest.save()
+
+    def report(self):
+        "report of time to import and register plugin modules"
+        out = ["  import  register  mode      group            plugin"]
+        fmt = "%8.3f %8.3f   %-9s %-16s %s"
+        rows = sorted(self.profile.items(),
+                      key=lambda item: -item[1]['import']-item[1]['register'])
+        t_import, t_register, nlazy = 0.0, 0.0, 0
+        for modpath, prof in rows:
+            t_import += prof['import']
+            t_register += prof['register']
+            if prof['mode'] == 'lazy':
+                nlazy += 1
+            dname, fname = os.path.split(modpath)
+            out.append(fmt % (prof['import'], prof['register'], prof['mode'],
+                              prof['group'] or '', os.path.join(
+                                  os.path.basename(dname), fname)))
+        out.append(fmt % (t_import, t_register, 'total', '',
+                          '%i plugin modules, %i not imported' %
+                          (len(rows), nlazy)))
+        return '\n'.join(out)
@@ -31,7 +31,8 @@ except ImportError:
 class shell(cmd.Cmd):
     def __init__(self,  completekey='tab', debug=False, quiet=False,
                  stdin=None, stdout=None, banner_msg=None,
-                 maxhist=5000, with_wx=False, with_plugins=True):
+                 maxhist=5000, with_wx=False, with_plugins=True,
+                 use_compiler=False, lazy_plugins=False):
 
         with_wx = HAS_WXPYTHON and with_wx
 
@@ -57,7 +58,9 @@ class shell(cmd.Cmd):
 
         self.larch = Interpreter(with_plugins=with_plugins,
                                  historyfile=history_file,
-                                 maxhistory=maxhist)
+                                 maxhistory=maxhist,
+                                 use_compiler=use_compiler,
+                                 lazy_plugins=lazy_plugins)
         self.larch.writer = StdWriter(_larch=self.larch)
 
         if with_wx:
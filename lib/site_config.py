@@ -85,6 +85,16 @@ if 'LARCHSTARTUP' in os.environ:
 # history file:
 history_file = pjoin(usr_larchdir, 'history.lar')
 
+# cache of parsed larch files, see parsecache.py
+parsecache_dir = pjoin(usr_larchdir, 'parsecache')
+
+# names registered by plugin modules, see pluginregistry.py
+plugin_manifest = pjoin(usr_larchdir, 'plugin_manifest.json')
+
+# import plugin modules on first use of their symbols, as with
+# Interpreter(lazy_plugins=True)
+lazy_plugins = os.environ.get('LARCHLAZYPLUGINS', '0') not in ('', '0')
+
 def make_user_larchdirs():
     """create user's larch directories"""
     files = {'init.lar':             'put custom startup larch commands:',
@@ -94,7 +104,8 @@ def make_user_larchdirs():
     subdirs = {'matplotlib': 'matplotlib may put files here',
                'dlls':       'put dlls here',
                'modules':    'put custom larch or python modules here',
-               'plugins':    'put custom larch plugins here'}
+               'plugins':    'put custom larch plugins here',
+               'parsecache': 'cache of parsed larch files, safe to delete'}
 
     def make_dir(dname):
         if not exists(dname):
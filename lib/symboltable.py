@@ -8,8 +8,16 @@ import sys
 import types
 import numpy
 import copy
+from itertools import count
 from .utils import Closure, fixName, isValidName
 from . import site_config
+from .pluginregistry import LazySymbol
+
+# stamps for attribute names of Groups: a new stamp is taken each time
+# an attribute of that name is added to or deleted from any Group, so
+# that the SymbolTable can tell when a cached name lookup is out of date.
+_name_stamps = {}
+_next_stamp = count(1)
 
 class Group(object):
     """
@@ -24,6 +32,15 @@ class Group(object):
         for key, val in kws.items():
             setattr(self, key, val)
 
+    def __setattr__(self, name, value):
+        if name not in self.__dict__:
+            _name_stamps[name] = next(_next_stamp)
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        object.__delattr__(self, name)
+        _name_stamps[name] = next(_next_stamp)
+
     def __len__(self):
         return max(1, len(dir(self))-1)
 
@@ -126,11 +143,18 @@ class SymbolTable(Group):
                 'has_symbol', 'has_group', 'get_group',
                 'create_group', 'new_group', 'isgroup',
                 'get_symbol', 'set_symbol',  'del_symbol',
-                'get_parent', 'add_plugin', '_path', '__parents')
+                'get_parent', 'add_plugin', 'plugin_symbol', '_path',
+                '__parents')
 
     def __init__(self, larch=None):
         Group.__init__(self, name=self.top_group)
         self._larch = larch
+        # name index: for the search groups after the local group,
+        # maps names to the group holding them, with the name stamp
+        self.__indexes = {}
+        self.__frame = (None, (), None)
+        self.__validnames = set()
+        self.__parents = []
         self._sys = None
         setattr(self, self.top_group, self)
 
@@ -224,10 +248,11 @@ class SymbolTable(Group):
         cache = sys.__cache__
         if len(cache) < 4:
             cache = [None]*4
-        if (sys.localGroup   == cache[0] and
-            sys.moduleGroup  == cache[1] and
-            sys.searchGroups == cache[2] and
-            cache[3] is not None and not force):
+        if (cache[3] is not None and not force and
+            sys.localGroup   is cache[0] and
+            sys.moduleGroup  is cache[1] and
+            (sys.searchGroups is cache[2] or
+             sys.searchGroups == cache[2])):
             return cache[3]
 
         if sys.moduleGroup is None:
@@ -271,10 +296,34 @@ class SymbolTable(Group):
                 sgroups.append(grp)
                 snames.append(name)
 
+        if self not in sgroups:
+            sgroups.append(self)
         self._sys.searchGroups = cache[2] = snames[:]
         sys.searchGroupObjects = cache[3] = sgroups[:]
+        self._set_index(sys.searchGroupObjects)
         return sys.searchGroupObjects
 
+    def _set_index(self, searchGroups):
+        """set name index for list of search groups: the local group
+        is searched first, and the index is shared by frames with the
+        same groups after the local group, as for procedure calls"""
+        head, tail = None, tuple(searchGroups)
+        lgroup = self._sys.localGroup
+        if (len(tail) > 1 and tail[0] is lgroup and
+            lgroup is not self._sys.moduleGroup):
+            head, tail = tail[0], tail[1:]
+        if tail not in self.__indexes:
+            if len(self.__indexes) > 64:
+                self.__indexes.clear()
+            # only Groups tell when their attributes change
+            index = None
+            if all(isinstance(grp, Group) and
+                   getattr(grp.__class__, '__getattr__', None) is None
+                   for grp in tail):
+                index = {}
+            self.__indexes[tail] = index
+        self.__frame = (head, tail, self.__indexes[tail])
+
     def get_parentpath(self, sym):
         """ get parent path for a symbol"""
         obj = self._lookup(sym)
@@ -294,21 +343,34 @@ class SymbolTable(Group):
         debug = False # not ('force'in name)
         if debug:  print( '====\nLOOKUP ', name)
         searchGroups = self._fix_searchGroups()
-        self.__parents = []
-        if self not in searchGroups:
-            searchGroups.append(self)
+        parents = self.__parents
+        del parents[:]
+
+        # simple names: local group, then name index for other groups
+        if '.' not in name:
+            private = self._private
+            head, tail, index = self.__frame
+            if (head is not None and hasattr(head, name) and
+                not (head is self and name in private)):
+                parents.append(head)
+                return getattr(head, name)
+            if index is not None:
+                grp, stamp = index.get(name, (None, None))
+                if grp is not None and stamp == _name_stamps.get(name, 0):
+                    parents.append(grp)
+                    return getattr(grp, name)
+            for grp in tail:
+                if hasattr(grp, name) and not (grp is self and name in private):
+                    parents.append(grp)
+                    if index is not None:
+                        index[name] = (grp, _name_stamps.get(name, 0))
+                    return getattr(grp, name)
 
         def public_attr(grp, name):
             return (hasattr(grp, name)  and
                     not (grp is self and name in self._private))
 
         parts = name.split('.')
-        if len(parts) == 1:
-            for grp in searchGroups:
-                if public_attr(grp, name):
-                    self.__parents.append(grp)
-                    return getattr(grp, name)
-
         # more complex case: not immediately found in Local or Module Group
         parts.reverse()
         top   = parts.pop()
@@ -343,7 +405,7 @@ class SymbolTable(Group):
 
     def has_symbol(self, symname):
         try:
-            g = self.get_symbol(symname)
+            g = self._lookup(symname)
             return True
         except (LookupError, NameError, ValueError):
             return False
@@ -380,7 +442,10 @@ class SymbolTable(Group):
 
     def get_symbol(self, sym, create=False):
         "lookup and return a symbol by name"
-        return self._lookup(sym, create=create)
+        out = self._lookup(sym, create=create)
+        if isinstance(out, LazySymbol):
+            out = out.resolve()
+        return out
 
     def set_symbol(self, name, value=None, group=None):
         "set a symbol in the table"
@@ -390,8 +455,12 @@ class SymbolTable(Group):
         names = []
 
         for n in name.split('.'):
-            if not isValidName(n):
-                raise SyntaxError("invalid symbol name '%s'" % n)
+            if n not in self.__validnames:
+                if not isValidName(n):
+                    raise SyntaxError("invalid symbol name '%s'" % n)
+                if len(self.__validnames) > 10000:
+                    self.__validnames.clear()
+                self.__validnames.add(n)
             names.append(n)
 
         child = names.pop()
@@ -491,15 +560,7 @@ class SymbolTable(Group):
         self._fix_searchGroups(force=True)
 
         for key, val in syms.items():
-            if hasattr(val, '__call__'):
-                # test whether plugin func has a '_larch' kw arg
-                #    __code__.co_flags & 8 == 'uses **kws'
-                kws.update({'func': val, '_name':key})
-                nvars = val.__code__.co_argcount
-                if ((val.__code__.co_flags &8 != 0) or
-                    '_larch' in val.__code__.co_varnames[:nvars]):
-                    kws.update({'_larch':  self._larch})
-                val = Closure(**kws)
+            val = self.plugin_symbol(key, val, **kws)
             self.set_symbol("%s.%s" % (groupname, key), val)
 
         plugin_init = getattr(plugin, 'initializeLarchPlugin', None)
@@ -507,6 +568,20 @@ class SymbolTable(Group):
             plugin_init(_larch=self._larch)
         return (groupname, syms)
 
+    def plugin_symbol(self, name, val, **kws):
+        """value of plugin symbol: functions are wrapped in a Closure,
+        given _larch if they accept it"""
+        if hasattr(val, '__call__'):
+            # test whether plugin func has a '_larch' kw arg
+            #    __code__.co_flags & 8 == 'uses **kws'
+            kws.update({'func': val, '_name':name})
+            nvars = val.__code__.co_argcount
+            if ((val.__code__.co_flags &8 != 0) or
+                '_larch' in val.__code__.co_varnames[:nvars]):
+                kws.update({'_larch':  self._larch})
+            val = Closure(**kws)
+        return val
+
     def show_group(self, groupname):
         """display group members --- simple version for tests"""
         out = []
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+"""
+dictionary with a maximum size, dropping least recently used items
+"""
+from collections import OrderedDict
+
+class LRUCache(OrderedDict):
+    """dictionary holding at most maxsize items, removing the least
+    recently used item when full.  get() marks an item as used."""
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        OrderedDict.__init__(self)
+
+    def get(self, key, default=None):
+        try:
+            val = self.pop(key)
+        except KeyError:
+            return default
+        OrderedDict.__setitem__(self, key, val)
+        return val
+
+    def __setitem__(self, key, val):
+        if key in self:
+            self.pop(key)
+        OrderedDict.__setitem__(self, key, val)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
@@ -63,15 +63,19 @@ def deriv(arr):
 deriv.__doc__ = np.gradient.__doc__
 
 def realimag(arr):
-    "return real array of real/imag pairs from complex array"
-    return np.array([(i.real, i.imag) for i in arr]).flatten()
+    """return real array of real/imag pairs from complex array
+
+    for an n-d array, pairs are made along the last axis"""
+    arr = np.asarray(arr)
+    out = np.stack((arr.real, arr.imag), axis=-1)
+    return out.reshape(arr.shape[:-1] + (2*arr.shape[-1],))
 
 def complex_phase(arr):
-    "return phase, modulo 2pi jumps"
+    "return phase, modulo 2pi jumps, along last axis"
     phase = np.arctan2(arr.imag, arr.real)
-    d   = np.diff(phase)/np.pi
+    d   = np.diff(phase, axis=-1)/np.pi
     out = 1.0*phase[:]
-    out[1:] -= np.pi*(np.round(abs(d))*np.sign(d)).cumsum()
+    out[..., 1:] -= np.pi*(np.round(abs(d))*np.sign(d)).cumsum(axis=-1)
     return out
 
 def interp1d(x, y, xnew, kind='linear', fill_value=np.nan, **kws):
@@ -77,10 +77,10 @@ def get_next_port(host='localhost', port=4966, nmax=100):
 class LarchServer(SimpleXMLRPCServer):
     def __init__(self, host='localhost', port=4966,
                  logRequests=False, allow_none=True,
-                 keepalive_time=3*24*3600):
+                 keepalive_time=3*24*3600, lazy_plugins=True):
         self.out_buffer = []
 
-        self.larch = Interpreter(writer=self)
+        self.larch = Interpreter(writer=self, lazy_plugins=lazy_plugins)
         self.larch.input.prompt = ''
         self.larch.input.prompt2 = ''
         self.larch.run_init_scripts()
@@ -55,7 +55,6 @@ except:
 
 #import h5py
 import numpy as np
-import scipy.stats as stats
 
 #from matplotlib.widgets import Slider, Button, RadioButtons
 
@@ -76,7 +75,8 @@ from larch_plugins.diFFit import diFFit1DFrame,diFFit2DFrame
 from larch_plugins.xrd import lambda_from_E,E_from_lambda,xrd1d,save1D
 from larch_plugins.epics import pv_fullname
 from larch_plugins.io import nativepath
-from larch_plugins.xrmmap import GSEXRM_MapFile, GSEXRM_FileStatus, h5str
+from larch_plugins.xrmmap import (GSEXRM_MapFile, GSEXRM_FileStatus, h5str,
+                                  isGSEXRM_MapFolder)
 
 
 CEN = wx.ALIGN_CENTER|wx.ALIGN_CENTER_VERTICAL
@@ -476,17 +476,26 @@ class SimpleMapPanel(GridPanel):
             det = int(det)
         dtcorrect = self.cor.IsChecked()
         no_hotcols  = suppress_hotcols(self.hotcols, datafile)
+        # all ROI maps for detector are read once, for both maps
+        names, corr = datafile.get_roi_correlations(det=det, dtcorrect=dtcorrect,
+                                                    no_hotcols=no_hotcols)
         map1 = datafile.get_roimap(roiname1, det=det, no_hotcols=no_hotcols,
                                    dtcorrect=dtcorrect)
         map2 = datafile.get_roimap(roiname2, det=det, no_hotcols=no_hotcols,
                                    dtcorrect=dtcorrect)
+        rcorr = ''
+        names = [n.lower() for n in names]
+        if roiname1.lower() in names and roiname2.lower() in names:
+            rcorr = ' (r=%.3f)' % corr[names.index(roiname1.lower()),
+                                       names.index(roiname2.lower())]
 
         x = datafile.get_pos(0, mean=True)
         y = datafile.get_pos(1, mean=True)
 
         # try to use correlation plot from wxmplot 0.9.23 and later
         if CorrelatedMapFrame is not None:
-            title="%s: %s vs %s" %(datafile.filename, roiname1, roiname2)
+            title="%s: %s vs %s%s" %(datafile.filename, roiname1, roiname2,
+                                     rcorr)
             correl_plot = CorrelatedMapFrame(parent=self.owner, xrmfile=datafile)
             correl_plot.display(map1, map2, name1=roiname1, name2=roiname2,
                                 x=x, y=y, title=title)
@@ -991,70 +1000,21 @@ class MapAreaPanel(scrolled.ScrolledPanel):
         self.report_data = []
         areaname  = self._getarea()
         xrmfile  = self.owner.current_file
-        xrmmap  = xrmfile.xrmmap
-        area = xrmfile.get_area(name=areaname)
-        amask = area.value
-        if 'roistats' in area.attrs:
-           for dat in json.loads(area.attrs['roistats']):
-               dat = tuple(dat)
-               self.report_data.append(dat)
-               self.report.AppendItem(dat)
-           self.choice.Enable()
-           return
-
-        d_addrs = [d.lower() for d in xrmmap['roimap/det_address']]
-        d_names = [d for d in xrmmap['roimap/det_name']]
-
-        # count times
-        ctime = xrmmap['roimap/det_raw'][:,:,0]
-        if amask.shape[1] == ctime.shape[1] - 2: # hotcols
-            ctime = ctime[:,1:-1]
-
-        ctime = [1.e-6*ctime[amask]]
-        for i in range(xrmmap.attrs['N_Detectors']):
-            tname = 'det%i/realtime' % (i+1)
-            rtime = xrmmap[tname].value
-            if amask.shape[1] == rtime.shape[1] - 2: # hotcols
-                rtime = rtime[:,1:-1]
-            ctime.append(1.e-6*rtime[amask])
-
-        for idet, dname in enumerate(d_names):
-            daddr = d_addrs[idet]
-            det = 0
-            if 'mca' in daddr:
-                det = 1
-                words = daddr.split('mca')
-                if len(words) > 1:
-                    det = int(words[1].split('.')[0])
-            if idet == 0:
-                d = 1.e3*ctime[0]
-            else:
-                d = xrmmap['roimap/det_raw'][:,:,idet]
-                if amask.shape[1] == d.shape[1] - 2: # hotcols
-                    d = d[:,1:-1]
-                d = d[amask]/ctime[det]
-
-            try:
-                hmean, gmean = stats.gmean(d), stats.hmean(d)
-                skew, kurtosis = stats.skew(d), stats.kurtosis(d)
-            except ValueError:
-                hmean, gmean, skew, kurtosis = 0, 0, 0, 0
 
+        fmt = '{:,.1f}'.format # use thousands commas, 1 decimal place
+        roistats = xrmfile.get_area_stats(name=areaname)
+        for idet, rstat in enumerate(roistats):
+            dname, npts, mean, std, median, mode, dmin, dmax = rstat[:8]
+            scale = 1.0
+            if idet == 0:  # count time in ms
+                scale = 1.e3
             smode = '--'
-            fmt = '{:,.1f}'.format # use thousands commas, 1 decimal place
-            mode = stats.mode(d)
-            if len(mode) > 0:
-                mode = mode[0]
-                if len(mode) > 0:
-                    smode = fmt(mode[0])
-            dat = (dname, fmt(d.min()), fmt(d.max()), fmt(d.mean()),
-                   fmt(d.std()), fmt(np.median(d)), smode)
+            if npts > 0:
+                smode = fmt(scale*mode)
+            dat = (dname, fmt(scale*dmin), fmt(scale*dmax), fmt(scale*mean),
+                   fmt(scale*std), fmt(scale*median), smode)
             self.report_data.append(dat)
             self.report.AppendItem(dat)
-        if False and 'roistats' not in area.attrs:
-           area.attrs['roistats'] = json.dumps(self.report_data)
-           xrmfile.h5root.flush()
-
         self.choice.Enable()
 
     def update_xrmmap(self, xrmmap):
@@ -1163,8 +1123,6 @@ class MapAreaPanel(scrolled.ScrolledPanel):
         self.desc.SetValue(area.attrs.get('description', aname))
         self.report.DeleteAllItems()
         self.report_data = []
-        if 'roistats' in area.attrs:
-           self.show_stats()
 
     def onShowStats(self, event=None):
         if self.report is None:
@@ -1369,8 +1327,8 @@ class MapViewerFrame(wx.Frame):
         self.xrddisplay2D = None
 
         self.watch_files = False
-        self.file_timer = wx.Timer(self)
-        self.Bind(wx.EVT_TIMER, self.onFileWatchTimer, self.file_timer)
+        self.file_watchers = {}
+        self.rows_ready = {}
         self.files_in_progress = []
         self.no_hotcols = True
         self.SetTitle('GSE XRM MapViewer')
@@ -1817,6 +1775,7 @@ class MapViewerFrame(wx.Frame):
             return
 
         save_workdir('gsemap.dat')
+        self.stop_watching()
         for xrmfile in self.filemap.values():
             xrmfile.close()
 
@@ -1933,6 +1892,8 @@ class MapViewerFrame(wx.Frame):
             self.filelist.Append(fname)
         if self.check_ownership(fname):
             self.process_file(fname)
+        if self.watch_files:
+            self.start_watching(fname)
         self.ShowFile(filename=fname)
         if parent is not None and len(parent) > 0:
             os.chdir(nativepath(parent))
@@ -1971,21 +1932,41 @@ class MapViewerFrame(wx.Frame):
     def onWatchFiles(self, event=None):
         self.watch_files = event.IsChecked()
         if not self.watch_files:
-            self.file_timer.Stop()
+            self.stop_watching()
             self.message('Watching Files/Folders for Changes: Off')
         else:
-            self.file_timer.Start(10000)
+            for filename in self.filemap:
+                self.start_watching(filename)
             self.message('Watching Files/Folders for Changes: On')
 
-
-    def onFileWatchTimer(self, event=None):
-        for filename in self.filemap:
-            if (filename not in self.files_in_progress and
-                self.filemap[filename].folder_has_newdata()):
-                self.process_file(filename)
-                thispanel = self.nbpanels[self.nb.GetSelection()]
-                thispanel.onShowMap(event=None, new=False)
-                # print('Processed File ', thispanel)
+    def start_watching(self, filename):
+        """watch raw folder of a map file, processing rows as they
+        are completed"""
+        xrm_map = self.filemap[filename]
+        if (filename in self.file_watchers or
+            not isGSEXRM_MapFolder(xrm_map.folder)):
+            return
+        self.rows_ready[filename] = xrm_map.last_row + 1
+        self.file_watchers[filename] = xrm_map.watch_folder(
+            callback=partial(self.onRowReady, filename=filename))
+
+    def stop_watching(self):
+        for watcher in self.file_watchers.values():
+            watcher.stop()
+        self.file_watchers = {}
+        self.rows_ready = {}
+
+    def onRowReady(self, row=None, filename=None, **kws):
+        "called from folder watcher thread as each row is completed"
+        wx.CallAfter(self.onNewRows, filename, row+1)
+
+    def onNewRows(self, filename, nrows):
+        if filename not in self.file_watchers:
+            return
+        self.rows_ready[filename] = max(nrows, self.rows_ready[filename])
+        if (self.h5convert_done and filename not in self.files_in_progress
+            and self.check_ownership(filename)):
+            self.process_file(filename)
 
     def process_file(self, filename):
         """Request processing of map file.
@@ -1999,7 +1980,11 @@ class MapViewerFrame(wx.Frame):
         if xrm_map.dimension is None and isGSEXRM_MapFolder(self.folder):
             xrm_map.read_master()
 
-        if self.filemap[filename].folder_has_newdata():
+        newdata = xrm_map.folder_has_newdata()
+        if newdata and filename in self.rows_ready:
+            # only rows the folder watcher has seen completed
+            newdata = self.rows_ready[filename] > xrm_map.last_row + 1
+        if newdata:
             self.files_in_progress.append(filename)
             self.h5convert_fname = filename
             self.h5convert_done = False
@@ -2021,6 +2006,18 @@ class MapViewerFrame(wx.Frame):
                 self.files_in_progress.remove(fname)
             self.message('MapViewerTimer Processing %s: complete!' % fname)
             self.ShowFile(filename=self.h5convert_fname)
+            if fname in self.file_watchers:
+                thispanel = self.nbpanels[self.nb.GetSelection()]
+                thispanel.onShowMap(event=None, new=False)
+            # rows completed while this file was being processed
+            # were not processed by onNewRows()
+            for filename, nrows in list(self.rows_ready.items()):
+                if (filename in self.filemap and
+                    nrows > self.filemap[filename].last_row + 1 and
+                    self.check_ownership(filename)):
+                    self.process_file(filename)
+                    if not self.h5convert_done:
+                        break
 
 ## This routine is almost identical to 'process()' in xrmmap/xrm_mapfile.py ,
 ## however 'new_mapdata()' updates messages in mapviewer.py window!!
@@ -2030,6 +2027,9 @@ class MapViewerFrame(wx.Frame):
 
         xrm_map = self.filemap[filename]
         nrows = len(xrm_map.rowdata)
+        if filename in self.rows_ready:
+            # only rows the folder watcher has seen completed
+            nrows = min(nrows, self.rows_ready[filename])
         self.h5convert_nrow = nrows
         self.h5convert_done = False
         if xrm_map.folder_has_newdata():
@@ -1,10 +1,11 @@
 from .xafsutils import KTOE, ETOK, set_xafsGroup
 
-from .xafsft import xftf, xftr, xftf_fast, xftr_fast, ftwindow
+from .xafsft import (xftf, xftr, xftf_fast, xftr_fast, xftf_batch,
+                     xftr_batch, ftwindow, FTContext)
 
 from .pre_edge import pre_edge, preedge, find_e0
 
-from .feffdat import FeffPathGroup, FeffDatFile, _ff2chi
+from .feffdat import FeffPathGroup, FeffDatFile, FeffPathStack, _ff2chi
 
 from .feffit import FeffitDataSet, TransformGroup, feffit
 
@@ -32,75 +32,73 @@ def spline_eval(kraw, mu, knots, coefs, order, kout):
     chi = UnivariateSpline(kraw, (mu-bkg), s=0)(kout)
     return bkg, chi
 
-def __resid(pars, ncoefs=1, knots=None, order=3, irbkg=1, nfft=2048,
-            kraw=None, mu=None, kout=None, ftwin=1, kweight=1, chi_std=None,
-            nclamp=0, clamp_lo=1, clamp_hi=1, **kws):
-
-    # coefs = [getattr(pars, FMT_COEF % i) for i in range(ncoefs)]
-    coefs = [pars[FMT_COEF % i].value for i in range(ncoefs)]
-    bkg, chi = spline_eval(kraw, mu, knots, coefs, order, kout)
-    if chi_std is not None:
-        chi = chi - chi_std
-    out =  realimag(xftf_fast(chi*ftwin, nfft=nfft)[:irbkg])
+def spline_basis(kraw, knots, order, kout):
+    """B-spline basis matrices for the background spline
+
+    Returns bkg_basis (len(kraw), ncoefs) and chi_basis (len(kout), ncoefs)
+    such that, for spline coefficients coefs,
+        bkg = bkg_basis.dot(coefs)
+        chi = UnivariateSpline(kraw, mu, s=0)(kout) - chi_basis.dot(coefs)
+    give the same bkg and chi as spline_eval().
+    """
+    ncoefs = len(knots)
+    bkg_basis = np.zeros((len(kraw), ncoefs))
+    chi_basis = np.zeros((len(kout), ncoefs))
+    for i, unit in enumerate(np.identity(ncoefs)):
+        bkg_basis[:, i] = splev(kraw, [knots, unit, order])
+        if bkg_basis[:, i].any():
+            chi_basis[:, i] = UnivariateSpline(kraw, bkg_basis[:, i],
+                                               s=0)(kout)
+    return bkg_basis, chi_basis
+
+def __resid(pars, ncoefs=1, ftchi=None, ftbasis=None, clampchi=None,
+            clampbasis=None, nclamp=0, clamp_lo=1, clamp_hi=1, **kws):
+    """autobk residual: the low-R part of the FT of chi(k), and the
+    (scaled) end-points of k^kweight*chi(k) for the spline clamps.
+
+    As chi(k) is linear in the spline coefficients, this uses the
+    precomputed FTs of chi(k) and of the spline basis from _autobk_basis().
+    """
+    coefs = np.array([pars[FMT_COEF % i].value for i in range(ncoefs)])
+    out = ftchi - ftbasis.dot(coefs)
     if nclamp == 0:
         return out
     # spline clamps:
     scale = (1.0 + 100*(out*out).sum())/(len(out)*nclamp)
-    scaled_chik = scale * chi * kout**kweight
+    scaled_chik = scale * (clampchi - clampbasis.dot(coefs))
     return np.concatenate((out,
                            abs(clamp_lo)*scaled_chik[:nclamp],
                            abs(clamp_hi)*scaled_chik[-nclamp:]))
 
-@ValidateLarchPlugin
-@Make_CallArgs(["energy" ,"mu"])
-def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
-           edge_step=None, kmin=0, kmax=None, kweight=1, dk=0.1,
-           win='hanning', k_std=None, chi_std=None, nfft=2048, kstep=0.05,
-           pre_edge_kws=None, nclamp=4, clamp_lo=1, clamp_hi=1,
-           calc_uncertainties=True, err_sigma=1, _larch=None, **kws):
-    """Use Autobk algorithm to remove XAFS background
-
-    Parameters:
-    -----------
-      energy:    1-d array of x-ray energies, in eV, or group
-      mu:        1-d array of mu(E)
-      group:     output group (and input group for e0 and edge_step).
-      rbkg:      distance (in Ang) for chi(R) above
-                 which the signal is ignored. Default = 1.
-      e0:        edge energy, in eV.  If None, it will be determined.
-      edge_step: edge step.  If None, it will be determined.
-      pre_edge_kws:  keyword arguments to pass to pre_edge()
-      nknots:    number of knots in spline.  If None, it will be determined.
-      kmin:      minimum k value   [0]
-      kmax:      maximum k value   [full data range].
-      kweight:   k weight for FFT.  [1]
-      dk:        FFT window window parameter.  [0.1]
-      win:       FFT window function name.     ['hanning']
-      nfft:      array size to use for FFT [2048]
-      kstep:     k step size to use for FFT [0.05]
-      k_std:     optional k array for standard chi(k).
-      chi_std:   optional chi array for standard chi(k).
-      nclamp:    number of energy end-points for clamp [2]
-      clamp_lo:  weight of low-energy clamp [1]
-      clamp_hi:  weight of high-energy clamp [1]
-      calc_uncertaintites:  Flag to calculate uncertainties in
-                            mu_0(E) and chi(k) [True]
-      err_sigma: sigma level for uncertainties in mu_0(E) and chi(k) [1]
-
-    Output arrays are written to the provided group.
-
-    Follows the 'First Argument Group' convention.
+def __jacobian(pars, ncoefs=1, nvarys=1, ftchi=None, ftbasis=None,
+               clampchi=None, clampbasis=None, nclamp=0, clamp_lo=1,
+               clamp_hi=1, **kws):
+    """analytic Jacobian of __resid() for the varied coefficients"""
+    coefs = np.array([pars[FMT_COEF % i].value for i in range(ncoefs)])
+    jac = -ftbasis[:, :nvarys]
+    if nclamp == 0:
+        return jac
+    # spline clamps, including the dependence of scale on the coefficients
+    out = ftchi - ftbasis.dot(coefs)
+    norm = len(out)*nclamp
+    scale = (1.0 + 100*(out*out).sum())/norm
+    dscale = 200*out.dot(jac)/norm
+    chik = clampchi - clampbasis.dot(coefs)
+    jac_chik = np.outer(chik, dscale) - scale*clampbasis[:, :nvarys]
+    return np.concatenate((jac,
+                           abs(clamp_lo)*jac_chik[:nclamp],
+                           abs(clamp_hi)*jac_chik[-nclamp:]))
+
+def _autobk_prep(energy, mu, group=None, rbkg=1, e0=None, edge_step=None,
+                 kmin=0, kmax=None, kweight=1, dk=0.1, win='hanning',
+                 k_std=None, chi_std=None, nfft=2048, kstep=0.05,
+                 pre_edge_kws=None, _larch=None):
+    """set up the arrays and initial spline for autobk
+
+    returns a Group holding the data ranges, k grids, FT window, and
+    initial spline knots and coefficients, or None if e0 and edge_step
+    cannot be determined.
     """
-    msg = _larch.writer.write
-    if 'kw' in kws:
-        kweight = kws.pop('kw')
-    if len(kws) > 0:
-        msg('Unrecognized a:rguments for autobk():\n')
-        msg('    %s\n' % (', '.join(kws.keys())))
-        return
-    energy, mu, group = parse_group_args(energy, members=('energy', 'mu'),
-                                         defaults=(mu,), group=group,
-                                         fcn_name='autobk')
     if len(energy.shape) > 1:
         energy = energy.squeeze()
     if len(mu.shape) > 1:
@@ -127,8 +125,7 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
         if edge_step is None:
             edge_step = group.edge_step
     if e0 is None or edge_step is None:
-        msg('autobk() could not determine e0 or edge_step!: trying running pre_edge first\n')
-        return
+        return None
 
     # get array indices for rkbg and e0: irbkg, ie0
     ie0 = index_of(energy, e0)
@@ -169,37 +166,257 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
     # coefs will be varied in fit.
     knots, coefs, order = splrep(spl_k, spl_y)
 
-    # set fit parameters from initial coefficients
+    return Group(energy=energy, mu=mu, group=group, e0=e0,
+                 edge_step=edge_step, ie0=ie0, iemax=iemax, irbkg=irbkg,
+                 kraw=kraw[:iemax-ie0+1], mue=mu[ie0:iemax+1], kout=kout,
+                 kmin=kmin, kmax=kmax, ftwin=ftwin, chi_std=chi_std,
+                 nspl=nspl, spl_y=spl_y, spl_e=spl_e, knots=knots,
+                 coefs=coefs, order=order)
+
+def _autobk_params(coefs, nspl):
+    """fit parameters for spline coefficients"""
     params = Parameters()
     for i in range(len(coefs)):
-        params.add(name = FMT_COEF % i, value=coefs[i], vary=i<len(spl_y))
-
-    initbkg, initchi = spline_eval(kraw[:iemax-ie0+1], mu[ie0:iemax+1],
-                                   knots, coefs, order, kout)
-
-    # do fit
-    result = minimize(__resid, params, method='leastsq',
-                      gtol=1.e-5, ftol=1.e-5, xtol=1.e-5, epsfcn=1.e-5,
-                      kws = dict(ncoefs=len(coefs), chi_std=chi_std,
-                                 knots=knots, order=order,
-                                 kraw=kraw[:iemax-ie0+1],
-                                 mu=mu[ie0:iemax+1], irbkg=irbkg, kout=kout,
-                                 ftwin=ftwin, kweight=kweight,
-                                 nfft=nfft, nclamp=nclamp,
-                                 clamp_lo=clamp_lo, clamp_hi=clamp_hi))
+        params.add(name = FMT_COEF % i, value=coefs[i], vary=i<nspl)
+    return params
+
+def _autobk_basis(prep, kweight=1, nfft=2048, nclamp=0):
+    """spline basis matrices for an autobk setup group, along with
+    the low-R part of the FT of the chi(k) basis, and the
+    k^kweight-scaled chi(k) basis at the clamp end-points.
+    """
+    kout, irbkg = prep.kout, prep.irbkg
+    bkg_basis, chi_basis = spline_basis(prep.kraw, prep.knots,
+                                        prep.order, kout)
+    ftbasis = realimag(xftf_fast(chi_basis.T*prep.ftwin,
+                                 nfft=nfft)[:, :irbkg]).T
+    iclamp = np.concatenate((np.arange(nclamp),
+                             np.arange(len(kout)-nclamp, len(kout))))
+    clampk = kout[iclamp]**kweight
+    return Group(bkg=bkg_basis, chi=chi_basis, ft=ftbasis, iclamp=iclamp,
+                 clampk=clampk, clamp=chi_basis[iclamp]*clampk[:, np.newaxis])
+
+def _autobk_chis(preps, nfft=2048):
+    """chi(k) of mu(E) (that is, for spline coefficients of 0) for a list
+    of autobk setup groups with the same irbkg, and the low-R parts of
+    their FTs (with any chi_std removed), transformed together.
+
+    Returns lists of chi and chi-chi_std, and a 2-d array of FTs
+    """
+    chis, chis_std = [], []
+    wchis = np.zeros((len(preps), max(len(p.kout) for p in preps)))
+    for i, p in enumerate(preps):
+        chi = UnivariateSpline(p.kraw, p.mue, s=0)(p.kout)
+        chi_std = chi if p.chi_std is None else chi - p.chi_std
+        wchis[i, :len(chi)] = chi_std*p.ftwin
+        chis.append(chi)
+        chis_std.append(chi_std)
+    ftchis = realimag(xftf_fast(wchis, nfft=nfft)[:, :preps[0].irbkg])
+    return chis, chis_std, ftchis
+
+def _autobk_fit(prep, basis, chi, ftchi, nclamp=0, clamp_lo=1, clamp_hi=1):
+    """fit spline coefficients for an autobk setup group"""
+    params = _autobk_params(prep.coefs, prep.nspl)
+    return minimize(__resid, params, method='leastsq', Dfun=__jacobian,
+                    gtol=1.e-5, ftol=1.e-5, xtol=1.e-5, epsfcn=1.e-5,
+                    kws = dict(ncoefs=len(prep.coefs), nvarys=prep.nspl,
+                               ftchi=ftchi, ftbasis=basis.ft,
+                               clampchi=chi[basis.iclamp]*basis.clampk,
+                               clampbasis=basis.clamp, nclamp=nclamp,
+                               clamp_lo=clamp_lo, clamp_hi=clamp_hi))
+
+def _stack_resid(coefs, nvarys, ftchis, ftbasis, clampchis, clampbasis,
+                 clampwts):
+    """residuals and Jacobians of __resid() and __jacobian() for a
+    stack of spectra, as arrays with a first axis of spectra.
+
+    coefs (nspec, ncoefs), ftchis (nspec, nft), ftbasis (nspec, nft, ncoefs),
+    clampchis (nspec, 2*nclamp), clampbasis (nspec, 2*nclamp, ncoefs),
+    and clampwts (2*nclamp) holds abs(clamp_lo) and abs(clamp_hi).
+    """
+    out = ftchis - np.einsum('sij,sj->si', ftbasis, coefs)
+    jac = -ftbasis[:, :, :nvarys]
+    nclamp2 = len(clampwts)
+    if nclamp2 == 0:
+        return out, jac
+    norm = out.shape[1]*nclamp2/2
+    scale = (1.0 + 100*(out*out).sum(axis=1))/norm
+    dscale = 200*np.einsum('si,siv->sv', out, jac)/norm
+    chik = clampchis - np.einsum('sij,sj->si', clampbasis, coefs)
+    jac_chik = (chik[:, :, np.newaxis]*dscale[:, np.newaxis, :] -
+                scale[:, np.newaxis, np.newaxis]*clampbasis[:, :, :nvarys])
+    resid = np.concatenate((out, clampwts*scale[:, np.newaxis]*chik), axis=1)
+    jac = np.concatenate((jac, clampwts[:, np.newaxis]*jac_chik), axis=1)
+    return resid, jac
+
+def _stack_path(coefs, nvarys, ftchis, ftbasis, clampchis, clampbasis,
+                clampwts):
+    """solutions c(q) of the linear least-squares problems
+        |ftchi - ftbasis.c|^2 + q |clampwts*(clampchi - clampbasis.c)|^2
+    for a stack of spectra, with arguments as for _stack_resid().
+
+    Setting the gradient of the autobk cost to zero shows that its
+    minimum is at c(q) for some q > 0, so that the fit is reduced to a
+    search over q.  Returns a function of q (nspec,) giving coefs.
+    """
+    ivary = np.arange(nvarys)
+    fixed = coefs[:, nvarys:]
+    fvary = ftbasis[:, :, :nvarys]
+    cvary = clampwts[:, np.newaxis]*clampbasis[:, :, :nvarys]
+    yft = ftchis - np.einsum('sij,sj->si', ftbasis[:, :, nvarys:], fixed)
+    ycl = clampwts*(clampchis - np.einsum('sij,sj->si',
+                                          clampbasis[:, :, nvarys:], fixed))
+    aft = np.einsum('sri,srj->sij', fvary, fvary)
+    acl = np.einsum('sri,srj->sij', cvary, cvary)
+    bft = np.einsum('sri,sr->si', fvary, yft)
+    bcl = np.einsum('sri,sr->si', cvary, ycl)
+
+    def path(q):
+        alpha = aft + q[:, np.newaxis, np.newaxis]*acl
+        diag = alpha[:, ivary, ivary]
+        alpha[:, ivary, ivary] = np.where(diag > 0, diag, 1.0)
+        beta = bft + q[:, np.newaxis]*bcl
+        out = coefs.copy()
+        out[:, :nvarys] = np.linalg.solve(alpha,
+                                          beta[:, :, np.newaxis])[:, :, 0]
+        return out
+    return path
+
+def _autobk_stackfit(coefs, nvarys, ftchis, ftbasis, clampchis, clampbasis,
+                     clampwts, ftol=1.e-10, xtol=1.e-10, maxiter=50):
+    """fit spline coefficients for a stack of spectra together, with
+    arguments as for _stack_resid().
+
+    The minimum for each spectrum is found with a search over q for the
+    solutions c(q) from _stack_path(): a grid search, followed by a
+    golden-section search, each step of which solves the linear problems
+    for all spectra with one call to numpy.linalg.solve().  This is
+    refined with a Levenberg-Marquardt fit of the block-diagonal problem
+    for all spectra, with a damping factor for each spectrum.
+
+    Returns a list of Groups with params, nfev, redchi, and covar,
+    as from lmfit.minimize(), for each spectrum.
+    """
+    nspec, ncoefs = coefs.shape
+    ivary = np.arange(nvarys)
+    nfev = np.zeros(nspec, dtype=int)
+    args = (ftchis, ftbasis, clampchis, clampbasis, clampwts)
+    path = _stack_path(coefs, nvarys, *args)
+
+    def qcost(logq):
+        trial = path(10**logq)
+        resid = _stack_resid(trial, nvarys, *args)[0]
+        nfev[:] += 1
+        return (resid*resid).sum(axis=1), trial
+
+    if len(clampwts) == 0:
+        coefs = path(np.zeros(nspec))
+    else:
+        # q is about the square of the clamp scale, which is at
+        # least 1/(len(ftchi)*nclamp)
+        logq0 = -2*np.log10(ftchis.shape[1]*len(clampwts)/2.0)
+        grid = logq0 + np.arange(-8, 16.01, 0.25)
+        costs = np.array([qcost(np.ones(nspec)*lq)[0] for lq in grid])
+        ibest = np.argmin(costs, axis=0)
+        lo = grid[np.maximum(ibest-1, 0)]
+        hi = grid[np.minimum(ibest+1, len(grid)-1)]
+        gold = (np.sqrt(5.0) - 1)/2
+        x1, x2 = hi - gold*(hi-lo), lo + gold*(hi-lo)
+        f1, f2 = qcost(x1)[0], qcost(x2)[0]
+        for i in range(40):
+            left = f1 < f2
+            hi = np.where(left, x2, hi)
+            lo = np.where(left, lo, x1)
+            xkeep, fkeep = np.where(left, x1, x2), np.where(left, f1, f2)
+            xnew = np.where(left, hi - gold*(hi-lo), lo + gold*(hi-lo))
+            fnew = qcost(xnew)[0]
+            x1, f1 = np.where(left, xnew, xkeep), np.where(left, fnew, fkeep)
+            x2, f2 = np.where(left, xkeep, xnew), np.where(left, fkeep, fnew)
+        coefs = qcost((lo + hi)/2.0)[1]
+
+    resid, jac = _stack_resid(coefs, nvarys, ftchis, ftbasis, clampchis,
+                              clampbasis, clampwts)
+    cost = (resid*resid).sum(axis=1)
+    nfev += 1
+    lam = 1.e-3*np.ones(nspec)
+    nu = 2.0*np.ones(nspec)
+    active = np.arange(nspec)
+    for i in range(maxiter):
+        if len(active) == 0:
+            break
+        jaca = jac[active]
+        alpha = np.einsum('sri,srj->sij', jaca, jaca)
+        beta = np.einsum('sri,sr->si', jaca, resid[active])
+        diag = alpha[:, ivary, ivary]
+        diag = np.where(diag > 0, diag, 1.0)
+        alpha[:, ivary, ivary] += lam[active, np.newaxis]*diag
+        step = np.linalg.solve(alpha, -beta[:, :, np.newaxis])[:, :, 0]
+        trial = coefs[active]
+        trial[:, :nvarys] += step
+        tresid, tjac = _stack_resid(trial, nvarys, ftchis[active],
+                                    ftbasis[active], clampchis[active],
+                                    clampbasis[active], clampwts)
+        tcost = (tresid*tresid).sum(axis=1)
+        nfev[active] += 1
+        # damping from the ratio of actual to predicted reduction in cost
+        lin = resid[active] + np.einsum('sri,si->sr', jaca, step)
+        pred = cost[active] - (lin*lin).sum(axis=1)
+        rho = (cost[active] - tcost)/np.where(pred > 0, pred, np.inf)
+        better = rho > 0
+        iup, idown = active[better], active[~better]
+        coefs[iup], resid[iup], jac[iup] = trial[better], tresid[better], tjac[better]
+        dcost = cost[iup] - tcost[better]
+        cost[iup] = tcost[better]
+        lam[iup] *= np.maximum(1/3.0, 1 - (2*rho[better] - 1)**3)
+        nu[iup] = 2.0
+        lam[idown] *= nu[idown]
+        nu[idown] *= 2.0
+
+        dcoef = np.sqrt((step[better]**2).sum(axis=1))
+        ncoef = np.sqrt((coefs[iup, :nvarys]**2).sum(axis=1))
+        done = np.zeros(len(active), dtype=bool)
+        done[better] = ((dcost <= ftol*cost[iup]) |
+                        (dcoef <= xtol*(ncoef + xtol)))
+        done |= lam[active] > 1.e10
+        active = active[~done]
+
+    nfree = max(1, resid.shape[1] - nvarys)
+    alpha = np.einsum('sri,srj->sij', jac, jac)
+    diag = alpha[:, ivary, ivary]
+    alpha[:, ivary, ivary] = np.where(diag > 0, diag, 1.0)
+    covars = np.linalg.inv(alpha)
+    out = []
+    for i in range(nspec):
+        redchi = cost[i]/nfree
+        out.append(Group(params=_autobk_params(coefs[i], nvarys),
+                         nfev=nfev[i], redchi=redchi,
+                         covar=covars[i]*redchi))
+    return out
+
+def _autobk_output(prep, result, basis, chimu, calc_uncertainties=True,
+                   err_sigma=1, _larch=None):
+    """write autobk results from a fit result to the output group"""
+    mu, edge_step = prep.mu, prep.edge_step
+    ie0, iemax, nspl = prep.ie0, prep.iemax, prep.nspl
+    ncoefs = len(prep.coefs)
+
+    # bkg and chi are linear in the spline coefficients
+    initbkg = basis.bkg.dot(prep.coefs)
+    initchi = chimu - basis.chi.dot(prep.coefs)
 
     # write final results
-    coefs = [result.params[FMT_COEF % i].value for i in range(len(coefs))]
-    bkg, chi = spline_eval(kraw[:iemax-ie0+1], mu[ie0:iemax+1],
-                           knots, coefs, order, kout)
+    coefs = np.array([result.params[FMT_COEF % i].value
+                      for i in range(ncoefs)])
+    bkg = basis.bkg.dot(coefs)
+    chi = chimu - basis.chi.dot(coefs)
     obkg = np.copy(mu)
     obkg[ie0:ie0+len(bkg)] = bkg
 
     # outputs to group
-    group = set_xafsGroup(group, _larch=_larch)
+    group = set_xafsGroup(prep.group, _larch=_larch)
     group.bkg  = obkg
     group.chie = (mu-obkg)/edge_step
-    group.k    = kout
+    group.k    = prep.kout
     group.chi  = chi/edge_step
 
     # now fill in 'autobk_details' group
@@ -208,55 +425,26 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
     details.init_bkg = np.copy(mu)
     details.init_bkg[ie0:ie0+len(bkg)] = initbkg
     details.init_chi = initchi/edge_step
-    details.knots_e  = spl_e
+    details.knots_e  = prep.spl_e
     details.knots_y  = np.array([coefs[i] for i in range(nspl)])
-    details.init_knots_y = spl_y
+    details.init_knots_y = prep.spl_y
     details.nfev = result.nfev
-    details.kmin = kmin
-    details.kmax = kmax
+    details.kmin = prep.kmin
+    details.kmax = prep.kmax
     group.autobk_details = details
 
-    # uncertainties in mu0 and chi: can be fairly slow.
+    # uncertainties in mu0 and chi, using the exact
+    # derivatives of bkg and chi with the coefficients
     if calc_uncertainties:
         nchi = len(chi)
         nmue = iemax-ie0 + 1
         redchi = result.redchi
         covar  = result.covar / redchi
-        jac_chi = np.zeros(nchi*nspl).reshape((nspl, nchi))
-        jac_bkg = np.zeros(nmue*nspl).reshape((nspl, nmue))
-
-        cvals, cerrs = [], []
-        for i in range(len(coefs)):
-             par = result.params[FMT_COEF % i]
-             cvals.append(getattr(par, 'value', 0.0))
-             cdel = getattr(par, 'stderr', 0.0)
-             if cdel is None:
-                 cdel = 0.0
-             cerrs.append(cdel/2.0)
-        cvals = np.array(cvals)
-        cerrs = np.array(cerrs)
-
-        # find derivatives by hand!
-        _k = kraw[:nmue]
-        _m = mu[ie0:iemax+1]
-        for i in range(nspl):
-            cval0 = cvals[i]
-            cvals[i] = cval0 + cerrs[i]
-            bkg1, chi1 = spline_eval(_k, _m, knots, cvals, order, kout)
-
-            cvals[i] = cval0 - cerrs[i]
-            bkg2, chi2 = spline_eval(_k, _m, knots, cvals, order, kout)
-
-            cvals[i] = cval0
-            jac_chi[i] = (chi1 - chi2) / (2*cerrs[i])
-            jac_bkg[i] = (bkg1 - bkg2) / (2*cerrs[i])
-
-        dfchi = np.zeros(nchi)
-        dfbkg = np.zeros(nmue)
-        for i in range(nspl):
-            for j in range(nspl):
-                dfchi += jac_chi[i]*jac_chi[j]*covar[i,j]
-                dfbkg += jac_bkg[i]*jac_bkg[j]*covar[i,j]
+        jac_chi = basis.chi[:, :nspl]
+        jac_bkg = basis.bkg[:, :nspl]
+
+        dfchi = (jac_chi.dot(covar) * jac_chi).sum(axis=1)
+        dfbkg = (jac_bkg.dot(covar) * jac_bkg).sum(axis=1)
 
         prob = 0.5*(1.0 + erf(err_sigma/np.sqrt(2.0)))
         dchi = t.ppf(prob, nchi-nspl) * np.sqrt(dfchi*redchi)
@@ -266,6 +454,162 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
         group.delta_bkg = 0.0*mu
         group.delta_bkg[ie0:ie0+len(dbkg)] = dbkg
 
+@ValidateLarchPlugin
+@Make_CallArgs(["energy" ,"mu"])
+def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
+           edge_step=None, kmin=0, kmax=None, kweight=1, dk=0.1,
+           win='hanning', k_std=None, chi_std=None, nfft=2048, kstep=0.05,
+           pre_edge_kws=None, nclamp=4, clamp_lo=1, clamp_hi=1,
+           calc_uncertainties=True, err_sigma=1, _larch=None, **kws):
+    """Use Autobk algorithm to remove XAFS background
+
+    Parameters:
+    -----------
+      energy:    1-d array of x-ray energies, in eV, or group
+      mu:        1-d array of mu(E)
+      group:     output group (and input group for e0 and edge_step).
+      rbkg:      distance (in Ang) for chi(R) above
+                 which the signal is ignored. Default = 1.
+      e0:        edge energy, in eV.  If None, it will be determined.
+      edge_step: edge step.  If None, it will be determined.
+      pre_edge_kws:  keyword arguments to pass to pre_edge()
+      nknots:    number of knots in spline.  If None, it will be determined.
+      kmin:      minimum k value   [0]
+      kmax:      maximum k value   [full data range].
+      kweight:   k weight for FFT.  [1]
+      dk:        FFT window window parameter.  [0.1]
+      win:       FFT window function name.     ['hanning']
+      nfft:      array size to use for FFT [2048]
+      kstep:     k step size to use for FFT [0.05]
+      k_std:     optional k array for standard chi(k).
+      chi_std:   optional chi array for standard chi(k).
+      nclamp:    number of energy end-points for clamp [2]
+      clamp_lo:  weight of low-energy clamp [1]
+      clamp_hi:  weight of high-energy clamp [1]
+      calc_uncertaintites:  Flag to calculate uncertainties in
+                            mu_0(E) and chi(k) [True]
+      err_sigma: sigma level for uncertainties in mu_0(E) and chi(k) [1]
+
+    Output arrays are written to the provided group.
+
+    Follows the 'First Argument Group' convention.
+    """
+    msg = _larch.writer.write
+    if 'kw' in kws:
+        kweight = kws.pop('kw')
+    if len(kws) > 0:
+        msg('Unrecognized a:rguments for autobk():\n')
+        msg('    %s\n' % (', '.join(kws.keys())))
+        return
+    energy, mu, group = parse_group_args(energy, members=('energy', 'mu'),
+                                         defaults=(mu,), group=group,
+                                         fcn_name='autobk')
+    prep = _autobk_prep(energy, mu, group=group, rbkg=rbkg, e0=e0,
+                        edge_step=edge_step, kmin=kmin, kmax=kmax,
+                        kweight=kweight, dk=dk, win=win, k_std=k_std,
+                        chi_std=chi_std, nfft=nfft, kstep=kstep,
+                        pre_edge_kws=pre_edge_kws, _larch=_larch)
+    if prep is None:
+        msg('autobk() could not determine e0 or edge_step!: trying running pre_edge first\n')
+        return
+
+    basis = _autobk_basis(prep, kweight=kweight, nfft=nfft, nclamp=nclamp)
+    chis, chis_std, ftchis = _autobk_chis([prep], nfft=nfft)
+
+    result = _autobk_fit(prep, basis, chis_std[0], ftchis[0], nclamp=nclamp,
+                         clamp_lo=clamp_lo, clamp_hi=clamp_hi)
+
+    _autobk_output(prep, result, basis, chis[0],
+                   calc_uncertainties=calc_uncertainties,
+                   err_sigma=err_sigma, _larch=_larch)
+
+@ValidateLarchPlugin
+def autobk_batch(groups, rbkg=1, e0=None, edge_step=None, kmin=0,
+                 kmax=None, kweight=1, dk=0.1, win='hanning', k_std=None,
+                 chi_std=None, nfft=2048, kstep=0.05, pre_edge_kws=None,
+                 nclamp=4, clamp_lo=1, clamp_hi=1, calc_uncertainties=True,
+                 err_sigma=1, _larch=None, **kws):
+    """Use Autobk algorithm to remove XAFS background for many spectra
+
+    Parameters:
+    -----------
+      groups:    list of groups, each with 'energy' and 'mu' arrays.
+
+    All other arguments are as for autobk(), and are applied to all groups.
+
+    Output arrays (bkg, chie, k, chi, autobk_details, and, optionally,
+    delta_chi and delta_bkg) are written to each group, as for autobk().
+
+    Notes:
+    ------
+    The spline coefficients of all spectra with the same number of knots
+    (as for a common kmax) are fit together: each step of the fit solves
+    the linear problems for all spectra with one call to
+    numpy.linalg.solve(), so that the fit for many spectra takes little
+    more time than for one.  The FTs of chi(k) for all spectra are also
+    done together.
+
+    Spectra with the same k grid, e0, and spline knots share a single set
+    of B-spline basis matrices and their FTs, which otherwise need to be
+    found for each spectrum.  For spectra measured on the same energy
+    grid, giving a common e0 avoids this.
+
+    The fit converges more tightly than the fit in autobk(), so that
+    results agree with those from autobk() to within its tolerance.
+    """
+    msg = _larch.writer.write
+    if 'kw' in kws:
+        kweight = kws.pop('kw')
+    if len(kws) > 0:
+        msg('Unrecognized arguments for autobk_batch():\n')
+        msg('    %s\n' % (', '.join(kws.keys())))
+        return
+
+    for igroup, grp in enumerate(groups):
+        if not isgroup(grp, 'energy', 'mu'):
+            raise Warning("""autobk_batch: group %i (%s) needs 'energy' and 'mu'
+  arrays""" % (igroup, getattr(grp, '__name__', repr(grp))))
+
+    # set up each spectrum, sorting into stacks with the same number of
+    # spline coefficients and FT points, to be fit together
+    stacks, bases = {}, {}
+    for igroup, grp in enumerate(groups):
+        energy, mu, grp = parse_group_args(grp, members=('energy', 'mu'),
+                                           group=grp, fcn_name='autobk_batch')
+        prep = _autobk_prep(energy, mu, group=grp, rbkg=rbkg, e0=e0,
+                            edge_step=edge_step, kmin=kmin, kmax=kmax,
+                            kweight=kweight, dk=dk, win=win, k_std=k_std,
+                            chi_std=chi_std, nfft=nfft, kstep=kstep,
+                            pre_edge_kws=pre_edge_kws, _larch=_larch)
+        if prep is None:
+            msg('autobk_batch() could not determine e0 or edge_step for group %i\n' % igroup)
+            continue
+        # basis matrices are shared by spectra with the same geometry
+        key = (prep.kraw.tobytes(), prep.knots.tobytes(),
+               prep.ftwin.tobytes(), prep.irbkg)
+        if key not in bases:
+            bases[key] = _autobk_basis(prep, kweight=kweight, nfft=nfft,
+                                       nclamp=nclamp)
+        prep.basis = bases[key]
+        skey = (prep.nspl, len(prep.coefs), prep.irbkg)
+        if skey not in stacks:
+            stacks[skey] = []
+        stacks[skey].append(prep)
+
+    clampwts = np.array(nclamp*[abs(clamp_lo)] + nclamp*[abs(clamp_hi)])
+    for preps in stacks.values():
+        chis, chis_std, ftchis = _autobk_chis(preps, nfft=nfft)
+        ftbasis = np.array([p.basis.ft for p in preps])
+        clampbasis = np.array([p.basis.clamp for p in preps])
+        clampchis = np.array([c[p.basis.iclamp]*p.basis.clampk
+                              for c, p in zip(chis_std, preps)])
+        coefs = np.array([p.coefs for p in preps])
+        results = _autobk_stackfit(coefs, preps[0].nspl, ftchis, ftbasis,
+                                   clampchis, clampbasis, clampwts)
+        for prep, result, chi in zip(preps, results, chis):
+            _autobk_output(prep, result, prep.basis, chi,
+                           calc_uncertainties=calc_uncertainties,
+                           err_sigma=err_sigma, _larch=_larch)
 
 def registerLarchPlugin():
-    return ('_xafs', {'autobk': autobk})
+    return ('_xafs', {'autobk': autobk, 'autobk_batch': autobk_batch})
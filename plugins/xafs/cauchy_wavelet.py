@@ -23,13 +23,15 @@
 # 2014-Apr M Newville : translated to Python for Larch
 
 import numpy as np
+from scipy.fftpack import fft, ifft
 from larch import ValidateLarchPlugin, parse_group_args
 from larch.utils import complex_phase
 from larch_plugins.xafs import set_xafsGroup
 
 @ValidateLarchPlugin
 def cauchy_wavelet(k, chi=None, group=None, kweight=0, rmax_out=10,
-                   nfft=2048, _larch=None):
+                   nfft=2048, rchunk=64, single_precision=False,
+                   _larch=None):
     """
     Cauchy Wavelet Transform for XAFS, following work of Munoz, Argoul, and Farges
 
@@ -41,6 +43,10 @@ def cauchy_wavelet(k, chi=None, group=None, kweight=0, rmax_out=10,
       rmax_out: highest R for output data (10 Ang)
       kweight:  exponent for weighting spectra by k**kweight
       nfft:     value to use for N_fft (2048).
+      rchunk:   number of R values to calculate at once, to limit
+                memory use [64].  Use None for all R values at once.
+      single_precision: whether to calculate with complex64 instead
+                of complex128, for speed and lower memory use [False]
 
       Returns:
     ---------
@@ -58,6 +64,9 @@ def cauchy_wavelet(k, chi=None, group=None, kweight=0, rmax_out=10,
     Supports First Argument Group convention (with group
     member names 'k' and 'chi')
 
+    The wavelet filters for all R values are applied to the FT of chi
+    as one (nR, nfft) array, followed by one inverse FFT, or one for
+    each block of rchunk R values.
     """
     k, chi, group = parse_group_args(k, members=('k', 'chi'),
                                      defaults=(chi,), group=group,
@@ -87,7 +96,7 @@ def cauchy_wavelet(k, chi=None, group=None, kweight=0, rmax_out=10,
     omega = 2*np.pi*freq
 
     # simple FT calculation
-    tff = np.fft.fft(xnew, n= 2*nfft)
+    tff = fft(xnew, n=2*nfft)[:nfft]
 
     # scale parameter
     r  = np.linspace(0, rmax, nrpts)
@@ -97,15 +106,21 @@ def cauchy_wavelet(k, chi=None, group=None, kweight=0, rmax_out=10,
     # Characteristic values for Cauchy wavelet:
     cauchy_sum = np.log(2*np.pi) - np.log(1.0+np.arange(nrpts)).sum()
 
-    # Main calculation:
-    out = np.zeros(nkout*nrpts,
-                   dtype='complex128').reshape(nrpts, nkout)
-    for i in range(nrpts):
-        aom = a[i]*omega
-        aom[np.where(aom==0)] = 1.e-19
-        filt = cauchy_sum + nrpts*np.log(aom) - aom
-        tmp  = np.conj(np.exp(filt))*tff[:nfft]
-        out[i, :] = np.fft.ifft(tmp, 2*nfft)[:nkout]
+    # Main calculation, for blocks of rchunk R values:
+    dtype = 'complex64' if single_precision else 'complex128'
+    tff = tff.astype(dtype)
+    if rchunk is None or rchunk < 1:
+        rchunk = nrpts
+    out = np.zeros((nrpts, nkout), dtype=dtype)
+    # log(a*omega) = log(a) + log(omega), with log(0) giving a 0 filter
+    with np.errstate(divide='ignore'):
+        logom = nrpts*np.log(omega)
+    loga = cauchy_sum + nrpts*np.log(a)
+    for i in range(0, nrpts, rchunk):
+        filt = np.exp(loga[i:i+rchunk, np.newaxis] + logom -
+                      a[i:i+rchunk, np.newaxis]*omega)
+        tmp  = filt.astype(dtype)*tff
+        out[i:i+rchunk] = ifft(tmp, 2*nfft, axis=-1)[:, :nkout]
 
     group = set_xafsGroup(group, _larch=_larch)
     group.r  =  r
@@ -12,22 +12,75 @@ the path represented by the feffNNNN.dat
 
 creates a group that contains the chi(k) for the sum of paths.
 """
+import ast
 import six
 import numpy as np
-from scipy.interpolate import UnivariateSpline
+from scipy.interpolate import UnivariateSpline, PPoly, splrep
 from lmfit import Parameters
 from larch import (Group, Parameter, isParameter,
                    ValidateLarchPlugin,
                    param_value, isNamedClass)
 
+from larch.utils import LRUCache
 from larch.utils.strutils import fix_varname, b32hash
 from larch_plugins.xafs import ETOK, set_xafsGroup
 from larch_plugins.xray import atomic_mass, atomic_symbol
 from larch.fitting import group2params
 
 SMALL = 1.e-6
+MAX_CALC_CACHE = 4   # number of k grids with cached path calculations
 
 
+def e0_shifted_k(k, e0):
+    """e0-shifted wavenumber q for wavenumber k
+
+    for n-d arrays of k (or e0), each row along the last axis is
+    shifted separately"""
+    # create e0-shifted energy and k, careful to look for |e0| ~= 0.
+    en = k*k - e0*ETOK
+    small = abs(en) < SMALL
+    if small.any():
+        try:
+            rows = small.any(axis=-1)[..., np.newaxis]
+            en[rows & (abs(en) < 2*SMALL)] = SMALL
+        except (ValueError, IndexError, TypeError):
+            pass
+    return np.sign(en)*np.sqrt(abs(en))
+
+def _stack_tables(kgrid, tables, interp='cubic'):
+    """coefficients for interpolating rows of Feff.dat tables on a
+    common k grid: for 'cubic', the coefficients of the piecewise
+    polynomials of interpolating splines, as from UnivariateSpline(s=0),
+    and for linear interpolation, the tables themselves"""
+    if interp.startswith('lin'):
+        return kgrid, np.asarray(tables)[np.newaxis]
+    polys = [PPoly.from_spline(splrep(kgrid, row, s=0)) for row in tables]
+    degree = len(polys[0].c) - 1
+    # drop the empty intervals at repeated knots of the end points
+    breaks = polys[0].x[degree:-degree]
+    coefs = np.array([poly.c[:, degree:-degree] for poly in polys])
+    return breaks, coefs.transpose(1, 0, 2)
+
+def _interp_stack(breaks, coefs, rows, q):
+    """interpolate rows of stacked Feff.dat tables from _stack_tables()
+    at wavenumbers q (len(rows), nk).  As for UnivariateSpline(), cubic
+    interpolation extrapolates, while linear interpolation, as for
+    numpy.interp(), takes the end values beyond the k grid."""
+    nint = len(breaks) - 1
+    rows = np.asarray(rows)[:, np.newaxis]
+    if len(coefs) == 1:
+        qc = np.clip(q, breaks[0], breaks[-1])
+        idx = np.clip(np.searchsorted(breaks, qc, side='right') - 1,
+                      0, nint-1)
+        frac = (qc - breaks[idx])/(breaks[idx+1] - breaks[idx])
+        return (1-frac)*coefs[0][rows, idx] + frac*coefs[0][rows, idx+1]
+    idx = np.clip(np.searchsorted(breaks, q, side='right') - 1, 0, nint-1)
+    dq = q - breaks[idx]
+    out = coefs[0][rows, idx]
+    for coef in coefs[1:]:
+        out = out*dq + coef[rows, idx]
+    return out
+
 class FeffDatFile(Group):
     def __init__(self, filename=None, _larch=None, **kws):
         self._larch = _larch
@@ -195,6 +248,7 @@ class FeffPathGroup(Group):
 
         self.k = None
         self.chi = None
+        self._calc_cache = LRUCache(maxsize=MAX_CALC_CACHE)
         if self._feffdat is not None:
             self.create_spline_coefs()
 
@@ -270,6 +324,7 @@ class FeffPathGroup(Group):
     def create_spline_coefs(self):
         """pre-calculate spline coefficients for feff data"""
         self.spline_coefs = {}
+        self._calc_cache = LRUCache(maxsize=MAX_CALC_CACHE)
         fdat = self._feffdat
         self.spline_coefs['pha'] = UnivariateSpline(fdat.k, fdat.pha, s=0)
         self.spline_coefs['amp'] = UnivariateSpline(fdat.k, fdat.amp, s=0)
@@ -360,6 +415,19 @@ class FeffPathGroup(Group):
         return '\n'.join(out)
 
 
+    def _feffdat_values(self, q, interp='cubic'):
+        """Feff.dat values (pha, amp, rep, lam) at wavenumbers q"""
+        fdat = self._feffdat
+        if interp.startswith('lin'):
+            return (np.interp(q, fdat.k, fdat.pha),
+                    np.interp(q, fdat.k, fdat.amp),
+                    np.interp(q, fdat.k, fdat.rep),
+                    np.interp(q, fdat.k, fdat.lam))
+        if self.spline_coefs is None:
+            self.create_spline_coefs()
+        return (self.spline_coefs['pha'](q), self.spline_coefs['amp'](q),
+                self.spline_coefs['rep'](q), self.spline_coefs['lam'](q))
+
     def _calc_chi(self, k=None, kmax=None, kstep=None, degen=None, s02=None,
                  e0=None, ei=None, deltar=None, sigma2=None,
                  third=None, fourth=None, debug=False, interp='cubic', **kws):
@@ -383,28 +451,23 @@ class FeffPathGroup(Group):
                                  deltar=deltar, sigma2=sigma2,
                                  third=third, fourth=fourth)
 
-        # create e0-shifted energy and k, careful to look for |e0| ~= 0.
-        en = k*k - e0*ETOK
-        if min(abs(en)) < SMALL:
-            try:
-                en[np.where(abs(en) < 2*SMALL)] = SMALL
-            except ValueError:
-                pass
-        # q is the e0-shifted wavenumber
-        q = np.sign(en)*np.sqrt(abs(en))
-
-        # lookup Feff.dat values (pha, amp, rep, lam)
-        if interp.startswith('lin'):
-            pha = np.interp(q, fdat.k, fdat.pha)
-            amp = np.interp(q, fdat.k, fdat.amp)
-            rep = np.interp(q, fdat.k, fdat.rep)
-            lam = np.interp(q, fdat.k, fdat.lam)
-        else:
-            pha = self.spline_coefs['pha'](q)
-            amp = self.spline_coefs['amp'](q)
-            rep = self.spline_coefs['rep'](q)
-            lam = self.spline_coefs['lam'](q)
-
+        # intermediate arrays are cached for each k grid, and reused
+        # when only later parameters in this sequence have changed:
+        #   e0 -> Feff.dat values at q;  ei -> complex wavenumber p;
+        #   deltar, sigma2, third, fourth -> chi(k) shape; degen, s02
+        kkey = (k.tobytes(), interp)
+        cache = self._calc_cache.get(kkey, None)
+        if cache is None:
+            cache = self._calc_cache[kkey] = {'e0': None}
+
+        if cache['e0'] != e0:
+            q = e0_shifted_k(k, e0)
+            pha, amp, rep, lam = self._feffdat_values(q, interp=interp)
+            cache.update({'e0': e0, 'ei': None, 'q': q, 'pha': pha,
+                          'amp': amp, 'rep': rep, 'lam': lam})
+
+        q, pha, amp = cache['q'], cache['pha'], cache['amp']
+        rep, lam = cache['rep'], cache['lam']
         if debug:
             self.debug_k   = q
             self.debug_pha = pha
@@ -412,23 +475,195 @@ class FeffPathGroup(Group):
             self.debug_rep = rep
             self.debug_lam = lam
 
-        # p = complex wavenumber, and its square:
-        pp   = (rep + 1j/lam)**2 + 1j * ei * ETOK
-        p    = np.sqrt(pp)
-
-        # the xafs equation:
-        cchi = np.exp(-2*reff*p.imag - 2*pp*(sigma2 - pp*fourth/3) +
-                      1j*(2*q*reff + pha +
-                          2*p*(deltar - 2*sigma2/reff - 2*pp*third/3) ))
-
-        cchi = degen * s02 * amp * cchi / (q*(reff + deltar)**2)
-        cchi[0] = 2*cchi[1] - cchi[2]
+        if cache['ei'] != ei:
+            # p = complex wavenumber, and its square:
+            pp   = (rep + 1j/lam)**2 + 1j * ei * ETOK
+            p    = np.sqrt(pp)
+            cache.update({'ei': ei, 'shape': None, 'pp': pp, 'p': p,
+                          'phase0': -2*reff*p.imag + 1j*(2*q*reff + pha)})
+        pp, p = cache['pp'], cache['p']
+
+        shape = (deltar, sigma2, third, fourth)
+        if cache['shape'] != shape:
+            # the xafs equation, without degen*s02:
+            cchi = np.exp(cache['phase0'] - 2*pp*(sigma2 - pp*fourth/3) +
+                          1j*2*p*(deltar - 2*sigma2/reff - 2*pp*third/3))
+
+            cchi = amp * cchi / (q*(reff + deltar)**2)
+            cchi[0] = 2*cchi[1] - cchi[2]
+            cache.update({'shape': shape, 'cchi': cchi})
+
+        cchi = degen * s02 * cache['cchi']
         # outputs:
         self.k = k
         self.p = p
         self.chi = cchi.imag
         self.chi_imag = -cchi.real
 
+class FeffPathStack(object):
+    """chi(k) for a list of Feff Paths on a common k grid, with the
+    Feff.dat values for all paths held in (npaths, nk) arrays, so that
+    the XAFS equation is evaluated for all paths at once.
+
+    The Feff.dat tables of paths with the same k grid are stacked, so
+    that the Feff.dat values at the e0-shifted wavenumbers of all paths
+    are interpolated together.  Rows are recalculated only for paths
+    whose e0 or ei have changed (for the Feff.dat values and complex
+    wavenumber), or whose deltar, sigma2, third or fourth have changed
+    (for the shape of chi(k)).
+    """
+    def __init__(self, pathlist, k, interp='cubic'):
+        self.pathlist = pathlist
+        self.k = k
+        self.interp = interp
+        npaths, nk = len(pathlist), len(k)
+        self.reff = np.array([p._feffdat.reff for p in pathlist])[:, None]
+        # NaN never compares equal, so all rows are calculated at first
+        self.pars = np.nan*np.ones((npaths, len(PATH_PARS)))
+        self.q   = np.zeros((npaths, nk))
+        self.pha = np.zeros((npaths, nk))
+        self.amp = np.zeros((npaths, nk))
+        self.rep = np.zeros((npaths, nk))
+        self.lam = np.zeros((npaths, nk))
+        self.pp  = np.zeros((npaths, nk), dtype='complex128')
+        self.p   = np.zeros((npaths, nk), dtype='complex128')
+        self.cshape = np.zeros((npaths, nk), dtype='complex128')
+        self.parsets = None
+
+        # stacked (pha, amp, rep, lam) tables for each Feff.dat k grid:
+        # (path indices, breaks, coefs), with rows of coefs for pha for
+        # all paths, then amp for all paths, and so on
+        grids = {}
+        for i, path in enumerate(pathlist):
+            kgrid = path._feffdat.k
+            key = (len(kgrid), kgrid.tobytes())
+            if key not in grids:
+                grids[key] = (kgrid, [])
+            grids[key][1].append(i)
+        self.tables = []
+        for kgrid, ipaths in grids.values():
+            fdats = [pathlist[i]._feffdat for i in ipaths]
+            tables = [getattr(fdat, attr) for attr in ('pha', 'amp', 'rep', 'lam')
+                      for fdat in fdats]
+            breaks, coefs = _stack_tables(kgrid, tables, interp=interp)
+            self.tables.append((np.array(ipaths), breaks, coefs))
+
+    def _sort_params(self):
+        """sort path parameters into those with values, those with
+        expressions that give the same value for all paths, and those
+        with expressions that depend on the path, through 'reff',
+        'feffpath', or functions such as sigma2_debye()"""
+        fixed, shared, perpath = [], {}, []
+        for i, path in enumerate(self.pathlist):
+            if path.params is None:
+                path.create_path_params()
+            pars = []
+            for j, pname in enumerate(PATH_PARS):
+                par = path.params[fix_varname(PATHPAR_FMT % (pname, path.label))]
+                if par.expr is None:
+                    fixed.append((i, j, par))
+                    continue
+                names = set()
+                calls = False
+                for node in ast.walk(ast.parse(par.expr.strip())):
+                    if isinstance(node, ast.Name):
+                        names.add(node.id)
+                    calls = calls or isinstance(node, ast.Call)
+                if calls or 'reff' in names or 'feffpath' in names:
+                    pars.append((j, par))
+                else:
+                    key = par.expr.strip()
+                    if key not in shared:
+                        shared[key] = (par, [], [])
+                    shared[key][1].append(i)
+                    shared[key][2].append(j)
+            if len(pars) > 0:
+                perpath.append((path, i, pars))
+        self.parsets = (fixed, list(shared.values()), perpath)
+
+    def path_values(self):
+        """current path parameter values, as (npaths, len(PATH_PARS)) array
+
+        Expressions used by several paths that do not depend on the path
+        are evaluated once.  This evaluates the Path Parameters in the fit
+        namespace, and so should not be run concurrently with other fit
+        evaluations.
+        """
+        if self.parsets is None:
+            self._sort_params()
+        fixed, shared, perpath = self.parsets
+        out = np.zeros((len(self.pathlist), len(PATH_PARS)))
+        for i, j, par in fixed:
+            out[i, j] = par.value
+        for par, rows, cols in shared:
+            out[rows, cols] = par._getval()
+        for path, i, pars in perpath:
+            path.store_feffdat()
+            for j, par in pars:
+                out[i, j] = par._getval()
+        return out
+
+    def calc_chi(self, pars=None):
+        """calculate chi(k) for each path and return their sum
+
+        pars is an array of path parameter values, as from path_values().
+        If None, path_values() will be used.
+        """
+        if pars is None:
+            pars = self.path_values()
+        (degen, s02, e0, ei, deltar, sigma2,
+         third, fourth) = [a[:, None] for a in pars.T]
+        changed = (pars != self.pars)
+
+        # Feff.dat values at e0-shifted q, for all paths on a k grid at once
+        for ipaths, breaks, coefs in self.tables:
+            rows = ipaths[changed[ipaths, 2]]
+            if len(rows) == 0:
+                continue
+            local = np.where(changed[ipaths, 2])[0]
+            q = e0_shifted_k(self.k, e0[rows])
+            vals = _interp_stack(breaks, coefs,
+                                 np.concatenate([local + n*len(ipaths)
+                                                 for n in range(4)]),
+                                 np.tile(q, (4, 1)))
+            nrows = len(rows)
+            self.q[rows] = q
+            self.pha[rows] = vals[:nrows]
+            self.amp[rows] = vals[nrows:2*nrows]
+            self.rep[rows] = vals[2*nrows:3*nrows]
+            self.lam[rows] = vals[3*nrows:]
+
+        # p = complex wavenumber, and its square:
+        rows = np.where(changed[:, 2:4].any(axis=1))[0]
+        if len(rows) > 0:
+            self.pp[rows] = ((self.rep[rows] + 1j/self.lam[rows])**2 +
+                             1j * ei[rows] * ETOK)
+            self.p[rows] = np.sqrt(self.pp[rows])
+
+        # the xafs equation, without degen*s02:
+        rows = np.where(changed[:, 2:].any(axis=1))[0]
+        if len(rows) > 0:
+            reff, q = self.reff[rows], self.q[rows]
+            pp, p = self.pp[rows], self.p[rows]
+            dr, ss2 = deltar[rows], sigma2[rows]
+            c3, c4 = third[rows], fourth[rows]
+            cchi = np.exp(-2*reff*p.imag - 2*pp*(ss2 - pp*c4/3) +
+                          1j*(2*q*reff + self.pha[rows] +
+                              2*p*(dr - 2*ss2/reff - 2*pp*c3/3) ))
+            cchi = self.amp[rows] * cchi / (q*(reff + dr)**2)
+            cchi[:, 0] = 2*cchi[:, 1] - cchi[:, 2]
+            self.cshape[rows] = cchi
+        self.pars = pars.copy()
+
+        cchi = degen * s02 * self.cshape
+        chi, chi_imag = cchi.imag, -cchi.real
+        for i, path in enumerate(self.pathlist):
+            path.k = self.k
+            path.p = self.p[i].copy()
+            path.chi = chi[i]
+            path.chi_imag = chi_imag[i]
+        return chi.sum(axis=0)
+
 @ValidateLarchPlugin
 def _path2chi(path, paramgroup=None, _larch=None, **kws):
     """calculate chi(k) for a Feff Path,
@@ -2,6 +2,8 @@
 """
    feffit sums Feff paths to match xafs data
 """
+import sys
+import traceback
 from collections import Iterable
 from copy import copy, deepcopy
 from functools import partial
@@ -11,13 +13,28 @@ from numpy import array, arange, interp, pi, zeros, sqrt, concatenate
 from scipy import constants
 from scipy.optimize import leastsq as scipy_leastsq
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+# worker processes are forked, so that they have copies of the
+# prepared datasets, which cannot be pickled
+try:
+    import multiprocessing
+    fork_context = multiprocessing.get_context('fork')
+except AttributeError:
+    fork_context = multiprocessing if sys.platform != 'win32' else None
+except ValueError:
+    fork_context = None
+
 from lmfit import Parameters, Parameter, Minimizer, asteval, fit_report
 
 from larch import (Group, isParameter, ValidateLarchPlugin, isNamedClass)
 
 from larch.utils import index_of, realimag, complex_phase
-from larch_plugins.xafs import (xftf_fast, xftr_fast, ftwindow,
-                                set_xafsGroup, FeffPathGroup, _ff2chi)
+from larch_plugins.xafs import (ftwindow, FTContext, set_xafsGroup,
+                                FeffPathGroup, FeffPathStack)
 
 from larch_plugins.xafs.sigma2_models import sigma2_correldebye, sigma2_debye
 from larch_plugins.xafs.feffdat import PATHPAR_FMT
@@ -100,6 +117,7 @@ class TransformGroup(Group):
         self.rstep = pi/(self.kstep*self.nfft)
         self.k_ = self.kstep * arange(self.nfft, dtype='float64')
         self.r_ = self.rstep * arange(self.nfft, dtype='float64')
+        self.ftcontext = FTContext(nfft=self.nfft, kstep=self.kstep)
 
     def _xafsft(self, chi, group=None, rmax_out=10, **kws):
         "returns "
@@ -140,7 +158,7 @@ class TransformGroup(Group):
         if kweight is None:
             kweight = self.get_kweight()
         cx = chi * self.kwin[:len(chi)] * self.k_[:len(chi)]**kweight
-        return xftf_fast(cx, kstep=self.kstep, nfft=self.nfft)
+        return self.ftcontext.xftf(cx)
 
     def fftr(self, chir):
         " reverse FT -- meant to be used internally"
@@ -150,7 +168,7 @@ class TransformGroup(Group):
                                  dx=self.dr, dx2=self.dr2, window=self.rwindow)
 
         cx = chir * self.rwin[:len(chir)]
-        return xftr_fast(cx, kstep=self.kstep, nfft=self.nfft)
+        return self.ftcontext.xftr(cx)
 
 class FeffitDataSet(Group):
     def __init__(self, data=None, pathlist=None, transform=None,
@@ -170,6 +188,7 @@ class FeffitDataSet(Group):
         self.model = Group()
         self.model.k = None
         self.__chi = None
+        self.__pathstack = None
         self.__prepared = False
 
     def __repr__(self):
@@ -223,7 +242,7 @@ class FeffitDataSet(Group):
             path.create_path_params()
             if path.spline_coefs is None:
                 path.create_spline_coefs()
-
+        self.__pathstack = FeffPathStack(self.pathlist, self.model.k)
         self.__prepared = True
 
 
@@ -293,18 +312,35 @@ class FeffitDataSet(Group):
             self.epsilon_r = eps_r
 
 
-    def _residual(self, paramgroup, data_only=False, **kws):
+    def _path_values(self, paramgroup=None):
+        """return array of current path parameter values for the pathlist.
+        if paramgroup is given, its values are first put into fiteval.
+        """
+        if not self.__prepared:
+            self.prepare_fit()
+        if paramgroup is not None:
+            group2params(paramgroup, _larch=self._larch)
+        return self.__pathstack.path_values()
+
+    def _residual(self, paramgroup, data_only=False, pathvals=None, **kws):
         """return the residual for this data set
         residual = self.transform.apply(data_chi - model_chi)
         where model_chi is the result of ff2chi(pathlist)
+
+        pathvals, if given, is the array of path parameter values from
+        _path_values(), and paramgroup will not be used.  This part
+        of the calculation does not use the fit namespace, and can be
+        run concurrently for different datasets.
         """
         if not isNamedClass(self.transform, TransformGroup):
             return
         if not self.__prepared:
             self.prepare_fit()
 
-        _ff2chi(self.pathlist, paramgroup=paramgroup, k=self.model.k,
-                _larch=self._larch, group=self.model)
+        # sum chi(k) for all paths at once
+        if pathvals is None:
+            pathvals = self._path_values(paramgroup)
+        self.model.chi = self.__pathstack.calc_chi(pathvals)
 
         eps_k = self.epsilon_k
         if isinstance(eps_k, np.ndarray):
@@ -407,8 +443,72 @@ def feffit_transform(_larch=None, **kws):
     """
     return TransformGroup(_larch=_larch, **kws)
 
+def _resid_chunk(datasets, pathvals):
+    "residuals for datasets, from arrays of path parameter values"
+    return [d._residual(None, pathvals=pv)
+            for d, pv in zip(datasets, pathvals)]
+
+class ResidualThread(object):
+    """calculates the residuals for a fixed list of datasets
+    in a thread, so that each dataset is always calculated by
+    the same thread"""
+    def __init__(self, datasets):
+        self.datasets = datasets
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, pathvals):
+        "start calculation, returning a future"
+        return self.executor.submit(_resid_chunk, self.datasets, pathvals)
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+class ResidualProcess(object):
+    """calculates the residuals for a fixed list of datasets in a
+    forked process.  Only the arrays of path parameter values and
+    the residuals are sent between processes"""
+    def __init__(self, datasets):
+        self.conn, child = fork_context.Pipe()
+        self.process = fork_context.Process(target=self.run,
+                                            args=(datasets, child))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+
+    @staticmethod
+    def run(datasets, conn):
+        while True:
+            pathvals = conn.recv()
+            if pathvals is None:
+                break
+            try:
+                conn.send((True, _resid_chunk(datasets, pathvals)))
+            except Exception:
+                conn.send((False, traceback.format_exc()))
+        conn.close()
+
+    def submit(self, pathvals):
+        "start calculation, returning self, with result() to wait for it"
+        self.conn.send(pathvals)
+        return self
+
+    def result(self):
+        ok, out = self.conn.recv()
+        if not ok:
+            raise RuntimeError("feffit worker process failed:\n%s" % out)
+        return out
+
+    def shutdown(self):
+        try:
+            self.conn.send(None)
+        except (IOError, OSError):
+            pass
+        self.process.join()
+        self.conn.close()
+
 @ValidateLarchPlugin
-def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **kws):
+def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True,
+           workers=1, processes=False, _larch=None, **kws):
     """execute a Feffit fit: a fit of feff paths to a list of datasets
 
     Parameters:
@@ -417,6 +517,9 @@ def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **
       datasets:     Feffit Dataset group or list of Feffit Dataset group.
       rmax_out:     maximum R value to calculate output arrays.
       path_output:  Flag to set whether all Path outputs should be written.
+      workers:      number of threads or processes to use to calculate
+                    the residuals for the datasets [1]. See Notes.
+      processes:    whether workers are processes rather than threads [False].
 
     Returns:
     ---------
@@ -437,14 +540,34 @@ def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **
         chir_pha     phase of chi(R).
         chir_re      real part of chi(R).
         chir_im      imaginary part of chi(R).
+
+    Notes:
+    ------
+     With workers > 1 and more than one dataset, the path parameters
+     for all datasets are evaluated first, and then the model chi(k)
+     and transformed residual for each dataset are calculated by the
+     workers, each always working on the same datasets.  The results
+     are identical to workers=1.  See the Feffit documentation for
+     how this scales with threads and with processes.
     """
 
 
     def _resid(params, datasets=None, paramgroup=None,
-               _larch=None, **kwargs):
+               executors=None, _larch=None, **kwargs):
         """ this is the residual function"""
         params2group(params, paramgroup)
-        return concatenate([d._residual(paramgroup) for d in datasets])
+        if executors is None:
+            return concatenate([d._residual(paramgroup) for d in datasets])
+
+        group2params(paramgroup, _larch=_larch)
+        pathvals = [d._path_values() for d in datasets]
+        nexec = len(executors)
+        tasks = [executors[i].submit(pathvals[i::nexec])
+                 for i in range(nexec)]
+        out = [None]*len(datasets)
+        for i, task in enumerate(tasks):
+            out[i::nexec] = task.result()
+        return concatenate(out)
 
     if isNamedClass(datasets, FeffitDataSet):
         datasets = [datasets]
@@ -457,12 +580,34 @@ def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **
             return
         ds.prepare_fit()
 
+    # each worker always calculates the same datasets
+    executors = None
+    workers = min(workers, len(datasets))
+    if workers > 1:
+        if processes and fork_context is None:
+            _larch.writer.write("feffit: processes cannot be forked, using threads\n")
+            processes = False
+        if processes:
+            executors = [ResidualProcess(datasets[i::workers])
+                         for i in range(workers)]
+        elif ThreadPoolExecutor is None:
+            _larch.writer.write("feffit: concurrent.futures not available, using workers=1\n")
+        else:
+            executors = [ResidualThread(datasets[i::workers])
+                         for i in range(workers)]
+
     fit = Minimizer(_resid, params,
                     fcn_kws=dict(datasets=datasets,
-                                 paramgroup=paramgroup),
+                                 paramgroup=paramgroup,
+                                 executors=executors, _larch=_larch),
                     scale_covar=True, **kws)
 
-    result = fit.leastsq()
+    try:
+        result = fit.leastsq()
+    finally:
+        if executors is not None:
+            for ex in executors:
+                ex.shutdown()
 
     params2group(result.params, paramgroup)
     dat = concatenate([d._residual(paramgroup, data_only=True) for d in datasets])
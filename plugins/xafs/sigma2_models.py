@@ -5,6 +5,7 @@ import ctypes
 import numpy as np
 from larch import ValidateLarchPlugin
 from larch.larchlib import get_dll
+from larch.utils import LRUCache
 
 from larch_plugins.xray import atomic_mass
 import scipy.constants as consts
@@ -16,6 +17,11 @@ EINS_FACTOR = 1.e20*consts.hbar**2/(2*consts.k*consts.atomic_mass)
 
 FEFF6LIB = None
 
+# cache of correlated Debye sigma2 values, keyed by
+# (path geometry, rnorm, t, theta)
+SIGMA2_CACHE_SIZE = 1024
+_sigma2_cache = LRUCache(maxsize=SIGMA2_CACHE_SIZE)
+
 @ValidateLarchPlugin
 def sigma2_eins(t, theta, path=None, _larch=None):
     """calculate sigma2 for a Feff Path wih the einstein model
@@ -70,6 +76,10 @@ def sigma2_debye(t, theta, path=None, _larch=None):
 
     if path is None, the 'current path'
     (_sys.fiteval.symtable._feffdat) is used.
+
+    Values are cached for each path geometry, t, and theta, so that
+    repeated calls with unchanged values (as in a fit where t and
+    theta are not varied) do not recalculate sigma2.
     """
     feffpath = None
     if path is not None:
@@ -89,15 +99,17 @@ def sigma2_debye(t, theta, path=None, _larch=None):
 
     natoms = len(feffpath.geom)
     rnorm  = feffpath.rnorman
-    atomx, atomy, atomz, atomm = [], [], [], []
-    for sym, iz, ipot, am, x, y, z in feffpath.geom:
-        atomx.append(x)
-        atomy.append(y)
-        atomz.append(z)
-        atomm.append(am)
-
-    return sigma2_correldebye(natoms, tempk, thetad, rnorm,
+    geom = tuple((am, x, y, z) for sym, iz, ipot, am, x, y, z in feffpath.geom)
+    key = (geom, rnorm, tempk, thetad)
+    sig2 = _sigma2_cache.get(key, None)
+    if sig2 is not None:
+        return sig2
+
+    atomm, atomx, atomy, atomz = zip(*geom)
+    sig2 = sigma2_correldebye(natoms, tempk, thetad, rnorm,
                               atomx, atomy, atomz, atomm)
+    _sigma2_cache[key] = sig2
+    return sig2
 
 def sigma2_correldebye(natoms, tk, theta, rnorm, x, y, z, atwt):
     """
@@ -171,37 +183,30 @@ def sigma2_correldebye_py(natoms, tk, theta, rnorm, x, y, z, atwt):
     copyright 1993  university of washington
                     john rehr, steve zabinsky, matt newville
     """
-    sig2 = 0.0
-    for i0 in range(natoms):
-        i1 = (i0 + 1) % natoms
-        for j0 in range(i0, natoms):
-            j1 = (j0 + 1) %  natoms
-            # calculate r_i-r_i-1 and r_j-r_j-1 and the rest of the
-            # distances, and get the partial cosine term:
-            #   cosine(i,j) = r_i.r_j / ((r_i0- r_i-1) * (r_j - r_j-1))
-            ri0j0  = dist(x[i0], y[i0], z[i0], x[j0], y[j0], z[j0])
-            ri1j1  = dist(x[i1], y[i1], z[i1], x[j1], y[j1], z[j1])
-            ri0j1  = dist(x[i0], y[i0], z[i0], x[j1], y[j1], z[j1])
-            ri1j0  = dist(x[i1], y[i1], z[i1], x[j0], y[j0], z[j0])
-            ri0i1  = dist(x[i0], y[i0], z[i0], x[i1], y[i1], z[i1])
-            rj0j1  = dist(x[j0], y[j0], z[j0], x[j1], y[j1], z[j1])
-            ridotj = ( (x[i0] - x[i1]) * (x[j0] - x[j1]) +
-                       (y[i0] - y[i1]) * (y[j0] - y[j1]) +
-                       (z[i0] - z[i1]) * (z[j0] - z[j1]) )
-
-            #  call corrfn to get the correlations between atom pairs
-            ci0j0 = corrfn(ri0j0, theta, tk, atwt[i0], atwt[j0], rnorm)
-            ci1j1 = corrfn(ri1j1, theta, tk, atwt[i1], atwt[j1], rnorm)
-            ci0j1 = corrfn(ri0j1, theta, tk, atwt[i0], atwt[j1], rnorm)
-            ci1j0 = corrfn(ri1j0, theta, tk, atwt[i1], atwt[j0], rnorm)
-
-            # combine outputs of corrfn to give the debye-waller factor for
-            # this atom pair. !! note: don't double count (i.eq.j) terms !!!
-            sig2ij = ridotj*(ci0j0 + ci1j1 - ci0j1 - ci1j0)/(ri0i1*rj0j1)
-            if j0 == i0:
-                sig2ij /= 2.0
-            sig2 += sig2ij
-
+    x, y, z = (np.asarray(v, dtype='float64')[:natoms] for v in (x, y, z))
+    atwt = np.asarray(atwt, dtype='float64')[:natoms]
+
+    # all pairs (i0, j0) with j0 >= i0, and the following atoms i1, j1
+    i0, j0 = np.triu_indices(natoms)
+    i1 = (i0 + 1) % natoms
+    j1 = (j0 + 1) % natoms
+
+    # distance matrix, and r_i-r_i-1 . r_j-r_j-1 for each pair
+    pos  = np.array((x, y, z)).T
+    dmat = np.sqrt(((pos[:, None, :] - pos[None, :, :])**2).sum(axis=2))
+    ridotj = ((pos[i0] - pos[i1]) * (pos[j0] - pos[j1])).sum(axis=1)
+
+    #  correlations between atom pairs, for all pairs at once
+    iatom = np.array((i0, i1, i0, i1))
+    jatom = np.array((j0, j1, j1, j0))
+    ci0j0, ci1j1, ci0j1, ci1j0 = corrfn(dmat[iatom, jatom], theta, tk,
+                                        atwt[iatom], atwt[jatom], rnorm)
+
+    # combine outputs of corrfn to give the debye-waller factor for
+    # each atom pair. !! note: don't double count (i.eq.j) terms !!!
+    sig2ij = ridotj*(ci0j0 + ci1j1 - ci0j1 - ci1j0)/(dmat[i0, i1]*dmat[j0, j1])
+    sig2ij[i0 == j0] /= 2.0
+    sig2 = sig2ij.sum()
     return sig2/2.0
 
 
@@ -268,18 +273,22 @@ def debfun(w, rx, tx):
                     john rehr, steve zabinsky, matt newville
 
     debfun = (sin(w*rx)/rx) * coth(w*tx/2)
+
+    w and rx can be arrays that broadcast together.
     """
-    # print(" debfun ", w, rx, tx)
     wmin = 1.e-20
     argmax = 50.0
-    result = 2.0 / tx
+    w, rx = np.broadcast_arrays(np.asarray(w, dtype='float64'),
+                                np.asarray(rx, dtype='float64'))
+    rx_ok = rx > 0
+    result = np.where(rx_ok, np.sin(w*rx) / np.where(rx_ok, rx, 1.0), w)
+    emwt = np.exp(-np.minimum(w*tx, argmax))
     #  allow t = 0 without bombing
-    if w > wmin:
-        result = w
-        if rx > 0:
-            result = np.sin(w*rx) / rx
-        emwt = np.exp( -min(w*tx, argmax))
-        result *=  (1 + emwt) / (1 - emwt)
+    wbig = w > wmin
+    result = np.where(wbig, result*(1 + emwt)/np.where(wbig, 1 - emwt, 1.0),
+                      2.0 / tx)
+    if result.ndim == 0:
+        result = float(result)
     return result
 
 def debint(rx, tx):
@@ -294,32 +303,45 @@ def debint(rx, tx):
     by trapezoidal rule and binary refinement  (romberg integration)
     coded by j rehr (10 feb 92)   see, e.g., numerical recipes
     for discussion and a much fancier version
+
+    rx can be an array, in which case each integral is refined
+    until it converges, as for a scalar rx.
     """
     MAXITER = 12
     tol = 1.e-9
+    rx = np.asarray(rx, dtype='float64')
+    shape = rx.shape
+    # many atom pairs share a distance: integrate each one once
+    rx, irx = np.unique(rx, return_inverse=True)
     itn = 1
     step = 1.0
-    result = 0.0
-    bo = bn = (debfun(0.0, rx, tx) + debfun(1.0, rx, tx))/2.0
+    bo = (debfun(0.0, rx, tx) + debfun(1.0, rx, tx))/2.0
+    bn = bo.copy()
+    result = bo.copy()
+    active = np.ones(len(rx), dtype=bool)
     for iter in range(MAXITER):
         #  nth iteration
         #   b_n+1=(b_n)/2+deln*sum_0^2**n f([2n-1]deln)
         step = step / 2.
-        sum = 0
-        for i in range(itn):
-            sum += debfun(step*(2*i + 1), rx, tx)
+        w = step*(2*np.arange(itn) + 1)
+        sum = debfun(w[None, :], rx[active, None], tx).sum(axis=1)
         itn  = 2*itn
         #  bnp1=b_n+1 is current value of integral
         #  cancel leading error terms b=[4b-bn]/3
         #  note: this is the first term in the neville table - remaining
         #        errors were found too small to justify the added code
-        bnp1   = step * sum + (bn / 2.0)
-        result = (4 * bnp1 - bn) / 3.0
-        if (abs( (result - bo) / result) < tol):
+        bnp1 = step * sum + (bn[active] / 2.0)
+        res  = (4 * bnp1 - bn[active]) / 3.0
+        result[active] = res
+        done = abs((res - bo[active]) / res) < tol
+        bn[active] = bnp1
+        bo[active] = res
+        active[np.where(active)[0][done]] = False
+        if not active.any():
             break
-        bn = bnp1
-        bo = result
-    return result
+    if len(shape) == 0:
+        return float(result[0])
+    return result[irx].reshape(shape)
 
 def registerLarchPlugin():
     return ('_xafs', {'sigma2_eins': sigma2_eins,
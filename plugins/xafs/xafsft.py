@@ -2,11 +2,14 @@
 """
   XAFS Fourier transforms
 """
+from threading import local, Lock
+from collections import OrderedDict
 import numpy as np
 from numpy import (pi, arange, zeros, ones, sin, cos,
                    exp, log, sqrt, where, interp, linspace)
 # from numpy.fft import fft, ifft
 from scipy.fftpack import fft, ifft
+from numpy.fft import rfft
 from scipy.special import i0 as bessel_i0
 
 from larch import (Group, ValidateLarchPlugin, Make_CallArgs,
@@ -19,6 +22,26 @@ from larch_plugins.xafs import set_xafsGroup
 MODNAME = '_xafs'
 VALID_WINDOWS = ['han', 'fha', 'gau', 'kai', 'par', 'wel', 'sin', 'bes']
 
+# most recently used FT windows, shared by all callers of ftwindow()
+FTWINDOW_CACHE_SIZE = 64
+_ftwindow_cache = OrderedDict()
+_ftwindow_lock = Lock()
+
+def _ftwindow_key(x, xmin, xmax, dx, dx2, nam):
+    """cache key for window on x, or None if x is not a uniform grid"""
+    x = np.asarray(x)
+    if x.ndim != 1 or len(x) < 2:
+        return None
+    xstep = (x[-1] - x[0]) / (len(x)-1)
+    if abs(np.diff(x) - xstep).max() > 1.e-6 * abs(xstep):
+        return None
+    return (nam, xmin, xmax, dx, dx2, x[0], xstep, len(x))
+
+def ftwindow_cache_clear():
+    """clear the cache of FT windows"""
+    with _ftwindow_lock:
+        _ftwindow_cache.clear()
+
 def ftwindow(x, xmin=None, xmax=None, dx=1, dx2=None,
              window='hanning', _larch=None, **kws):
     """
@@ -47,6 +70,9 @@ def ftwindow(x, xmin=None, xmax=None, dx=1, dx2=None,
         sine                 sine function window
         kaiser               Kaiser-Bessel function-derived window
 
+    Windows for uniform x grids are cached (up to FTWINDOW_CACHE_SIZE,
+    least recently used are discarded first), so that repeated calls
+    with the same settings return a copy of the cached window.
     """
     if window is None:
         window = VALID_WINDOWS[0]
@@ -54,6 +80,23 @@ def ftwindow(x, xmin=None, xmax=None, dx=1, dx2=None,
     if nam not in VALID_WINDOWS:
         raise RuntimeError("invalid window name %s" % window)
 
+    key = _ftwindow_key(x, xmin, xmax, dx, dx2, nam)
+    if key is None:
+        return _ftwindow(x, xmin, xmax, dx, dx2, nam)
+    with _ftwindow_lock:
+        fwin = _ftwindow_cache.pop(key, None)
+        if fwin is not None:
+            _ftwindow_cache[key] = fwin
+    if fwin is None:
+        fwin = _ftwindow(x, xmin, xmax, dx, dx2, nam)
+        with _ftwindow_lock:
+            _ftwindow_cache[key] = fwin
+            while len(_ftwindow_cache) > FTWINDOW_CACHE_SIZE:
+                _ftwindow_cache.popitem(last=False)
+    return fwin.copy()
+
+def _ftwindow(x, xmin, xmax, dx, dx2, nam):
+    """calculate FT window array, see ftwindow()"""
     dx1 = dx
     if dx2 is None:  dx2 = dx1
     if xmin is None: xmin = min(x)
@@ -293,6 +336,158 @@ def xftf_prep(k, chi, kmin=0, kmax=20, kweight=2, dk=1, dk2=None,
     win  = ftwindow(k_, xmin=kmin, xmax=kmax, dx=dk, dx2=dk2, window=window)
     return ((chi_[:npts] *k_[:npts]**kweight), win[:npts])
 
+def _interp_rows(x, xp, fp):
+    """linear interpolation of each row of 2-d fp(xp) onto x, as np.interp"""
+    xp = np.asarray(xp)
+    i1 = np.clip(np.searchsorted(xp, x), 1, len(xp)-1)
+    i0 = i1 - 1
+    frac = np.clip((x - xp[i0]) / (xp[i1] - xp[i0]), 0, 1)
+    return fp[:, i0] * (1 - frac) + fp[:, i1] * frac
+
+def _batch_rows(arr, axis, name):
+    """return 2-d array with spectra as rows"""
+    arr = np.asarray(arr)
+    if arr.ndim != 2:
+        raise ValueError("%s must be a 2-d array" % name)
+    if axis in (0, -2):
+        arr = arr.T
+    return arr
+
+@ValidateLarchPlugin
+def xftf_batch(k, chi, group=None, kmin=0, kmax=20, kweight=0, dk=1,
+               dk2=None, with_phase=False, window='kaiser', rmax_out=10,
+               nfft=2048, kstep=0.05, axis=-1, chunksize=1024,
+               _larch=None, **kws):
+    """
+    forward XAFS Fourier transform for many chi(k) spectra sharing
+    one k array, as for time-resolved (QEXAFS) data.
+
+    Parameters:
+    -----------
+      k:        1-d array of photo-electron wavenumber in Ang^-1
+      chi:      2-d array of chi, with one spectrum per row (see axis)
+      group:    output Group
+      axis:     axis of chi that matches k (-1, so one spectrum per row).
+      chunksize: number of spectra to transform with each FFT call (1024).
+
+      all other arguments are as for xftf().
+
+    Returns:
+    ---------
+      None   -- outputs are written to supplied group.
+
+    Notes:
+    -------
+    Arrays written to output group:
+        kwin               window function Omega(k) (length of k).
+        r                  uniform array of R, out to rmax_out.
+        chir               2-d complex array of chi(R), (nspectra, len(r))
+        chir_mag           magnitude of chi(R).
+        chir_re            real part of chi(R).
+        chir_im            imaginary part of chi(R).
+        chir_pha           phase of chi(R) if with_phase=True
+
+    All spectra are windowed, weighted and transformed as 2-d arrays,
+    with chunksize spectra per FFT call to limit memory use.
+    """
+    if 'kw' in kws:
+        kweight = kws['kw']
+    if dk2 is None: dk2 = dk
+
+    chi = _batch_rows(chi, axis, 'chi')
+    k = np.asarray(k)
+    npts = int(1.01 + max(k)/kstep)
+    k_max = max(max(k), kmax+dk2)
+    k_ = kstep * np.arange(int(1.01+k_max/kstep), dtype='float64')
+    win = ftwindow(k_, xmin=kmin, xmax=kmax, dx=dk, dx2=dk2, window=window)
+    kwin = (k_**kweight * win)[:npts]
+
+    rstep = pi/(kstep*nfft)
+    irmax = int(min(nfft/2, int(1.01 + rmax_out/rstep)))
+    out = zeros((chi.shape[0], irmax), dtype='complex128')
+    for i in range(0, chi.shape[0], chunksize):
+        chi_ = _interp_rows(k_[:npts], k, chi[i:i+chunksize])
+        out[i:i+chunksize] = xftf_fast(chi_*kwin, kstep=kstep,
+                                       nfft=nfft)[:, :irmax]
+
+    group = set_xafsGroup(group, _larch=_larch)
+    group.kwin = win[:len(k)]
+    group.r    = rstep * arange(irmax)
+    group.chir = out
+    group.chir_mag = abs(out)
+    group.chir_re  = out.real
+    group.chir_im  = out.imag
+    if with_phase:
+        group.chir_pha = complex_phase(out)
+
+@ValidateLarchPlugin
+def xftr_batch(r, chir, group=None, rmin=0, rmax=20, with_phase=False,
+               dr=1, dr2=None, rw=0, window='kaiser', qmax_out=None,
+               nfft=2048, kstep=0.05, axis=-1, chunksize=1024,
+               _larch=None, **kws):
+    """
+    reverse XAFS Fourier transform for many chi(R) spectra sharing
+    one r array, as from xftf_batch().
+
+    Parameters:
+    ------------
+      r:        1-d array of distance, on a uniform grid.
+      chir:     2-d array of chi(R), with one spectrum per row (see axis)
+      group:    output Group
+      axis:     axis of chir that matches r (-1, so one spectrum per row).
+      chunksize: number of spectra to transform with each FFT call (1024).
+
+      all other arguments are as for xftr().
+
+    Returns:
+    ---------
+      None -- outputs are written to supplied group.
+
+    Notes:
+    -------
+    Arrays written to output group:
+        rwin               window Omega(R) (length of r).
+        q                  uniform array of k, out to qmax_out.
+        chiq               2-d complex array of chi(q), (nspectra, len(q))
+        chiq_mag           magnitude of chi(q).
+        chiq_re            real part of chi(q).
+        chiq_im            imaginary part of chi(q).
+        chiq_pha           phase of chi(q) if with_phase=True
+    """
+    if 'rweight' in kws:
+        rw = kws['rweight']
+
+    chir = _batch_rows(chir, axis, 'chir')
+    nr = chir.shape[1]
+    rstep = r[1] - r[0]
+    kstep = pi/(rstep*nfft)
+    scale = 1.0
+    if np.iscomplexobj(chir):
+        scale = 0.5
+
+    r_  = rstep * arange(nfft, dtype='float64')
+    win = ftwindow(r_, xmin=rmin, xmax=rmax, dx=dr, dx2=dr2, window=window)
+    rwin = (win * r_**rw)[:nr]
+
+    if qmax_out is None: qmax_out = 30.0
+    q = linspace(0, qmax_out, int(1.05 + qmax_out/kstep))
+    nkpts = min(len(q), int(nfft/2))
+    out = zeros((chir.shape[0], nkpts), dtype='complex128')
+    for i in range(0, chir.shape[0], chunksize):
+        out[i:i+chunksize] = scale * xftr_fast(chir[i:i+chunksize]*rwin,
+                                               kstep=kstep,
+                                               nfft=nfft)[:, :nkpts]
+
+    group = set_xafsGroup(group, _larch=_larch)
+    group.q = q[:nkpts]
+    group.rwin = win[:nr]
+    group.chiq = out
+    group.chiq_mag = abs(out)
+    group.chiq_re  = out.real
+    group.chiq_im  = out.imag
+    if with_phase:
+        group.chiq_pha = complex_phase(out)
+
 def xftf_fast(chi, nfft=2048, kstep=0.05, _larch=None, **kws):
     """
     calculate forward XAFS Fourier transform.  Unlike xftf(),
@@ -313,10 +508,15 @@ def xftf_fast(chi, nfft=2048, kstep=0.05, _larch=None, **kws):
     --------
       complex 1-d array chi(R)
 
+    A 2-d array of chi is transformed along its last axis, giving
+    a complex 2-d array with one chi(R) for each row.
     """
-    cchi = zeros(nfft, dtype='complex128')
-    cchi[0:len(chi)] = chi
-    return (kstep / sqrt(pi)) * fft(cchi)[:int(nfft/2)]
+    chi = np.asarray(chi)
+    if np.isrealobj(chi):
+        return (kstep / sqrt(pi)) * rfft(chi, n=nfft, axis=-1)[..., :int(nfft/2)]
+    cchi = zeros(chi.shape[:-1] + (nfft,), dtype='complex128')
+    cchi[..., 0:chi.shape[-1]] = chi
+    return (kstep / sqrt(pi)) * fft(cchi, axis=-1)[..., :int(nfft/2)]
 
 def xftr_fast(chir, nfft=2048, kstep=0.05, _larch=None, **kws):
     """
@@ -338,10 +538,71 @@ def xftr_fast(chir, nfft=2048, kstep=0.05, _larch=None, **kws):
       complex 1-d array for chi(q).
 
     This is useful for repeated FTs, as inside loops.
+
+    A 2-d array of chi(R) is transformed along its last axis, giving
+    a complex 2-d array with one chi(q) for each row.
+    """
+    chir = np.asarray(chir)
+    cchi = zeros(chir.shape[:-1] + (nfft,), dtype='complex128')
+    cchi[..., 0:chir.shape[-1]] = chir
+    return  (4*sqrt(pi)/kstep) * ifft(cchi, axis=-1)[..., :int(nfft/2)]
+
+class FTContext(object):
+    """
+    Context for repeated fast XAFS Fourier transforms with a fixed
+    nfft and kstep, as inside fitting loops.
+
+    The xftf() and xftr() methods give the same results as xftf_fast()
+    and xftr_fast(), but copy the 1-d input into zero-padded work
+    buffers that are kept between calls instead of allocating new
+    ones, and use a real-input FFT when the input is real.  The FFT
+    setup for nfft is cached by the FFT libraries themselves.
+
+    Work buffers are kept per thread, so one FTContext can be shared
+    by threads.
     """
-    cchi = zeros(nfft, dtype='complex128')
-    cchi[0:len(chir)] = chir
-    return  (4*sqrt(pi)/kstep) * ifft(cchi)[:int(nfft/2)]
+    def __init__(self, nfft=2048, kstep=0.05):
+        self.nfft = int(nfft)
+        self.kstep = kstep
+        self.fscale = kstep / sqrt(pi)
+        self.rscale = 4*sqrt(pi)/kstep
+        self._local = local()
+
+    def __repr__(self):
+        return '<FTContext: nfft=%d, kstep=%g>' % (self.nfft, self.kstep)
+
+    def _buffer(self, dtype, npts):
+        """return zero-padded work buffer for npts of input"""
+        buffs = self._local.__dict__
+        if dtype not in buffs:
+            buffs[dtype] = (zeros(self.nfft, dtype=dtype), self.nfft)
+        buff, nlast = buffs[dtype]
+        if npts < nlast:
+            buff[npts:nlast] = 0
+        buffs[dtype] = (buff, npts)
+        return buff
+
+    def xftf(self, chi):
+        """forward XAFS FT, as xftf_fast(chi, nfft=nfft, kstep=kstep)"""
+        chi = np.asarray(chi)
+        if chi.ndim != 1 or len(chi) > self.nfft:
+            return xftf_fast(chi, nfft=self.nfft, kstep=self.kstep)
+        if np.isrealobj(chi):
+            buff = self._buffer('float64', len(chi))
+            buff[:len(chi)] = chi
+            return self.fscale * rfft(buff)[:self.nfft//2]
+        buff = self._buffer('complex128', len(chi))
+        buff[:len(chi)] = chi
+        return self.fscale * fft(buff)[:self.nfft//2]
+
+    def xftr(self, chir):
+        """reverse XAFS FT, as xftr_fast(chir, nfft=nfft, kstep=kstep)"""
+        chir = np.asarray(chir)
+        if chir.ndim != 1 or len(chir) > self.nfft:
+            return xftr_fast(chir, nfft=self.nfft, kstep=self.kstep)
+        buff = self._buffer('complex128', len(chir))
+        buff[:len(chir)] = chir
+        return self.rscale * ifft(buff)[:self.nfft//2]
 
 
 def registerLarchPlugin():
@@ -350,5 +611,7 @@ def registerLarchPlugin():
                       'xftf_prep': xftf_prep,
                       'xftf_fast': xftf_fast,
                       'xftr_fast': xftr_fast,
+                      'xftf_batch': xftf_batch,
+                      'xftr_batch': xftr_batch,
                       'ftwindow': ftwindow,
                       })
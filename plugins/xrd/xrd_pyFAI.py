@@ -7,6 +7,7 @@ mkak 2017.03.14
 
 ##########################################################################
 # IMPORT PYTHON PACKAGES
+import os
 import numpy as np
 
 HAS_pyFAI = False
@@ -20,6 +21,25 @@ except ImportError:
 ##########################################################################
 # FUNCTIONS
 
+_integrators = {}
+
+def get_integrator(calfile):
+    '''
+    return pyFAI AzimuthalIntegrator for a poni calibration file, cached
+    for each calibration file (and its modification time), so that the
+    integrator and its look-up tables are re-used for every frame and row
+    '''
+    try:
+        key = (os.path.abspath(calfile), os.stat(calfile).st_mtime)
+    except (OSError, TypeError):
+        return pyFAI.load(calfile)
+    if key not in _integrators:
+        for oldkey in list(_integrators.keys()):
+            if oldkey[0] == key[0]:
+                _integrators.pop(oldkey)
+        _integrators[key] = pyFAI.load(calfile)
+    return _integrators[key]
+
 def read_lambda(calfile):
     
     ai = pyFAI.load(calfile)
@@ -31,7 +51,8 @@ def integrate_xrd_row(rowxrd2d, calfile, unit='q', steps=10001, wedge=1,
     '''
     Uses pyFAI (poni) calibration file to produce 1D XRD data from a row of 2D XRD images 
 
-    Must provide pyFAI calibration file
+    Must provide pyFAI calibration file; the integrator for each calibration
+    file is cached, so rows can also be integrated in batches of images
     
     rowxrd2d : 2D diffraction images for integration
     calfile  : poni calibration file
@@ -44,7 +65,7 @@ def integrate_xrd_row(rowxrd2d, calfile, unit='q', steps=10001, wedge=1,
     '''
     if HAS_pyFAI:
         try:
-            ai = pyFAI.load(calfile)
+            ai = get_integrator(calfile)
         except:
             print('Provided calibration file could not be loaded.')
             return
@@ -1,10 +1,15 @@
 from .configfile import FastMapConfig
 from .xsp3_hdf5 import read_xsp3_hdf5
 from .xrf_netcdf import read_xrf_netcdf
-from .xrd_netcdf import read_xrd_netcdf
-from .xrd_hdf5 import read_xrd_hdf5
+from .xrd_netcdf import read_xrd_netcdf, XRDFramesNetCDF
+from .xrd_hdf5 import read_xrd_hdf5, XRDFramesHDF5
 from .asciifiles import (readASCII, readMasterFile, readROIFile,
                          readEnvironFile, read1DXRDFile, parseEnviron)
+from .xrm_storage import (STORAGE_PROFILES, mca_chunks, mca_storage,
+                          repack_xrmmap, benchmark_xrmmap)
+from .xrm_watcher import MapFolderWatcher
 from .xrm_mapfile import (read_xrfmap, h5str,
-                          GSEXRM_MapFile, GSEXRM_FileStatus,
+                          GSEXRM_MapFile, GSEXRM_FileStatus, isGSEXRM_MapFolder,
                           GSEXRM_Exception, GSEXRM_NotOwner)
+from .xrm_batch import (find_mapfolders, convert_mapfolder,
+                        convert_mapfolders, report_conversion)
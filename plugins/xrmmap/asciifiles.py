@@ -10,10 +10,15 @@ if sys.version[0] == '2':
 elif sys.version[0] == '3':
     from configparser import  ConfigParser
 
-def readASCII(fname, nskip=0, isnumeric=True):
+def readASCII(fname, nskip=0, isnumeric=True, complete_lines=False):
+    """read ASCII data file, returning header and data.
+    with complete_lines=True, an unterminated last line,
+    as for a file still being written, is skipped"""
     dat, header = [], []
     with open(fname,'r') as fh:
         lines = fh.readlines()
+    if complete_lines and len(lines) > 0 and not lines[-1].endswith('\n'):
+        lines.pop()
     for line in lines:
         if line.startswith('#') or line.startswith(';'):
             header.append(line[:-1])
@@ -31,7 +36,7 @@ def readASCII(fname, nskip=0, isnumeric=True):
     return header, dat
 
 def readMasterFile(fname):
-    return readASCII(fname, nskip=0, isnumeric=False)
+    return readASCII(fname, nskip=0, isnumeric=False, complete_lines=True)
 
 def readEnvironFile(fname):
     h, d = readASCII(fname, nskip=0, isnumeric=False)
@@ -27,6 +27,30 @@ def read_xrd_hdf5(fname, verbose=False, _larch=None):
 
     return xrd_data
 
+class XRDFramesHDF5(object):
+    '''lazy access to the frames of a HDF5 file created for XRD mapping,
+    reading frames in batches as needed'''
+    path = 'entry/instrument/detector/data'
+
+    def __init__(self, fname):
+        self.fname = fname
+        with h5py.File(fname, 'r') as h5file:
+            shape = h5file[self.path].shape
+        ## Forces data into 3D shape
+        if len(shape) == 2:
+            shape = (1, shape[0], shape[1])
+        self.shape = shape
+
+    def iter_frames(self, batchsize=8):
+        '''iterate over frames in batches, yielding (index, frames)'''
+        with h5py.File(self.fname, 'r') as h5file:
+            xrd_data = h5file[self.path]
+            if len(xrd_data.shape) == 2:
+                yield 0, xrd_data.value.reshape(self.shape)
+                return
+            for i in range(0, self.shape[0], batchsize):
+                yield i, xrd_data[i:i+batchsize]
+
 def test_read(fname):
     print( fname,  os.stat(fname))
     fd = read_xrd_hdf5(fname, verbose=True)
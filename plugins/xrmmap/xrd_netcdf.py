@@ -37,6 +37,31 @@ def read_xrd_netcdf(fname,verbose=False): #npixels=self.nrows_expected
 
     return xrd_data
 
+class XRDFramesNetCDF(object):
+    '''lazy access to the frames of a netCDF file created for XRD mapping,
+    reading frames in batches as needed from the memory-mapped file'''
+    def __init__(self, fname):
+        self.fname = fname
+        xrd_file = netcdf_open(fname, 'r')
+        shape = xrd_file.variables['array_data'].shape
+        xrd_file.close()
+        ## Forces data into 3D shape
+        if len(shape) == 2:
+            shape = (1, shape[0], shape[1])
+        self.shape = shape
+
+    def iter_frames(self, batchsize=8):
+        '''iterate over frames in batches, yielding (index, frames)'''
+        xrd_file = netcdf_open(self.fname, 'r')
+        try:
+            xrd_data = xrd_file.variables['array_data'].data
+            xrd_data = xrd_data.reshape(self.shape)
+            for i in range(0, self.shape[0], batchsize):
+                yield i, xrd_data[i:i+batchsize].astype('uint16')
+        finally:
+            xrd_data = None
+            xrd_file.close()
+
 def test_read(fname):
     print( fname,  os.stat(fname))
     fd = read_xrd_netcdf(fname, verbose=True)
@@ -64,6 +64,77 @@ class xMAPData(object):
 
 CLOCKTICK = 0.320  # xmap clocktick = 320 ns
 
+def decode_xmap_buffers(array_data):
+    """decode xMAP mapping mode buffers into an xMAPData object
+
+    array_data is the array of int16 buffer words, as from the
+    'array_data' variable of a netCDF file, normally with shape
+    (narrays, nmodules, buffersize).  Each buffer holds a 256 word
+    buffer header followed by pixel blocks, each with a 256 word
+    pixel header, 4 channels of times and i/o counts (as longs in
+    words 32:64), and the spectra (or ROIs) for 4 channels.
+
+    All pixel blocks are decoded at once, as a (narrays, nmodules,
+    npixels, blocksize) view of the buffer words.
+    """
+    data = np.asarray(array_data)
+    # force the data to be 3d: nmodules and narrays could be 1
+    if data.ndim == 1:
+        data = data.reshape((1, 1, data.shape[0]))
+    elif data.ndim == 2:
+        data = data.reshape((1, data.shape[0], data.shape[1]))
+
+    narrays, nmodules, buffersize = data.shape
+    modpixs = max(124, data[0, 0, 8])
+    blocksize = (buffersize-256)//modpixs
+    blocks = data[:, :, 256:256+modpixs*blocksize].reshape(
+        (narrays, nmodules, modpixs, blocksize))
+
+    # mapping mode (1=Full spectrum, 2=Multiple ROI) from first pixel,
+    # number of pixels in each array from the module 0 buffer header
+    mapmode = blocks[0, 0, 0, 3]
+    if mapmode == 1:  # mapping, full spectra
+        nchans = data[0, 0, 20]
+        data_slice = slice(256, 256+4*nchans)
+    elif mapmode == 2:  # ROI mode
+        # Note:  nchans = number of ROIS !!
+        nchans = max(data[0, 0, 264:268])
+        data_slice = slice(64, 64+8*nchans)
+    npix_array = np.minimum(data[:, 0, 8], modpixs)
+    valid = np.arange(modpixs)[None, :] < npix_array[:, None]
+    npix_total = int(valid.sum())
+
+    def pixel_rows(arr):
+        """(narrays, nmodules, modpixs, ...) array to
+        (npixels, nmodules, ...) array of valid pixels"""
+        return arr.swapaxes(1, 2)[valid]
+
+    def aslongs(arr):
+        """view pairs of words along last axis as longs, low word first"""
+        return np.ascontiguousarray(arr, dtype=np.int16).view(np.int32)
+
+    ndet = 4*nmodules
+    xmapdat = xMAPData(0, nmodules, nchans)
+    xmapdat.firstPixel = aslongs(data[0, 0, 9:11])[0]
+    xmapdat.numPixels = npix_total
+
+    # acquistion times and i/o counts data are stored
+    # as longs in locations 32:64
+    times = pixel_rows(aslongs(blocks[..., 32:64])).reshape(
+        (npix_total, ndet, 4))
+    xmapdat.realTime     = CLOCKTICK * times[:, :, 0].astype('i8')
+    xmapdat.liveTime     = CLOCKTICK * times[:, :, 1].astype('i8')
+    xmapdat.inputCounts  = times[:, :, 2].astype('i4')
+    xmapdat.outputCounts = times[:, :, 3].astype('i4')
+
+    # the data, extracted as per data_slice and mapmode
+    counts = blocks[..., data_slice]
+    if mapmode == 2:
+        counts = aslongs(counts)
+    counts = pixel_rows(counts).reshape((npix_total, ndet, nchans))
+    xmapdat.counts = counts.astype('i2')
+    return xmapdat
+
 def read_xrf_netcdf(fname, npixels=None, verbose=False):
     # Reads a netCDF file created with the DXP xMAP driver
     # with the netCDF plugin buffers
@@ -91,75 +162,14 @@ def read_xrf_netcdf(fname, npixels=None, verbose=False):
 
     array_data = fh.variables['array_data']
     t1 = time.time()
-
-    # array_data will normally be 3d:
-    #  shape = (narrays, nmodules, buffersize)
-    # but nmodules and narrays could be 1, so that
-    # array_data could be 1d or 2d.
-    #
-    # here we force the data to be 3d
-    shape = array_data.shape
-    if len(shape) == 1:
-        array_data.shape = (1, 1, shape[0])
-    elif len(shape) == 2:
-        array_data.shape = (1, shape[0], shape[1])
-
-    narrays, nmodules, buffersize = array_data.shape
-    modpixs    = max(124, array_data[0, 0, 8])
-    npix_total = 0
-    # real / live times are returned in microseconds.
-    for array in range(narrays):
-        for module in range(nmodules):
-            d   = array_data[array,module, :]
-            bh  = xMAPBufferHeader(d)
-            #if verbose and array==0:
-            dat = d[256:].reshape(modpixs, (d.size-256)/modpixs )
-
-            npix = bh.numPixels
-            if module == 0:
-                npix_total += npix
-                if array == 0:
-                    # first time through, (array,module)=(0,0) we
-                    # read mapping mode, set up how to slice the
-                    # data, and build data arrays in xmapdat
-                    mapmode = dat[0, 3]
-                    if mapmode == 1:  # mapping, full spectra
-                        nchans = d[20]
-                        data_slice = slice(256, 8448)
-                    elif mapmode == 2:  # ROI mode
-                        # Note:  nchans = number of ROIS !!
-                        nchans     = max(d[264:268])
-                        data_slice = slice(64, 64+8*nchans)
-                    xmapdat = xMAPData(narrays*modpixs, nmodules, nchans)
-                    xmapdat.firstPixel = bh.startingPixel
-
-            # acquistion times and i/o counts data are stored
-            # as longs in locations 32:64
-            t_times = aslong(dat[:npix, 32:64]).reshape(npix, 4, 4)
-            p1 = npix_total - npix
-            p2 = npix_total
-            xmapdat.realTime[p1:p2, :]     = t_times[:, :, 0]
-            xmapdat.liveTime[p1:p2, :]     = t_times[:, :, 1]
-            xmapdat.inputCounts[p1:p2, :]  = t_times[:, :, 2]
-            xmapdat.outputCounts[p1:p2, :] = t_times[:, :, 3]
-
-            # the data, extracted as per data_slice and mapmode
-            t_data = dat[:npix, data_slice]
-            if mapmode == 2:
-                t_data = aslong(t_data)
-            xmapdat.counts[p1:p2, :, :] = t_data.reshape(npix, 4, nchans)
-
+    xmapdat = decode_xmap_buffers(array_data.data)
     t2 = time.time()
-    xmapdat.numPixels = npix_total
-    xmapdat.counts    = xmapdat.counts[:npix_total]
-    xmapdat.realTime = CLOCKTICK * xmapdat.realTime[:npix_total]
-    xmapdat.liveTime = CLOCKTICK * xmapdat.liveTime[:npix_total]
-    xmapdat.inputCounts  = xmapdat.inputCounts[:npix_total]
-    xmapdat.outputCounts = xmapdat.outputCounts[:npix_total]
+    # drop references to the (memory-mapped) data before closing
+    del array_data
     if verbose:
         print('   time to read file    = %5.1f ms' % ((t1-t0)*1000))
         print('   time to extract data = %5.1f ms' % ((t2-t1)*1000))
-        print('   read %i pixels ' %  npix_total)
+        print('   read %i pixels ' %  xmapdat.numPixels)
         print('   data shape:    ' ,  xmapdat.counts.shape)
     fh.close()
     return xmapdat
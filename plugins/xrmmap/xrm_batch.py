@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""
+Batch conversion of raw XRM Map folders to XRM Map HDF5 files,
+with one map file per worker process.
+
+Partially converted map files are resumed from their Last_Row, and
+map files owned by another process (see GSEXRM_MapFile.check_hostid)
+are skipped unless ownership is claimed.
+"""
+import os
+import time
+import glob
+try:
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+except ImportError:
+    ProcessPoolExecutor = None
+
+from larch_plugins.xrmmap import (FastMapConfig, GSEXRM_MapFile,
+                                  isGSEXRM_MapFolder)
+from larch_plugins.xrmmap.xrm_watcher import row_files
+
+def find_mapfolders(folders):
+    """list of raw map folders from a list of folder names or glob
+    patterns, skipping repeated folders and non-map folders"""
+    if isinstance(folders, str):
+        folders = [folders]
+    out = []
+    for pattern in folders:
+        for folder in sorted(glob.glob(pattern)) or [pattern]:
+            folder = os.path.abspath(folder)
+            if folder not in out and isGSEXRM_MapFolder(folder):
+                out.append(folder)
+    return out
+
+def mapfolder_filename(folder, outdir=None):
+    """name of XRM Map file for a raw map folder, from its Scan file,
+    in outdir [default: current directory]"""
+    cfile = FastMapConfig()
+    cfile.Read(os.path.join(folder, GSEXRM_MapFile.ScanFile))
+    fname = os.path.basename(cfile.config['scan']['filename'])
+    if not fname.endswith('.h5'):
+        fname = "%s.h5" % fname
+    if outdir is None:
+        outdir = os.getcwd()
+    return os.path.join(os.path.abspath(outdir), fname)
+
+def _rowdata_bytes(folder, rows):
+    "size of raw data files for rows of Master file"
+    nbytes = 0
+    for row in rows:
+        required, optional = row_files(row)
+        for fname in required + optional:
+            try:
+                nbytes += os.stat(os.path.join(folder, fname)).st_size
+            except OSError:
+                pass
+    return nbytes
+
+def _new_result(folder, filename=None, error=None):
+    "result for convert_mapfolder(), as for a failed conversion"
+    return {'folder': folder, 'filename': filename, 'status': 'failed',
+            'first_row': 0, 'last_row': -1, 'nrows': 0, 'time': 0.0,
+            'rows_per_sec': 0.0, 'mbytes': 0.0, 'mbytes_per_sec': 0.0,
+            'error': error}
+
+def convert_mapfolder(folder, outdir=None, claim=False, maxrow=None,
+                      verbose=False, filename=None, **kws):
+    """convert a raw map folder to an XRM Map file, resuming from the
+    last row converted if the map file exists.
+
+    Parameters
+    ----------
+    folder :   name of raw map folder
+    outdir :   folder for map file [current directory]
+    claim :    whether to claim ownership of map files owned by
+               another process [False]
+    maxrow :   maximum number of rows to convert [None, all rows]
+    verbose :  whether to print progress for each row [False]
+    filename : name of map file [None, from mapfolder_filename()]
+    kws :      other keywords for GSEXRM_MapFile, such as storage
+               and compression
+
+    Returns
+    -------
+    dict with folder, filename, status, first_row and last_row
+    converted, nrows, time, rows_per_sec, mbytes of raw data read,
+    mbytes_per_sec, and error message.  status is one of 'converted',
+    'complete' (no new rows), 'not owner', or 'failed'
+    """
+    out = _new_result(folder)
+    t0 = time.time()
+    xrmfile = None
+    try:
+        if filename is None:
+            filename = mapfolder_filename(folder, outdir=outdir)
+        xrmfile = GSEXRM_MapFile(filename=filename, folder=folder, **kws)
+        out['filename'] = xrmfile.filename
+        if not xrmfile.check_hostid():
+            if not claim:
+                out['status'] = 'not owner'
+                return out
+            xrmfile.claim_hostid()
+        first_row = xrmfile.last_row + 1
+        t0 = time.time()
+        xrmfile.process(maxrow=maxrow, verbose=verbose)
+        dt = max(time.time() - t0, 1.e-6)
+        nrows = xrmfile.last_row + 1 - first_row
+        rows = xrmfile.rowdata[first_row:xrmfile.last_row+1]
+        mbytes = _rowdata_bytes(folder, rows)/1.e6
+        out.update({'status': 'converted' if nrows > 0 else 'complete',
+                    'first_row': first_row, 'last_row': xrmfile.last_row,
+                    'nrows': nrows, 'time': dt, 'rows_per_sec': nrows/dt,
+                    'mbytes': mbytes, 'mbytes_per_sec': mbytes/dt})
+    except Exception as exc:
+        out['error'] = '%s: %s' % (exc.__class__.__name__, exc)
+        out['time'] = time.time() - t0
+    finally:
+        if xrmfile is not None and xrmfile.h5root is not None:
+            xrmfile.close()
+    return out
+
+def report_conversion(result):
+    "one line summary of conversion result from convert_mapfolder()"
+    name = os.path.basename(result['folder'])
+    if result['status'] == 'failed':
+        return '%s: failed (%s)' % (name, result['error'])
+    if result['status'] != 'converted':
+        return '%s: %s' % (name, result['status'])
+    return ('%s: rows %i to %i in %.1f s: %.2f rows/s, %.2f MB/s' %
+            (name, result['first_row'], result['last_row'], result['time'],
+             result['rows_per_sec'], result['mbytes_per_sec']))
+
+def convert_mapfolders(folders, nproc=None, outdir=None, claim=False,
+                       maxrow=None, verbose=True, callback=None, **kws):
+    """convert raw map folders to XRM Map files, with a pool of nproc
+    processes each converting one map file at a time.
+
+    Parameters
+    ----------
+    folders :  list of raw map folders or glob patterns
+    nproc :    number of processes [None, number of CPUs]
+    outdir :   folder for map files [current directory]
+    claim :    whether to claim ownership of map files owned by
+               another process [False]
+    maxrow :   maximum number of rows to convert per map [None, all rows]
+    verbose :  whether to print a summary as each map is done [True]
+    callback : function called with the result for each map as it
+               is done [None]
+    kws :      other keywords for GSEXRM_MapFile
+
+    Returns
+    -------
+    list of results from convert_mapfolder(), in order of folders
+
+    Notes
+    -----
+    map files are named from the Scan file of each folder.  Folders
+    with the same map file name as an earlier folder are not converted,
+    and are reported as failed, as they would write to the same file.
+    """
+    folders = find_mapfolders(folders)
+    if nproc is None:
+        nproc = os.cpu_count() if hasattr(os, 'cpu_count') else 1
+    opts = dict(outdir=outdir, claim=claim, maxrow=maxrow)
+    opts.update(kws)
+
+    # find map file names before converting any folder
+    results = {}
+    filenames, owners = {}, {}
+    for folder in folders:
+        try:
+            fname = mapfolder_filename(folder, outdir=outdir)
+        except Exception:
+            # reported when converting the folder
+            filenames[folder] = None
+            continue
+        key = os.path.normcase(fname)
+        if key in owners:
+            error = "map file '%s' is also named by '%s'" % (fname,
+                                                             owners[key])
+            results[folder] = _new_result(folder, filename=fname, error=error)
+        else:
+            owners[key] = folder
+            filenames[folder] = fname
+    todo = [folder for folder in folders if folder not in results]
+    nproc = max(1, min(nproc or 1, len(todo)))
+
+    t0 = time.time()
+    def done(result):
+        results[result['folder']] = result
+        if verbose:
+            print(report_conversion(result))
+        if hasattr(callback, '__call__'):
+            callback(result)
+
+    for folder in folders:
+        if folder in results:
+            done(results[folder])
+    if nproc > 1 and ProcessPoolExecutor is not None:
+        with ProcessPoolExecutor(max_workers=nproc) as pool:
+            futures = [pool.submit(convert_mapfolder, folder,
+                                   filename=filenames[folder], **opts)
+                       for folder in todo]
+            for future in as_completed(futures):
+                done(future.result())
+    else:
+        for folder in todo:
+            done(convert_mapfolder(folder, filename=filenames[folder], **opts))
+
+    results = [results[folder] for folder in folders]
+    if verbose:
+        nrows = sum(r['nrows'] for r in results)
+        mbytes = sum(r['mbytes'] for r in results)
+        dt = max(time.time() - t0, 1.e-6)
+        nfail = len([r for r in results if r['status'] == 'failed'])
+        print('%i maps, %i rows in %.1f s: %.2f rows/s, %.2f MB/s, %i failed' %
+              (len(results), nrows, dt, nrows/dt, mbytes/dt, nfail))
+    return results
@@ -6,7 +6,14 @@ import h5py
 import numpy as np
 import scipy.stats as stats
 import json
+from threading import Thread
+from six.moves.queue import Queue
+try:
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = ProcessPoolExecutor = None
 import larch
+from larch.utils import LRUCache
 from larch.utils.debugtime import debugtime
 from larch.utils.strutils import fix_filename
 from larch_plugins.io import nativepath, new_filename
@@ -15,7 +22,8 @@ from larch_plugins.xrf import MCA, ROI
 from larch_plugins.xrmmap import (FastMapConfig, read_xrf_netcdf, read_xsp3_hdf5,
                                   readASCII, readMasterFile, readROIFile,
                                   readEnvironFile, parseEnviron, read_xrd_netcdf,
-                                  read_xrd_hdf5)
+                                  read_xrd_hdf5, XRDFramesNetCDF, XRDFramesHDF5,
+                                  mca_chunks, mca_storage, MapFolderWatcher)
 from larch_plugins.xrd import XRD,E_from_lambda,integrate_xrd_row
 
 
@@ -24,6 +32,7 @@ NINIT = 32
 COMPRESSION_LEVEL = 'lzf' ## faster but larger files;mkak 2016.08.19
 DEFAULT_ROOTNAME = 'xrmmap'
 STEPS = 5001
+ROIMAP_CACHE_SIZE = 64  # number of cached ROI maps and statistics
 
 def h5str(obj):
     '''strings stored in an HDF5 from Python2 may look like
@@ -223,7 +232,8 @@ class GSEXRM_MapRow:
                  npts=None,  irow=None, dtime=None, nrows_expected=None,
                  masterfile=None, xrftype=None, xrdtype=None, poni=None,
                  mask=None, wdg=1, steps=STEPS, flip=True,
-                 FLAGxrf=True, FLAGxrd2D=False, FLAGxrd1D=False):
+                 FLAGxrf=True, FLAGxrd2D=False, FLAGxrd1D=False,
+                 lazy_xrd=False, xrd_batchsize=8):
 
         ta = time.time()
         if not FLAGxrf and not FLAGxrd2D:
@@ -231,6 +241,11 @@ class GSEXRM_MapRow:
 
         self.read_ok = False
         self.nrows_expected = nrows_expected
+        # with lazy_xrd, XRD frames are not held here, but streamed from
+        # xrdframes when the row is added to the map.  The 1D integration
+        # is still done here, reading frames in batches of xrd_batchsize
+        self.xrdframes = None
+        self.reverse = reverse
 
         ioff = ioffset
 
@@ -261,10 +276,13 @@ class GSEXRM_MapRow:
         if FLAGxrd2D or FLAGxrd1D:
             if xrdtype == 'hdf5':
                 xrd_reader = read_xrd_hdf5
+                xrd_frames = XRDFramesHDF5
             elif xrdtype == 'netcdf' or xrdfile.endswith('nc'):
                 xrd_reader = read_xrd_netcdf
+                xrd_frames = XRDFramesNetCDF
             else:
                 xrd_reader = read_xrd_netcdf
+                xrd_frames = XRDFramesNetCDF
 
 
         # reading can fail with IOError, generally meaning the file isn't
@@ -316,7 +334,9 @@ class GSEXRM_MapRow:
                     if xrfdat is None:
                         print( 'Failed to read XRF data from %s' % self.xrffile)
                 tc = time.time()
-                if FLAGxrd2D or FLAGxrd1D:
+                if lazy_xrd and (FLAGxrd2D or FLAGxrd1D):
+                    xrddat = xrd_frames(xdfile)
+                elif FLAGxrd2D or FLAGxrd1D:
                     xrddat = xrd_reader(xdfile, verbose=False)
                     if xrddat is None:
                         print( 'Failed to read XRD data from %s' % self.xrdfile)
@@ -349,7 +369,11 @@ class GSEXRM_MapRow:
         tf = time.time()
 
         ## SPECIFIC TO XRD data
-        if FLAGxrd2D or FLAGxrd1D:
+        self.xrd2d = self.xrd1d = None
+        tg = time.time()
+        if lazy_xrd and (FLAGxrd2D or FLAGxrd1D):
+            self.xrdframes = xrddat
+        elif FLAGxrd2D or FLAGxrd1D:
             if self.npts == xrddat.shape[0]:
                 self.xrd2d = xrddat
             elif self.npts > xrddat.shape[0]:
@@ -371,6 +395,13 @@ class GSEXRM_MapRow:
         if self.npts is None:
             self.npts = min(gnpts, xnpts)
 
+        if (lazy_xrd and FLAGxrd1D and poni is not None and
+            self.xrdframes is not None):
+            attrs = {'steps':steps,'mask':mask,'wedge':wdg,'flip':flip}
+            self.xrd1d = integrate_xrd_frames(self.xrdframes, self.npts, poni,
+                                              batchsize=xrd_batchsize, **attrs)
+            th = time.time()
+
         if snpts < self.npts:  # extend struck data if needed
             print('     extending SIS data from %i to %i !' % (snpts, self.npts))
             sdata = list(sdata)
@@ -388,9 +419,9 @@ class GSEXRM_MapRow:
                 self.dtfactor  = self.dtfactor[:self.npts]
                 self.inpcounts = self.inpcounts[:self.npts]
                 self.outcounts = self.outcounts[:self.npts]
-            if FLAGxrd2D:
+            if FLAGxrd2D and self.xrd2d is not None:
                 self.xrd2d = self.xrd2d[:self.npts]
-            if FLAGxrd1D:
+            if FLAGxrd1D and self.xrd1d is not None:
                 self.xrd1d = self.xrd1d[:self.npts]
 
         points = range(1, self.npts+1)
@@ -399,6 +430,7 @@ class GSEXRM_MapRow:
         # so reverse those that go from low to high value
         if reverse is None:
             reverse = gdata[0, 0] < gdata[-1, 0]
+        self.reverse = reverse
 
         if reverse:
             points.reverse()
@@ -410,9 +442,9 @@ class GSEXRM_MapRow:
                 self.dtfactor = self.dtfactor[::-1]
                 self.inpcounts= self.inpcounts[::-1]
                 self.outcounts= self.outcounts[::-1]
-            if FLAGxrd2D:
+            if FLAGxrd2D and self.xrd2d is not None:
                 self.xrd2d = self.xrd2d[::-1]
-            if FLAGxrd1D:
+            if FLAGxrd1D and self.xrd1d is not None:
                 self.xrd1d = self.xrd1d[::-1]
 
 
@@ -451,6 +483,84 @@ class GSEXRM_MapRow:
         self.readtime      = (ti-ta)
 
 
+def integrate_xrd_frames(xrdframes, npts, poni, batchsize=8, **attrs):
+    """1D integration of the first npts frames from an XRD frame source,
+    read in batches of batchsize frames, with missing frames taken as
+    empty images.  attrs are keywords for integrate_xrd_row()"""
+    xrd1d = []
+    for i1, frames in xrdframes.iter_frames(batchsize):
+        if i1 >= npts:
+            break
+        xrd1d.extend(integrate_xrd_row(frames[:npts-i1], poni, **attrs))
+    if len(xrd1d) < npts:
+        frame = np.zeros((1, ) + tuple(xrdframes.shape[1:]))
+        empty = integrate_xrd_row(frame, poni, **attrs)[0]
+        xrd1d.extend([empty]*(npts-len(xrd1d)))
+    return np.array(xrd1d)
+
+def read_maprow(args, kws):
+    """read a GSEXRM_MapRow, for use in worker threads or processes"""
+    return GSEXRM_MapRow(*args, **kws)
+
+def make_roi_index(roi_slices, nmca, nchan):
+    """build index for summing ROIs of all pixels of an MCA row
+
+    roi_slices is a list (one per ROI) of lists of channel slices
+    (one per MCA).  Returns a list, one per MCA, of tuples of
+    (order, bounds, empty, tail) for roi_sums(), where bounds holds
+    the (lo, hi) channel limits of the ROIs sorted by lo, interleaved
+    as needed for numpy.add.reduceat.
+    """
+    nrois = len(roi_slices)
+    out = []
+    for imca in range(nmca):
+        lo = np.array([sl[imca].start for sl in roi_slices], dtype=int)
+        hi = np.array([sl[imca].stop for sl in roi_slices], dtype=int)
+        lo = np.clip(lo, 0, nchan)
+        hi = np.clip(hi, lo, nchan)
+        # reduceat cannot end a segment at nchan: the last channel
+        # is added separately for ROIs that end there
+        tail = (hi == nchan) & (lo < nchan)
+        hi[tail] = nchan - 1
+        empty = hi <= lo
+        order = np.argsort(lo, kind='mergesort')
+        bounds = np.zeros(2*nrois, dtype=int)
+        bounds[0::2] = lo[order]
+        bounds[1::2] = hi[order]
+        bounds = np.minimum(bounds, nchan-1)
+        out.append((order, bounds, empty, tail))
+    return out
+
+def roi_sums(counts, roi_index):
+    """sum ROIs of an MCA row of counts (nmca, npts, nchan) with an
+    index from make_roi_index(), returning an (nmca, npts, nrois) array"""
+    nmca, npts, nchan = counts.shape
+    nrois = len(roi_index[0][0])
+    out = np.zeros((nmca, npts, nrois), dtype=np.int64)
+    if nrois == 0 or npts == 0:
+        return out
+    for imca, (order, bounds, empty, tail) in enumerate(roi_index):
+        dat = counts[imca]
+        isum = out[imca]
+        isum[:, order] = np.add.reduceat(dat, bounds, axis=1,
+                                         dtype=np.int64)[:, 0::2]
+        isum[:, empty] = 0
+        isum[:, tail] += dat[:, nchan-1:nchan]
+    return out
+
+def _sum_tiles(tiles):
+    """sum 2x2 blocks of tiles along the first two axes,
+    padding with zeros for odd sizes"""
+    ny, nx = tiles.shape[:2]
+    out = np.zeros(((ny+1)//2, 2, (nx+1)//2, 2) + tiles.shape[2:],
+                   dtype=tiles.dtype)
+    out.reshape((2*out.shape[0], 2*out.shape[2]) + tiles.shape[2:])[:ny, :nx] = tiles
+    return out.sum(axis=3).sum(axis=1)
+
+def _expand_tiles(mask, size):
+    "expand a 2d mask of tiles to a mask of their pixels"
+    return np.repeat(np.repeat(mask, size, axis=0), size, axis=1)
+
 class GSEMCA_Detector(object):
     '''Detector class, representing 1 detector element (real or virtual)
     has the following properties (many of these as runtime-calculated properties)
@@ -596,12 +706,18 @@ class GSEXRM_MapFile(object):
 
     def __init__(self, filename=None, folder=None, root=None, chunksize=None,
                  poni=None, mask=None, azwdgs=1, qstps=STEPS, flip=True,
-                 FLAGxrf=True, FLAGxrd1D=False, FLAGxrd2D=False):
+                 FLAGxrf=True, FLAGxrd1D=False, FLAGxrd2D=False,
+                 storage='append', compression=COMPRESSION_LEVEL, shuffle=False,
+                 xrd_batchsize=8):
 
         self.filename         = filename
         self.folder           = folder
         self.root             = root
         self.chunksize        = chunksize
+        self.storage          = storage
+        self.compression      = compression
+        self.shuffle          = shuffle
+        self.xrd_batchsize    = xrd_batchsize
         self.status           = GSEXRM_FileStatus.err_notfound
         self.dimension        = None
         self.ndet             = None
@@ -612,10 +728,14 @@ class GSEXRM_MapFile(object):
         self.rowdata          = []
         self.npts             = None
         self.roi_slices       = None
+        self.roi_index        = None
+        self.roimap_cache     = LRUCache(maxsize=ROIMAP_CACHE_SIZE)
+        self.roimap_cache_key = None
         self.pixeltime        = None
         self.dt               = debugtime()
         self.masterfile       = None
         self.masterfile_mtime = -1
+        self.masterfile_stat = None
 
         self.energy      = None
         self.flag_xrf = FLAGxrf
@@ -845,6 +965,7 @@ class GSEXRM_MapFile(object):
         self.roi_desc = roi_desc
         self.roi_addr = roi_addr
         self.roi_slices = roi_slices
+        self.roi_index = None
         self.calib = calib
         # add env data
         envdat = readEnvironFile(os.path.join(self.folder, self.EnvFile))
@@ -885,9 +1006,29 @@ class GSEXRM_MapFile(object):
 
         self.status = GSEXRM_FileStatus.hasdata
 
-    def process(self, maxrow=None, force=False, callback=None, verbose=True):
-        "look for more data from raw folder, process if needed"
-
+    def process(self, maxrow=None, force=False, callback=None, verbose=True,
+                nworkers=1, use_processes=False):
+        """look for more data from raw folder, process if needed
+
+        Parameters:
+        -----------
+          maxrow:   maximum number of rows to process [None, all rows]
+          force:    whether to force reading the Master file and rows [False]
+          callback: function to call as each row is read.
+          verbose:  whether to print timing for each row [True]
+          nworkers: number of rows to read at once [1].  See Notes
+          use_processes: whether to read rows with worker processes
+                    instead of threads [False]
+
+        Notes:
+        ------
+         With nworkers > 1, rows are read and decoded by a pool of
+         nworkers readers, ahead of a single thread writing rows to
+         the HDF5 file in order.  A bounded queue of rows between
+         them limits memory use.  Reading with threads may still be
+         limited by Python for ASCII parsing and XRD integration, in
+         which case use_processes=True can help.
+        """
         if not self.check_hostid():
             raise GSEXRM_NotOwner(self.filename)
 
@@ -899,7 +1040,13 @@ class GSEXRM_MapFile(object):
         nrows = len(self.rowdata)
         if maxrow is not None:
             nrows = min(nrows, maxrow)
-        if force or self.folder_has_newdata():
+        if ((force or self.folder_has_newdata()) and nworkers > 1 and
+            ThreadPoolExecutor is not None):
+            self.process_rows_pipelined(self.last_row+1, nrows,
+                                        nworkers=nworkers,
+                                        use_processes=use_processes,
+                                        callback=callback, verbose=verbose)
+        elif force or self.folder_has_newdata():
             irow = self.last_row + 1
             while irow < nrows:
                 # self.dt.add('=>PROCESS %i' % irow)
@@ -925,6 +1072,70 @@ class GSEXRM_MapFile(object):
             self.calc_pixeltime()
         print(datetime.datetime.fromtimestamp(time.time()).strftime('End: %Y-%m-%d %H:%M:%S'))
 
+    def process_rows_pipelined(self, irow, nrows, nworkers=4,
+                               use_processes=False, callback=None,
+                               verbose=True):
+        """read rows irow to nrows-1 with a pool of nworkers readers,
+        and add them to the HDF5 file in order from a writer thread.
+
+        At most 2*nworkers rows are read ahead of the writer.  As with
+        process(), a row that fails to read stops processing.
+        """
+        if use_processes:
+            Executor = ProcessPoolExecutor
+        else:
+            Executor = ThreadPoolExecutor
+        if not hasattr(callback, '__call__'):
+            callback = None
+
+        rowqueue = Queue(maxsize=2*nworkers)
+        state = {'failed': False, 'error': None}
+
+        def writer():
+            while True:
+                item = rowqueue.get()
+                if item is None:
+                    return
+                jrow, task = item
+                if state['failed']:
+                    task.cancel()
+                    continue
+                try:
+                    row = task.result()
+                    if callback is not None:
+                        callback(row=jrow, maxrow=nrows,
+                                 filename=self.filename, status='complete')
+                    if row is None or not row.read_ok:
+                        print("==Warning: Read failed at row %i" % jrow)
+                        state['failed'] = True
+                    else:
+                        self.add_rowdata(row, verbose=verbose)
+                except Exception as exc:
+                    state['failed'] = True
+                    state['error'] = exc
+
+        wthread = Thread(target=writer, name='xrmmap_writer')
+        wthread.start()
+        pool = Executor(max_workers=nworkers)
+        try:
+            for jrow in range(irow, nrows):
+                if state['failed']:
+                    break
+                if callback is not None:
+                    callback(row=jrow, maxrow=nrows,
+                             filename=self.filename, status='reading')
+                rowargs = self.rowdata_args(jrow)
+                if rowargs is None:
+                    break
+                # blocks when the readers are 2*nworkers rows ahead
+                rowqueue.put((jrow, pool.submit(read_maprow, *rowargs)))
+        finally:
+            rowqueue.put(None)
+            wthread.join()
+            pool.shutdown()
+        if state['error'] is not None:
+            raise state['error']
+
     def calc_pixeltime(self):
         scanconf = self.xrmmap['config/scan']
         rowtime = float(scanconf['time1'].value)
@@ -939,6 +1150,16 @@ class GSEXRM_MapFile(object):
         '''read a row worth of raw data from the Map Folder
         returns arrays of data
         '''
+        rowargs = self.rowdata_args(irow)
+        if rowargs is None:
+            return
+        args, kws = rowargs
+        return GSEXRM_MapRow(*args, **kws)
+
+    def rowdata_args(self, irow):
+        '''return arguments and keywords for GSEXRM_MapRow
+        to read a row of raw data from the Map Folder
+        '''
         try:
             self.flag_xrf
         except:
@@ -975,16 +1196,36 @@ class GSEXRM_MapFile(object):
         ioffset = 0
         if scan_version > 1.35:
             ioffset = 1
-        return GSEXRM_MapRow(yval, xrff, xrdf, xpsf, sisf, self.folder,
-                             irow=irow, nrows_expected=self.nrows_expected,
-                             ixaddr=self.ixaddr, dimension=self.dimension,
-                             npts=self.npts, reverse=reverse, ioffset=ioffset,
-                             masterfile=self.masterfile, poni=self.calibration,
-                             flip=self.flip, mask=self.maskfile,
-                             wdg=self.azwdgs, steps=self.qstps,
-                             FLAGxrf=self.flag_xrf,
-                             FLAGxrd2D=self.flag_xrd2d, FLAGxrd1D=self.flag_xrd1d)
-
+        args = (yval, xrff, xrdf, xpsf, sisf, self.folder)
+        kws = dict(irow=irow, nrows_expected=self.nrows_expected,
+                   ixaddr=self.ixaddr, dimension=self.dimension,
+                   npts=self.npts, reverse=reverse, ioffset=ioffset,
+                   masterfile=self.masterfile, poni=self.calibration,
+                   flip=self.flip, mask=self.maskfile,
+                   wdg=self.azwdgs, steps=self.qstps,
+                   FLAGxrf=self.flag_xrf,
+                   FLAGxrd2D=self.flag_xrd2d, FLAGxrd1D=self.flag_xrd1d,
+                   lazy_xrd=True, xrd_batchsize=self.xrd_batchsize)
+        return args, kws
+
+
+    def get_roi_index(self, nmca, nchan):
+        """return index for ROI sums from roi_slices, see make_roi_index()"""
+        if self.roi_slices is None:
+            lims = self.xrmmap['config/rois/limits'].value
+            nrois, nlims, nx = lims.shape
+
+            self.roi_slices = []
+            for iroi in range(nrois):
+                x = [slice(lims[iroi, i, 0],
+                           lims[iroi, i, 1]) for i in range(nlims)]
+                self.roi_slices.append(x)
+
+        key = (nmca, nchan)
+        if self.roi_index is None or self.roi_index[0] != key:
+            self.roi_index = (key, make_roi_index(self.roi_slices,
+                                                  nmca, nchan))
+        return self.roi_index[1]
 
     def add_rowdata(self, row, verbose=False):
         '''adds a row worth of real data'''
@@ -1046,41 +1287,31 @@ class GSEXRM_MapFile(object):
             sum_raw = roimap['sum_raw']
             sum_cor = roimap['sum_cor']
 
-            detraw = list(row.sisdata[:npts].transpose())
-
-            detcor = detraw[:]
-            sumraw = detraw[:]
-            sumcor = detraw[:]
-
-            if self.roi_slices is None:
-                lims = self.xrmmap['config/rois/limits'].value
-                nrois, nmca, nx = lims.shape
-
-                self.roi_slices = []
-                for iroi in range(nrois):
-                    x = [slice(lims[iroi, i, 0],
-                               lims[iroi, i, 1]) for i in range(nmca)]
-                    self.roi_slices.append(x)
-
-            for slices in self.roi_slices:
-                iraw = [row.counts[i, :npts, slices[i]].sum(axis=1)
-                        for i in range(nmca)]
-                icor = [row.counts[i, :npts, slices[i]].sum(axis=1)*row.dtfactor[i, :npts]
-                        for i in range(nmca)]
-                detraw.extend(iraw)
-                detcor.extend(icor)
-                sumraw.append(np.array(iraw).sum(axis=0))
-                sumcor.append(np.array(icor).sum(axis=0))
-
-            det_raw[thisrow, :npts, :] = np.array(detraw).transpose()
-            det_cor[thisrow, :npts, :] = np.array(detcor).transpose()
-            sum_raw[thisrow, :npts, :] = np.array(sumraw).transpose()
-            sum_cor[thisrow, :npts, :] = np.array(sumcor).transpose()
+            # ROI sums for all detectors and pixels: (nmca, npts, nrois)
+            roi_index = self.get_roi_index(nmca, row.counts.shape[2])
+            iraw = roi_sums(row.counts[:, :npts, :], roi_index)
+            nrois = iraw.shape[2]
+            icor = iraw * row.dtfactor[:, :npts, np.newaxis]
+
+            # det columns are ordered by roi, then by detector
+            sisdata = row.sisdata[:npts]
+            detraw = iraw.transpose(1, 2, 0).reshape(npts, nrois*nmca)
+            detcor = icor.transpose(1, 2, 0).reshape(npts, nrois*nmca)
+
+            det_raw[thisrow, :npts, :] = np.hstack((sisdata, detraw))
+            det_cor[thisrow, :npts, :] = np.hstack((sisdata, detcor))
+            sum_raw[thisrow, :npts, :] = np.hstack((sisdata, iraw.sum(axis=0)))
+            sum_cor[thisrow, :npts, :] = np.hstack((sisdata, icor.sum(axis=0)))
 
         if verbose: t1 = time.time()
 
+        if row.xrdframes is not None:
+            self.add_xrd_frames(thisrow, row)
+
         if self.flag_xrd1d and row.xrd1d is not None:
-            self.xrmmap['xrd']['data1D'][thisrow,] = row.xrd1d
+            data1d = self.xrmmap['xrd']['data1D']
+            npts = min(len(row.xrd1d), data1d.shape[1])
+            data1d[thisrow, :npts] = row.xrd1d[:npts]
 
         if self.flag_xrd2d and row.xrd2d is not None:
             self.xrmmap['xrd']['data2D'][thisrow,] = row.xrd2d
@@ -1106,6 +1337,26 @@ class GSEXRM_MapFile(object):
         self.xrmmap.attrs['Last_Row'] = thisrow
         self.h5root.flush()
 
+    def add_xrd_frames(self, thisrow, row):
+        '''add 2D XRD frames for a row, streaming the frames in batches of
+        xrd_batchsize frames from row.xrdframes.  The 1D integrations
+        are done as the row is read, and are in row.xrd1d'''
+        if not self.flag_xrd2d:
+            return
+        data2d = self.xrmmap['xrd']['data2D']
+        npts = min(row.npts, data2d.shape[1])
+
+        # frame i goes to point i, or to point npts-1-i for reversed rows
+        for i1, frames in row.xrdframes.iter_frames(self.xrd_batchsize):
+            if i1 >= npts:
+                break
+            frames = frames[:npts-i1]
+            i2 = i1 + len(frames)
+            if row.reverse:
+                frames = frames[::-1]
+                i1, i2 = npts-i2, npts-i1
+            data2d[thisrow, i1:i2] = frames
+
     def build_schema(self, row, verbose=False):
         '''build schema for detector and scan data'''
 
@@ -1133,12 +1384,11 @@ class GSEXRM_MapFile(object):
                 print(prtxt % (npts, row.npts, nmca, nchan))
 
             if self.chunksize is None:
-                if xnpts < 10: xnpts=10
-                nxx = min(xnpts-1, 2**int(np.log2(xnpts)))
-                nxm = 1024
-                if nxx > 256:
-                    nxm = min(1024, int(65536*1.0/ nxx))
-                self.chunksize = (1, nxx, nxm)
+                self.chunksize = mca_chunks(self.storage, xnpts, nchan)
+            mca_kws = mca_storage(chunks=self.chunksize,
+                                  compression=self.compression,
+                                  shuffle=self.shuffle)
+            xrmmap.attrs['Storage_Profile'] = self.storage
             en_index = np.arange(nchan)
 
             offset = conf['mca_calib/offset'].value
@@ -1161,9 +1411,7 @@ class GSEXRM_MapFile(object):
                 self.add_data(dgrp, 'roi_limits',  roi_limits[:,imca,:])
 
                 dgrp.create_dataset('counts', (NINIT, npts, nchan), np.int16,
-                                    compression=COMPRESSION_LEVEL,
-                                    chunks=self.chunksize,
-                                    maxshape=(None, npts, nchan))
+                                    maxshape=(None, npts, nchan), **mca_kws)
                 for name, dtype in (('realtime', np.int),  ('livetime', np.int),
                                     ('dtfactor', np.float32),
                                     ('inpcounts', np.float32),
@@ -1183,9 +1431,7 @@ class GSEXRM_MapFile(object):
             self.add_data(dgrp, 'roi_address', [s % 1 for s in roi_addrs])
             self.add_data(dgrp, 'roi_limits',  roi_limits[: ,0, :])
             dgrp.create_dataset('counts', (NINIT, npts, nchan), np.int16,
-                                compression=COMPRESSION_LEVEL,
-                                chunks=self.chunksize,
-                                maxshape=(None, npts, nchan))
+                                maxshape=(None, npts, nchan), **mca_kws)
             # roi map data
             scan = xrmmap['roimap']
             det_addr = [i.strip() for i in row.sishead[-2][1:].split('|')]
@@ -1253,7 +1499,10 @@ class GSEXRM_MapFile(object):
             if self.calibration:
                 self.add_calibration()
 
-            xrdpts, xpixx, xpixy = row.xrd2d.shape
+            if row.xrd2d is not None:
+                xrdpts, xpixx, xpixy = row.xrd2d.shape
+            else:
+                xrdpts, xpixx, xpixy = row.xrdframes.shape
             if verbose:
                 prtxt = '--- Build XRD Schema: %i, %i ---- 2D XRD:  (%i, %i)'
                 print(prtxt % (npts, row.npts, xpixx, xpixy))
@@ -1469,52 +1718,67 @@ class GSEXRM_MapFile(object):
            median, mode, minimum, maximum,
            gmean, hmean, skew, kurtosis
 
+        the first detector is the count time, in seconds.
+        statistics are kept until the map grows or the area changes.
         '''
         area = self.get_area(name=name, desc=desc)
         if area is None:
             return None
-
-        if 'roistats' in area.attrs:
-            return json.loads(area.attrs['roistats'])
-
-        amask = area.value
-
-        roidata = []
-        d_addrs = [d.lower() for d in self.xrmmap['roimap/det_address']]
-        d_names = [d for d in self.xrmmap['roimap/det_name']]
-        # count times
-        ctime = [1.e-6*self.xrmmap['roimap/det_raw'][:,:,0][amask]]
-        for i in range(self.xrmmap.attrs['N_Detectors']):
-            tname = 'det%i/realtime' % (i+1)
-            ctime.append(1.e-6*self.xrmmap[tname].value[amask])
-
-        for idet, dname in enumerate(d_names):
-            daddr = d_addrs[idet]
-            det = 0
+        amask = area[()].astype(bool)
+        akey = (self._roimap_key(), amask.shape, hash(amask.tobytes()))
+        ckey = ('area_stats', area.name)
+        cached = self.roimap_cache.get(ckey)
+        if cached is not None and cached[0] == akey:
+            return cached[1]
+
+        d_names, block = self.get_roimap_block(det='all', dtcorrect=False,
+                                               no_hotcols=False)
+        d_addrs = [h5str(d).lower() for d in self.xrmmap['roimap/det_address']]
+        counts = self._area_pixels(block, amask).astype(np.float64)
+
+        # count times, for scalers and for each detector
+        ndet = self.xrmmap.attrs['N_Detectors']
+        rtime = [self.xrmmap['det%i/realtime' % (i+1)][()] for i in range(ndet)]
+        ctime = counts[:1]
+        if ndet > 0:
+            ctime = np.concatenate((ctime, self._area_pixels(np.array(rtime),
+                                                             amask)))
+        ctime = 1.e-6*ctime
+
+        idets = np.zeros(len(d_names), dtype=int)
+        for idet, daddr in enumerate(d_addrs):
             if 'mca' in daddr:
-                det = 1
+                idets[idet] = 1
                 words = daddr.split('mca')
                 if len(words) > 1:
-                    det = int(words[1].split('.')[0])
-            if idet == 0:
-                d = ctime[0]
-            else:
-                d = self.xrmmap['roimap/det_raw'][:,:,idet][amask]/ctime[det]
+                    idets[idet] = int(words[1].split('.')[0])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = counts / ctime[idets]
+        rates[0] = ctime[0]
 
+        npts = rates.shape[1]
+        roidata = []
+        if npts > 0:
+            mean, std = rates.mean(axis=1), rates.std(axis=1)
+            median = np.median(rates, axis=1)
+            mode = stats.mode(rates, axis=1)[0][:, 0]
+            rmin, rmax = rates.min(axis=1), rates.max(axis=1)
+        for idet, dname in enumerate(d_names):
+            if npts < 1:
+                roidata.append((dname, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0))
+                continue
+            d = rates[idet]
             try:
-                hmean, gmean = stats.gmean(d), stats.hmean(d)
+                gmean, hmean = stats.gmean(d), stats.hmean(d)
                 skew, kurtosis = stats.skew(d), stats.kurtosis(d)
             except ValueError:
-                hmean, gmean, skew, kurtosis = 0, 0, 0, 0
-            mode = stats.mode(d)
-            roidata.append((dname, len(d), d.mean(), d.std(), np.median(d),
-                            stats.mode(d), d.min(), d.max(),
+                gmean, hmean, skew, kurtosis = 0, 0, 0, 0
+            roidata.append((dname, npts, mean[idet], std[idet], median[idet],
+                            mode[idet], rmin[idet], rmax[idet],
                             gmean, hmean, skew, kurtosis))
-
-            if 'roistats' not in area.attrs:
-                area.attrs['roistats'] = json.dumps(roidata)
-                self.h5root.flush()
-
+        roidata = [(r[0], int(r[1])) + tuple(float(x) for x in r[2:])
+                   for r in roidata]
+        self.roimap_cache[ckey] = (akey, roidata)
         return roidata
 
     def claim_hostid(self):
@@ -1560,17 +1824,46 @@ class GSEXRM_MapFile(object):
 
     def folder_has_newdata(self):
         if self.folder is not None and isGSEXRM_MapFolder(self.folder):
-            self.read_master()
+            # re-read master file only if it has changed
+            masterfile = os.path.join(nativepath(self.folder), self.MasterFile)
+            try:
+                stat = os.stat(masterfile)
+                stat = (stat.st_size, stat.st_mtime)
+            except OSError:
+                stat = None
+            if stat is None or stat != self.masterfile_stat:
+                self.read_master()
             return (self.last_row < len(self.rowdata)-1)
         return False
 
+    def watch_folder(self, callback=None, settle=0.5, poll_time=1.0):
+        """start watching the raw map folder for rows completed after
+        the last row in the map file, returning a MapFolderWatcher.
+
+        callback is called as each row is ready, with keywords row,
+        maxrow, folder, and status='ready'.  Rows can also be read
+        from the watcher with get_row() or iter_rows(), and then
+        processed with process(maxrow=row+1).
+        Use the watcher's stop() method to stop watching.
+        """
+        if self.folder is None or not isGSEXRM_MapFolder(self.folder):
+            raise GSEXRM_Exception("'%s' is not a map folder" % self.folder)
+        watcher = MapFolderWatcher(nativepath(self.folder),
+                                   masterfile=self.MasterFile,
+                                   start_row=self.last_row+1,
+                                   callback=callback, settle=settle,
+                                   poll_time=poll_time)
+        watcher.start()
+        return watcher
+
     def read_master(self):
         "reads master file for toplevel scan info"
         if self.folder is None or not isGSEXRM_MapFolder(self.folder):
             return
         self.masterfile = os.path.join(nativepath(self.folder),self.MasterFile)
-        mtime = int(os.stat(self.masterfile).st_mtime)
-        self.masterfile_mtime = mtime
+        stat = os.stat(self.masterfile)
+        self.masterfile_mtime = int(stat.st_mtime)
+        self.masterfile_stat = (stat.st_size, stat.st_mtime)
 
         try:
             header, rows = readMasterFile(self.masterfile)
@@ -1662,6 +1955,169 @@ class GSEXRM_MapFile(object):
         ny, nx, npos = self.xrmmap['positions/pos'].shape
         return ny, nx
 
+    def _mca_index_name(self, det=None, dtcorrect=True):
+        "name of summed-spectra index group for a detector"
+        if self.ndet is None:
+            self.ndet =  self.xrmmap.attrs['N_Detectors']
+        if det in range(1, self.ndet+1):
+            name = 'det%i' % det
+        elif det is None:
+            name = 'sum'
+        else:  # detsum counts, never deadtime corrected
+            return 'detsum'
+        if dtcorrect:
+            name = '%s_dtc' % name
+        return name
+
+    def build_mca_index(self, det=None, dtcorrect=True, tilesize=16,
+                        callback=None):
+        '''build a multi-resolution index of summed XRF spectra for
+        a detector, used by get_mca_area() and get_mca_rect()
+
+        Parameters
+        ---------
+        det :        optional, None or int         index of detector
+        dtcorrect :  optional, bool [True]         dead-time correct data
+        tilesize :   optional, int [16]            size of smallest tiles
+        callback :   optional, function(i, n)      progress callback
+
+        Returns
+        -------
+        name of index group in 'mca_index'
+
+        Notes
+        -----
+        The index holds the summed spectra of square tiles of the map,
+        with tiles of tilesize pixels at level 0, doubling in size at
+        each higher level up to the full map.  Area spectra are then
+        taken from the largest tiles lying completely inside the area,
+        with only the remaining pixels read from the full spectra.
+
+        The index is kept in the HDF5 file, and is ignored for
+        spectra once rows have been added to the map after building.
+        '''
+        if not self.check_hostid():
+            raise GSEXRM_NotOwner(self.filename)
+
+        tilesize = max(2, int(tilesize))
+        mapdat = self._det_group(det)
+        ny, nx, nchan = mapdat['counts'].shape
+        nty = int(np.ceil(ny*1.0/tilesize))
+        ntx = int(np.ceil(nx*1.0/tilesize))
+
+        tiles = np.zeros((nty, ntx*tilesize, nchan))
+        for ity in range(nty):
+            if hasattr(callback , '__call__'):
+                callback(ity, nty)
+            y1 = ity*tilesize
+            y2 = min(ny, y1+tilesize)
+            counts = self._get_counts_block(y1, y2, 0, nx, mapdat=mapdat,
+                                            det=det, dtcorrect=dtcorrect)
+            tiles[ity, :nx, :] = counts.sum(axis=0)
+        tiles = tiles.reshape(nty, ntx, tilesize, nchan).sum(axis=2)
+
+        if 'mca_index' not in self.xrmmap:
+            group = self.xrmmap.create_group('mca_index')
+            group.attrs['type'] = 'mca index'
+            group.attrs['desc'] = 'multi-resolution summed spectra'
+        name = self._mca_index_name(det=det, dtcorrect=dtcorrect)
+        group = self.xrmmap['mca_index']
+        if name in group:
+            del group[name]
+        index = group.create_group(name)
+
+        level = 0
+        while True:
+            index.create_dataset('level%i' % level, data=tiles,
+                                 compression=COMPRESSION_LEVEL,
+                                 chunks=(1, 1, nchan))
+            if tiles.shape[0] == 1 and tiles.shape[1] == 1:
+                break
+            tiles = _sum_tiles(tiles)
+            level += 1
+
+        index.attrs['tilesize'] = tilesize
+        index.attrs['nlevels'] = level + 1
+        index.attrs['shape'] = (ny, nx)
+        index.attrs['Last_Row'] = self.xrmmap.attrs['Last_Row']
+        self.h5root.flush()
+        return name
+
+    def get_mca_index(self, det=None, dtcorrect=True):
+        """return summed-spectra index group for a detector, or None
+        if the index has not been built or is out of date"""
+        if 'mca_index' not in self.xrmmap:
+            return None
+        name = self._mca_index_name(det=det, dtcorrect=dtcorrect)
+        group = self.xrmmap['mca_index']
+        if name not in group:
+            return None
+        index = group[name]
+        mapdat = self._det_group(det)
+        if (tuple(index.attrs['shape']) != mapdat['counts'].shape[:2] or
+            index.attrs['Last_Row'] != self.xrmmap.attrs['Last_Row']):
+            return None
+        return index
+
+    def _get_counts_index(self, index, area, mapdat=None, det=None,
+                          dtcorrect=True, callback=None):
+        """return counts summed over an area mask using a summed-spectra
+        index: from the largest tiles completely inside the area, and
+        from the pixels of tiles only partly inside the area"""
+        if mapdat is None:
+            mapdat = self._det_group(det)
+        tilesize = index.attrs['tilesize']
+        nlevels = index.attrs['nlevels']
+        ny, nx = area.shape
+        nty, ntx, nchan = index['level0'].shape
+
+        # tiles completely inside the area, at each level
+        # (pixels beyond the edge of the map count as inside)
+        full = np.ones((nty*tilesize, ntx*tilesize), dtype=bool)
+        full[:ny, :nx] = area
+        full = full.reshape(nty, tilesize, ntx, tilesize).all(axis=3).all(axis=1)
+        part = np.zeros((nty*tilesize, ntx*tilesize), dtype=bool)
+        part[:ny, :nx] = area
+        part = part.reshape(nty, tilesize, ntx, tilesize).any(axis=3).any(axis=1)
+        part = part & ~full
+        inside = [full]
+        for level in range(1, nlevels):
+            full = _sum_tiles(~full) == 0
+            inside.append(full)
+
+        # use each tile at the highest level it is inside the area
+        counts = np.zeros(nchan)
+        above = np.zeros(inside[-1].shape, dtype=bool)
+        for level in range(nlevels-1, -1, -1):
+            full = inside[level]
+            use = full & ~above[:full.shape[0], :full.shape[1]]
+            if use.any():
+                iy, ix = np.where(use)
+                sy = slice(iy.min(), iy.max()+1)
+                sx = slice(ix.min(), ix.max()+1)
+                tiles = index['level%i' % level][sy, sx, :]
+                counts += tiles[use[sy, sx]].sum(axis=0)
+            above = _expand_tiles(full, 2)
+
+        # pixels of partly covered tiles, read for each row of tiles
+        rows = np.where(part.any(axis=1))[0]
+        for i, ity in enumerate(rows):
+            tx = np.where(part[ity])[0]
+            y1 = ity*tilesize
+            y2 = min(ny, y1+tilesize)
+            x1 = tx.min()*tilesize
+            x2 = min(nx, (tx.max()+1)*tilesize)
+            if hasattr(callback , '__call__'):
+                callback(i, len(rows), (x2-x1)*(y2-y1))
+            # skip pixels of tiles already summed from the index
+            done = inside[0][ity:ity+1, tx.min():tx.max()+1]
+            done = _expand_tiles(done, tilesize)[:y2-y1, :x2-x1]
+            mask = area[y1:y2, x1:x2] & ~done
+            block = self._get_counts_block(y1, y2, x1, x2, mapdat=mapdat,
+                                           det=det, dtcorrect=dtcorrect)
+            counts += block[mask].sum(axis=0)
+        return counts
+
     def get_mca_area(self, areaname, det=None, dtcorrect=True, callback = None):
         '''return XRF spectra as MCA() instance for
         spectra summed over a pre-defined area
@@ -1684,13 +2140,38 @@ class GSEXRM_MapFile(object):
             raise GSEXRM_Exception("Could not find area '%s'" % areaname)
 
         mapdat = self._det_group(det)
-        ix, iy, nmca = mapdat['counts'].shape
 
         npix = len(np.where(area)[0])
         if npix < 1:
             return None
         sy, sx = [slice(min(_a), max(_a)+1) for _a in np.where(area)]
         xmin, xmax, ymin, ymax = sx.start, sx.stop, sy.start, sy.stop
+
+        index = self.get_mca_index(det=det, dtcorrect=dtcorrect)
+        if index is None:
+            counts = self._get_counts_area(area, mapdat=mapdat, det=det,
+                                           dtcorrect=dtcorrect,
+                                           callback=callback)
+        else:
+            counts = self._get_counts_index(index, area, mapdat=mapdat,
+                                            det=det, dtcorrect=dtcorrect,
+                                            callback=callback)
+
+        ltime, rtime = self.get_livereal_rect(ymin, ymax, xmin, xmax, det=det,
+                                              dtcorrect=dtcorrect, area=area)
+        return self._getmca(mapdat, counts, areaname, npixels=npix,
+                            real_time=rtime, live_time=ltime)
+
+    def _get_counts_area(self, area, mapdat=None, det=None, dtcorrect=True,
+                         callback=None):
+        """return counts summed over the pixels of an area mask, reading
+        the bounding box of the area in chunks for large areas"""
+        if mapdat is None:
+            mapdat = self._det_group(det)
+        ix, iy, nmca = mapdat['counts'].shape
+
+        sy, sx = [slice(min(_a), max(_a)+1) for _a in np.where(area)]
+        xmin, xmax, ymin, ymax = sx.start, sx.stop, sy.start, sy.stop
         nx, ny = (xmax-xmin), (ymax-ymin)
         NCHUNKSIZE = 16384 # 8192
         use_chunks = nx*ny > NCHUNKSIZE
@@ -1728,10 +2209,7 @@ class GSEXRM_MapFile(object):
                                                 det=det, area=area,
                                                 dtcorrect=dtcorrect)
 
-        ltime, rtime = self.get_livereal_rect(ymin, ymax, xmin, xmax, det=det,
-                                              dtcorrect=dtcorrect, area=area)
-        return self._getmca(mapdat, counts, areaname, npixels=npix,
-                            real_time=rtime, live_time=ltime)
+        return counts
 
     def get_mca_rect(self, ymin, ymax, xmin, xmax, det=None, dtcorrect=True):
         '''return mca counts for a map rectangle, optionally
@@ -1752,8 +2230,15 @@ class GSEXRM_MapFile(object):
         '''
 
         mapdat = self._det_group(det)
-        counts = self.get_counts_rect(ymin, ymax, xmin, xmax, mapdat=mapdat,
-                                      det=det, dtcorrect=dtcorrect)
+        index = self.get_mca_index(det=det, dtcorrect=dtcorrect)
+        if index is None:
+            counts = self.get_counts_rect(ymin, ymax, xmin, xmax, mapdat=mapdat,
+                                          det=det, dtcorrect=dtcorrect)
+        else:
+            area = np.zeros(index.attrs['shape'], dtype=bool)
+            area[ymin:ymax, xmin:xmax] = True
+            counts = self._get_counts_index(index, area, mapdat=mapdat,
+                                            det=det, dtcorrect=dtcorrect)
         name = 'rect(y=[%i:%i], x==[%i:%i])' % (ymin, ymax, xmin, xmax)
         npix = (ymax-ymin+1)*(xmax-xmin+1)
         ltime, rtime = self.get_livereal_rect(ymin, ymax, xmin, xmax, det=det,
@@ -1763,30 +2248,11 @@ class GSEXRM_MapFile(object):
                             real_time=rtime, live_time=ltime)
 
 
-    def get_counts_rect(self, ymin, ymax, xmin, xmax, mapdat=None, det=None,
-                     area=None, dtcorrect=True):
-        '''return counts for a map rectangle, optionally
-        applying area mask and deadtime correction
-
-        Parameters
-        ---------
-        ymin :       int       low y index
-        ymax :       int       high y index
-        xmin :       int       low x index
-        xmax :       int       high x index
-        mapdat :     optional, None or map data
-        det :        optional, None or int         index of detector
-        dtcorrect :  optional, bool [True]         dead-time correct data
-        area :       optional, None or area object  area for mask
-
-        Returns
-        -------
-        ndarray for XRF counts in rectangle
-
-        Does *not* check for errors!
-
-        Note:  if mapdat is None, the map data is taken from the 'det' parameter
-        '''
+    def _get_counts_block(self, ymin, ymax, xmin, xmax, mapdat=None,
+                          det=None, dtcorrect=True):
+        """return (ny, nx, nchan) array of counts for a map rectangle,
+        summed over detectors for det=None, and optionally deadtime
+        corrected, as for get_counts_rect()"""
         if mapdat is None:
             mapdat = self._det_group(det)
 
@@ -1831,6 +2297,36 @@ class GSEXRM_MapFile(object):
                 _cts   = _md['counts'][cell].reshape(ny, nx, nmca)
                 counts += _cts
 
+        return counts
+
+    def get_counts_rect(self, ymin, ymax, xmin, xmax, mapdat=None, det=None,
+                     area=None, dtcorrect=True):
+        '''return counts for a map rectangle, optionally
+        applying area mask and deadtime correction
+
+        Parameters
+        ---------
+        ymin :       int       low y index
+        ymax :       int       high y index
+        xmin :       int       low x index
+        xmax :       int       high x index
+        mapdat :     optional, None or map data
+        det :        optional, None or int         index of detector
+        dtcorrect :  optional, bool [True]         dead-time correct data
+        area :       optional, None or area object  area for mask
+
+        Returns
+        -------
+        ndarray for XRF counts in rectangle
+
+        Does *not* check for errors!
+
+        Note:  if mapdat is None, the map data is taken from the 'det' parameter
+        '''
+        counts = self._get_counts_block(ymin, ymax, xmin, xmax, mapdat=mapdat,
+                                        det=det, dtcorrect=dtcorrect)
+        sx = slice(xmin, xmax)
+        sy = slice(ymin, ymax)
         if area is not None:
             counts = counts[area[sy, sx]]
         else:
@@ -2294,8 +2790,9 @@ class GSEXRM_MapFile(object):
         ndarray for ROI data
         '''
         imap = -1
-        roi_names = [h5str(r).lower() for r in self.xrmmap['config/rois/name']]
-        det_names = [h5str(r).lower() for r in self.xrmmap['roimap/sum_name']]
+        roi_names, sum_names, det_names_all = self._roimap_names()
+        roi_names = [r.lower() for r in roi_names]
+        det_names = [r.lower() for r in sum_names]
         work_names = self.work_array_names()
         dat = 'roimap/sum_raw'
         scan_version = getattr(self, 'scan_version', 1.00)
@@ -2322,7 +2819,7 @@ class GSEXRM_MapFile(object):
 
         if det in range(1, self.ndet+1):
             name = '%s (mca%i)' % (name, det)
-            det_names = [h5str(r).lower() for r in self.xrmmap['roimap/det_name']]
+            det_names = [r.lower() for r in det_names_all]
             dat = 'roimap/det_raw'
             if dtcorrect:
                 dat = 'roimap/det_cor'
@@ -2331,18 +2828,297 @@ class GSEXRM_MapFile(object):
         if imap < 0:
             raise GSEXRM_Exception("Could not find ROI '%s'" % name)
 
+        # use ROI maps already loaded by get_roimap_block()
+        cached = self.roimap_cache.get(('block', dat))
+        if cached is not None and cached[0] == self._roimap_key():
+            block = cached[1]
+            if no_hotcols:
+                return block[imap, :, 1:-1].copy()
+            return block[imap].copy()
+
         if no_hotcols:
             return self.xrmmap[dat][:, 1:-1, imap]
         else:
             return self.xrmmap[dat][:, :, imap]
 
+    def _roimap_key(self):
+        """key for cached ROI maps and statistics, changing as the map
+        grows.  All cached values are dropped when the key changes"""
+        key = (self.last_row, self.xrmmap['roimap/det_raw'].shape,
+               self.xrmmap['roimap/sum_raw'].shape)
+        if key != self.roimap_cache_key:
+            self.roimap_cache.clear()
+            self.roimap_cache_key = key
+        return key
+
+    def _roimap_names(self):
+        """ROI names, names of sums (scalers and ROIs for all detectors),
+        and names of detector ROIs, read once while the map is unchanged"""
+        key = self._roimap_key()
+        cached = self.roimap_cache.get('names')
+        if cached is None or cached[0] != key:
+            names = tuple([h5str(r) for r in self.xrmmap[dname]]
+                          for dname in ('config/rois/name', 'roimap/sum_name',
+                                        'roimap/det_name'))
+            cached = self.roimap_cache['names'] = (key, names)
+        return cached[1]
+
+    def get_roimap_block(self, det=None, dtcorrect=True, no_hotcols=True):
+        '''return names and maps for all ROIs of a detector, as
+        an array of shape (nroi, ny, nx)
+
+        Parameters
+        ---------
+        det  :       optional, None, int, or 'all' [None]
+                     None for sums of all detectors (including scalers),
+                     int for index of detector, 'all' for all ROIs of
+                     all detectors (including scalers)
+        dtcorrect :  optional, bool [True]         dead-time correct data
+        no_hotcols   optional, bool [True]         suprress hot columns
+
+        Returns
+        -------
+        list of names, ndarray of ROI maps
+
+        Notes
+        -----
+        The ROI maps for all detectors are read at once, and kept
+        until the map grows.  The returned array must not be altered.
+        '''
+        roi_names, sum_names, det_names = self._roimap_names()
+        if det is None:
+            dat = 'roimap/sum_raw'
+            names = sum_names
+        else:
+            dat = 'roimap/det_raw'
+            names = det_names
+        if dtcorrect:
+            dat = dat.replace('_raw', '_cor')
+        icols = list(range(len(names)))
+        if det not in (None, 'all'):
+            suffix = ' (mca%i)' % det
+            icols = [i for i, n in enumerate(names) if n.endswith(suffix)]
+            names = [names[i][:-len(suffix)] for i in icols]
+            if len(icols) < 1:
+                raise GSEXRM_Exception("Could not find ROIs for detector %s"
+                                       % repr(det))
+
+        key = self._roimap_key()
+        cached = self.roimap_cache.get(('block', dat))
+        if cached is None or cached[0] != key:
+            block = np.ascontiguousarray(self.xrmmap[dat][()].transpose(2, 0, 1))
+            cached = self.roimap_cache[('block', dat)] = (key, block)
+        block = cached[1]
+        if len(icols) < block.shape[0]:
+            block = block[icols]
+        scan_version = getattr(self, 'scan_version', 1.00)
+        if no_hotcols and scan_version < 1.36:
+            block = block[:, :, 1:-1]
+        return list(names), block
+
+    def _area_pixels(self, block, amask):
+        """ROI values for pixels in an area mask, as (nroi, npix),
+        for masks drawn on maps with or without hot columns"""
+        nroi, ny, nx = block.shape
+        if amask.shape[1] == nx - 2:
+            block = block[:, :, 1:-1]
+        elif amask.shape[1] != nx:
+            raise GSEXRM_Exception("area does not match map size")
+        ny = min(ny, amask.shape[0])
+        return block[:, :ny][:, amask[:ny]]
+
+    def get_area_roistats(self, areas=None, det=None, dtcorrect=True):
+        '''return statistics for all ROIs in areas
+
+        Parameters
+        ---------
+        areas :      optional, list of area names [None: all areas]
+        det  :       optional, None, int, or 'all' [None]
+                     detector, as for get_roimap_block()
+        dtcorrect :  optional, bool [True]         dead-time correct data
+
+        Returns
+        -------
+        dict of statistics for each area, with
+           names, npts, mean, std, median, min, max, sum
+        where all but names and npts are arrays of values for each ROI.
+
+        Notes
+        -----
+        Statistics are kept until the map grows or an area changes.
+        '''
+        if areas is None:
+            areas = list(self.xrmmap['areas'].keys())
+        elif isinstance(areas, str):
+            areas = [areas]
+        names, block = self.get_roimap_block(det=det, dtcorrect=dtcorrect,
+                                             no_hotcols=False)
+        key = self._roimap_key()
+        out = {}
+        for aname in areas:
+            area = self.get_area(name=aname)
+            if area is None:
+                raise GSEXRM_Exception("Could not find area '%s'" % aname)
+            amask = area[()].astype(bool)
+            akey = (key, amask.shape, hash(amask.tobytes()))
+            ckey = ('areastats', det, dtcorrect, aname)
+            cached = self.roimap_cache.get(ckey)
+            if cached is None or cached[0] != akey:
+                d = self._area_pixels(block, amask).astype(np.float64)
+                npts = d.shape[1]
+                res = {'names': names, 'npts': npts}
+                for stat in ('mean', 'std', 'median', 'min', 'max', 'sum'):
+                    if npts > 0:
+                        res[stat] = getattr(np, stat)(d, axis=1)
+                    else:
+                        res[stat] = np.zeros(len(names))
+                cached = self.roimap_cache[ckey] = (akey, res)
+            out[aname] = cached[1]
+        return out
+
+    def get_roi_correlations(self, det=None, dtcorrect=True, no_hotcols=True,
+                             area=None):
+        '''return correlation coefficients between all pairs of ROI maps
+
+        Parameters
+        ---------
+        det  :       optional, None, int, or 'all' [None]
+                     detector, as for get_roimap_block()
+        dtcorrect :  optional, bool [True]         dead-time correct data
+        no_hotcols   optional, bool [True]         suprress hot columns
+        area :       optional, name of area to use [None: whole map]
+
+        Returns
+        -------
+        list of names, ndarray of shape (nroi, nroi) of Pearson
+        correlation coefficients.  ROIs that are constant over the
+        map (or area) have coefficients of 0.
+        '''
+        names, block = self.get_roimap_block(det=det, dtcorrect=dtcorrect,
+                                             no_hotcols=no_hotcols)
+        akey = None
+        if area is not None:
+            amask = self.get_area(name=area)
+            if amask is None:
+                raise GSEXRM_Exception("Could not find area '%s'" % area)
+            amask = amask[()].astype(bool)
+            akey = (amask.shape, hash(amask.tobytes()))
+        key = (self._roimap_key(), akey)
+        ckey = ('correl', det, dtcorrect, no_hotcols, area)
+        cached = self.roimap_cache.get(ckey)
+        if cached is None or cached[0] != key:
+            if area is None:
+                d = block.reshape(block.shape[0], -1)
+            else:
+                d = self._area_pixels(block, amask)
+            d = d.astype(np.float64)
+            d -= d.mean(axis=1)[:, None]
+            cov = np.dot(d, d.T)
+            sig = np.sqrt(np.diag(cov))
+            sig[sig == 0] = np.inf
+            corr = cov / np.outer(sig, sig)
+            cached = self.roimap_cache[ckey] = (key, corr)
+        return names, cached[1]
+
     def get_mca_erange(self, det=None, dtcorrect=True,
-                       emin=None, emax=None, by_energy=True):
-        '''extract map for an ROI set here, by energy range:
+                       emin=None, emax=None, by_energy=True,
+                       name=None, cache=True):
+        '''extract map for an ROI set here, by energy range
 
-        not implemented
+        Parameters
+        ---------
+        det  :       optional, None or int [None]  index for detector
+        dtcorrect :  optional, bool [True]         dead-time correct data
+        emin :       optional, low energy or channel [None: first]
+        emax :       optional, high energy or channel [None: last]
+        by_energy :  optional, bool [True]
+                     emin and emax are energies (in units of the
+                     detector energy array), otherwise channel indices.
+                     Both limits are inclusive.
+        name :       optional, name of work array for map [None]
+        cache :      optional, bool [True]  save map as work array, and
+                     re-use a saved map for the same settings.
+
+        Returns
+        -------
+        ndarray for ROI data
+
+        Notes
+        -----
+        The detector counts are read row by row along the HDF5 chunks,
+        and only for the selected channels.
         '''
-        pass
+        mapdat = self._det_group(det)
+        ny, nx, nchan = mapdat['counts'].shape
+        if by_energy:
+            energy = mapdat['energy'].value
+            chan0 = 0
+            if emin is not None:
+                chan0 = int(np.searchsorted(energy, emin, side='left'))
+            chan1 = nchan
+            if emax is not None:
+                chan1 = int(np.searchsorted(energy, emax, side='right'))
+        else:
+            chan0 = 0 if emin is None else int(emin)
+            chan1 = nchan if emax is None else int(emax)+1
+        chan0 = min(max(chan0, 0), nchan)
+        chan1 = min(max(chan1, chan0), nchan)
+
+        if self.ndet is None:
+            self.ndet =  self.xrmmap.attrs['N_Detectors']
+        if det is None:
+            mapdats = [self._det_group(d) for d in range(1, self.ndet+1)]
+        else:
+            mapdats = [mapdat]
+        dtcorrect = bool(dtcorrect and
+                         (det is None or det in range(1, self.ndet+1)))
+
+        # a saved map is re-used only for the same detector, dead-time
+        # correction, channels and rows, as a name may be given
+        dname = 'sum' if det is None else h5str(mapdat.name.split('/')[-1])
+        if name is None:
+            name = 'erange_%s_%i_%i' % (dname, chan0, chan1)
+            if dtcorrect:
+                name = '%s_dtc' % name
+        last_row = self.xrmmap.attrs['Last_Row']
+        if cache and name in self.work_array_names():
+            dset = self.get_work_array(name)
+            attrs = dset.attrs
+            if (attrs.get('channels', None) is not None and
+                tuple(attrs['channels']) == (chan0, chan1) and
+                h5str(attrs.get('det', '')) == dname and
+                attrs.get('dtcorrect', None) == dtcorrect and
+                attrs.get('Last_Row', None) == last_row and
+                dset.shape == (ny, nx)):
+                return dset.value
+
+        # read blocks of whole chunk rows, of about 32 MB
+        counts = mapdats[0]['counts']
+        chunkrows = 1
+        if counts.chunks is not None:
+            chunkrows = counts.chunks[0]
+        blockbytes = max(1, nx*(chan1-chan0)*counts.dtype.itemsize)
+        nrows = max(1, int(2**25/(blockbytes*chunkrows)))*chunkrows
+
+        out = np.zeros((ny, nx))
+        for y1 in range(0, ny, nrows):
+            y2 = min(ny, y1+nrows)
+            for md in mapdats:
+                dat = md['counts'][y1:y2, :, chan0:chan1].sum(axis=2,
+                                                               dtype=np.float64)
+                if dtcorrect:
+                    dat *= md['dtfactor'][y1:y2, :]
+                out[y1:y2, :] += dat
+
+        if cache and self.check_hostid():
+            expr = 'erange(det=%s, dtcorrect=%s, channels=[%i:%i])'
+            expr = expr % (det, dtcorrect, chan0, chan1)
+            self.del_work_array(name)
+            self.add_work_array(out, name, expression=expr,
+                                info=json.dumps([]), channels=(chan0, chan1),
+                                det=dname, dtcorrect=dtcorrect,
+                                Last_Row=last_row)
+        return out
 
     def get_rgbmap(self, rroi, groi, broi, det=None, no_hotcols=True,
                    dtcorrect=True, scale_each=True, scales=None):
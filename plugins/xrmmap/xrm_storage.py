@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+"""
+HDF5 storage profiles for the MCA counts of XRM Map files,
+with tools to repack map files between profiles and to
+benchmark reading for the common access patterns.
+
+Storage profiles set the chunk shape for the (nrow, npts, nchan)
+counts arrays:
+
+  'append'   one chunk per row segment, for all channels in blocks
+             (the default, best for adding rows during collection)
+  'area'     square-ish blocks of pixels with all channels, best for
+             spectra from areas and rectangles (get_mca_area)
+  'channel'  large blocks of pixels with few channels, best for maps
+             of energy ranges (get_mca_erange)
+
+Compression can be 'lzf' (fast, the default), 'gzip' with a level
+(0 to 9), or None, and can be combined with the HDF5 shuffle filter.
+"""
+import os
+import time
+import h5py
+import numpy as np
+
+STORAGE_PROFILES = ('append', 'area', 'channel')
+
+# target size of a chunk of the counts array, in bytes
+CHUNK_BYTES = 2**19
+
+MCA_GROUP_TYPES = ('mca detector', 'virtual mca')
+
+def _pow2(x):
+    "largest power of 2 <= x, at least 1"
+    return 2**max(0, int(np.log2(max(1, x))))
+
+def mca_chunks(profile, npts, nchan, itemsize=2, nrow=None):
+    """chunk shape for an (nrow, npts, nchan) counts array
+    for a storage profile, with nrow=None for a growing array"""
+    if profile not in STORAGE_PROFILES:
+        raise ValueError("unknown storage profile '%s'" % profile)
+    if profile == 'append':
+        xnpts = max(10, npts)
+        nxx = min(xnpts-1, 2**int(np.log2(xnpts)))
+        nxm = 1024
+        if nxx > 256:
+            nxm = min(1024, int(65536*1.0/ nxx))
+        return (1, min(nxx, npts), min(nxm, nchan))
+    elif profile == 'area':
+        nc = nchan
+    else:
+        nc = min(nchan, 16)
+    npix = max(1, CHUNK_BYTES // (itemsize*nc))
+    nx = min(npts, _pow2(np.sqrt(npix)*2))
+    ny = max(1, npix // nx)
+    if nrow is not None:
+        ny = min(ny, max(1, nrow))
+    return (ny, nx, nc)
+
+def mca_storage(profile='append', npts=1, nchan=1, itemsize=2, nrow=None,
+                compression='lzf', shuffle=False, chunks=None):
+    """keyword arguments for h5py create_dataset() for an
+    (nrow, npts, nchan) counts array
+
+    Parameters
+    ----------
+    profile :      one of STORAGE_PROFILES ['append']
+    npts :         number of pixels per row
+    nchan :        number of MCA channels
+    itemsize :     size of data type in bytes [2]
+    nrow :         number of rows, or None for growing array [None]
+    compression :  'lzf', 'gzip', an int gzip level, or None ['lzf']
+    shuffle :      bool, whether to use shuffle filter [False]
+    chunks :       chunk shape, overriding the profile [None]
+    """
+    if chunks is None:
+        chunks = mca_chunks(profile, npts, nchan, itemsize=itemsize,
+                            nrow=nrow)
+    kws = {'chunks': tuple(chunks)}
+    if compression in ('none', 'None'):
+        compression = None
+    if compression is not None:
+        if isinstance(compression, int):
+            kws['compression'] = 'gzip'
+            kws['compression_opts'] = compression
+        else:
+            kws['compression'] = compression
+        if shuffle:
+            kws['shuffle'] = True
+    return kws
+
+def _is_counts(name, obj):
+    "is dataset the counts array of an mca detector group"
+    return (name == 'counts' and isinstance(obj, h5py.Dataset) and
+            len(obj.shape) == 3 and
+            obj.parent.attrs.get('type', '') in MCA_GROUP_TYPES)
+
+def _copy_counts(src, dest, name, blockbytes=2**26, **kws):
+    "copy a counts array in blocks of new chunks"
+    nrow, npts, nchan = src.shape
+    out = dest.create_dataset(name, src.shape, src.dtype,
+                              maxshape=(None, npts, nchan), **kws)
+    for key, val in src.attrs.items():
+        out.attrs[key] = val
+    cy, cx, cc = out.chunks
+    nc = nchan
+    if npts*nchan*cy*src.dtype.itemsize > blockbytes:
+        nc = max(1, blockbytes // (npts*cy*cc*src.dtype.itemsize))*cc
+    for y1 in range(0, nrow, cy):
+        y2 = min(nrow, y1+cy)
+        for c1 in range(0, nchan, nc):
+            c2 = min(nchan, c1+nc)
+            out[y1:y2, :, c1:c2] = src[y1:y2, :, c1:c2]
+    return out
+
+def _copy_group(src, dest, verbose=False, **kws):
+    "copy group, re-chunking mca counts"
+    for key, val in src.attrs.items():
+        dest.attrs[key] = val
+    for name, obj in src.items():
+        if isinstance(obj, h5py.Group):
+            _copy_group(obj, dest.create_group(name), verbose=verbose, **kws)
+        elif _is_counts(name, obj):
+            if verbose:
+                print('  repacking %s' % obj.name)
+            nrow, npts, nchan = obj.shape
+            storage = mca_storage(npts=npts, nchan=nchan, nrow=nrow,
+                                  itemsize=obj.dtype.itemsize, **kws)
+            _copy_counts(obj, dest, name, **storage)
+        else:
+            src.copy(obj, dest, name=name)
+
+def repack_xrmmap(infile, outfile, profile='area', compression='lzf',
+                  shuffle=False, chunks=None, verbose=False):
+    """repack an XRM Map HDF5 file, writing the MCA counts arrays
+    with a new storage profile, compression and shuffle filter.
+    All other data is copied unchanged.
+
+    Parameters
+    ----------
+    infile :       name of XRM Map file to read
+    outfile :      name of new XRM Map file to write
+    profile :      one of STORAGE_PROFILES ['area']
+    compression :  'lzf', 'gzip', an int gzip level, or None ['lzf']
+    shuffle :      bool, whether to use shuffle filter [False]
+    chunks :       chunk shape, overriding the profile [None]
+    """
+    if os.path.abspath(infile) == os.path.abspath(outfile):
+        raise ValueError("cannot repack '%s' to itself" % infile)
+    if profile not in STORAGE_PROFILES:
+        raise ValueError("unknown storage profile '%s'" % profile)
+    t0 = time.time()
+    with h5py.File(infile, 'r') as fin:
+        with h5py.File(outfile, 'w') as fout:
+            _copy_group(fin, fout, verbose=verbose, profile=profile,
+                        compression=compression, shuffle=shuffle,
+                        chunks=chunks)
+            for group in fout.values():
+                if 'roimap' in group and 'config' in group:
+                    group.attrs['Storage_Profile'] = profile
+    if verbose:
+        print('repacked %s -> %s (%.1f MB -> %.1f MB) in %.1f s' %
+              (infile, outfile, os.stat(infile).st_size/1.e6,
+               os.stat(outfile).st_size/1.e6, time.time()-t0))
+
+def _find_counts(fh):
+    "first mca counts array in file"
+    found = []
+    def visit(name, obj):
+        if not found and _is_counts(name.split('/')[-1], obj):
+            found.append(obj)
+    fh.visititems(visit)
+    if not found:
+        raise ValueError("no MCA counts found in '%s'" % fh.filename)
+    return found[0]
+
+def benchmark_xrmmap(filename, nrepeat=8, area=32, nchans=20,
+                     seed=0, verbose=True):
+    """benchmark reading the MCA counts of an XRM Map file for
+    the common access patterns of GSEXRM_MapFile:
+
+      'row'      full spectra for one row (processing, row viewing)
+      'pixel'    spectrum of one pixel
+      'area'     spectra for an area x area block (get_mca_area,
+                 get_mca_rect)
+      'channel'  map of nchans channels (get_mca_erange)
+
+    The file is reopened for each pattern, so that data read for one
+    pattern is not in the HDF5 chunk cache for the next.
+
+    Returns dict of (time per read in ms, throughput in MB/s)
+    for each pattern
+    """
+    rng = np.random.RandomState(seed)
+    with h5py.File(filename, 'r') as fh:
+        counts = _find_counts(fh)
+        cname = counts.name
+        nrow, npts, nchan = counts.shape
+        chunks = counts.chunks
+        itemsize = counts.dtype.itemsize
+    area = min(area, nrow, npts)
+    nchans = min(nchans, nchan)
+
+    def sel_row():
+        iy = rng.randint(nrow)
+        return (slice(iy, iy+1), slice(None), slice(None))
+    def sel_pixel():
+        iy, ix = rng.randint(nrow), rng.randint(npts)
+        return (slice(iy, iy+1), slice(ix, ix+1), slice(None))
+    def sel_area():
+        iy, ix = rng.randint(nrow-area+1), rng.randint(npts-area+1)
+        return (slice(iy, iy+area), slice(ix, ix+area), slice(None))
+    def sel_channel():
+        ic = rng.randint(nchan-nchans+1)
+        return (slice(None), slice(None), slice(ic, ic+nchans))
+
+    out = {}
+    for name, sel in (('row', sel_row), ('pixel', sel_pixel),
+                      ('area', sel_area), ('channel', sel_channel)):
+        nbytes, elapsed = 0, 0.0
+        with h5py.File(filename, 'r') as fh:
+            counts = fh[cname]
+            for i in range(nrepeat):
+                slices = sel()
+                t0 = time.time()
+                dat = counts[slices]
+                elapsed += time.time() - t0
+                nbytes += dat.size*itemsize
+        out[name] = (1.e3*elapsed/nrepeat, 1.e-6*nbytes/max(elapsed, 1.e-9))
+
+    if verbose:
+        print('%s: counts %s, chunks %s' % (filename, (nrow, npts, nchan),
+                                            chunks))
+        for name in ('row', 'pixel', 'area', 'channel'):
+            print('  %-8s %10.2f ms/read  %10.1f MB/s' % (name, out[name][0],
+                                                          out[name][1]))
+    return out
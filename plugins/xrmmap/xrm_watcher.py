@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+"""
+Watch a raw XRM Map folder during collection, reporting rows as
+they are completed.
+
+The Master file is read incrementally from the last byte offset
+read, so that only newly appended rows are parsed.  A row listed in
+the Master file is ready when all of its data files exist and none
+of them has been modified for `settle` seconds.
+
+On Linux, changes to the folder are detected with inotify, so that
+rows are reported within `settle` seconds of being finished.  On
+other systems, or if inotify is not available, the Master file is
+polled with os.stat() every `poll_time` seconds.
+"""
+import os
+import time
+import select
+import ctypes
+import ctypes.util
+from threading import Thread, Event
+from six.moves.queue import Queue, Empty
+
+# inotify events: file written and closed, file created or moved in
+IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE = 0x2, 0x8, 0x80, 0x100
+IN_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# default file prefixes for row files named 'None.NNNN' in Master file
+ROW_FILE_PREFIXES = ('xsp3', 'struck', 'xps', 'pexrd')
+
+def inotify_folder(folder):
+    """return an inotify file descriptor watching folder for
+    written and new files, or None if inotify is not available"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        fd = libc.inotify_init()
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    wd = libc.inotify_add_watch(fd, ctypes.c_char_p(folder.encode('utf-8')),
+                                ctypes.c_uint32(IN_MASK))
+    if wd < 0:
+        os.close(fd)
+        return None
+    return fd
+
+def row_files(row):
+    """data files for a row of a Master file, as (required, optional),
+    with the XRD file optional"""
+    files = []
+    for word, prefix in zip(row[1:5], ROW_FILE_PREFIXES):
+        if word.startswith('None'):
+            word = word.replace('None', prefix)
+        files.append(word)
+    if len(row) < 6:
+        return files[:3], []
+    return files[:3], files[3:4]
+
+class MapFolderWatcher(object):
+    """watch a raw map folder for completed rows
+
+    Parameters
+    ----------
+    folder :      name of raw map folder
+    masterfile :  name of Master file in folder ['Master.dat']
+    start_row :   index of first row to report [0]
+    callback :    function called for each row as it is ready, with
+                  keywords row, maxrow, folder and status='ready' [None]
+    settle :      time in seconds that row files must be unchanged
+                  for the row to be ready [0.5]
+    poll_time :   time in seconds between checks of the Master file
+                  when polling [1.0]
+    use_inotify : whether to use inotify when available [True]
+
+    Notes
+    -----
+    Rows are numbered as for GSEXRM_MapFile.rowdata, skipping rows
+    repeated in the Master file.  Ready rows are reported in order,
+    both to the callback and to a queue read with get_row() or
+    iter_rows(), with a row reported only after all earlier rows.
+
+    Use start() to watch in a background thread, or call check()
+    to look for ready rows once.
+    """
+    def __init__(self, folder, masterfile='Master.dat', start_row=0,
+                 callback=None, settle=0.5, poll_time=1.0,
+                 use_inotify=True):
+        self.folder = folder
+        self.masterfile = os.path.join(folder, masterfile)
+        self.callback = callback
+        self.settle = settle
+        self.poll_time = poll_time
+        self.use_inotify = use_inotify
+        self.header = []
+        self.rows = []
+        self.offset = 0
+        self.next_row = start_row
+        self.start_row = start_row
+        self.queue = Queue()
+        self.inotify_fd = None
+        # pipe to wake a thread waiting in select() when stopped
+        self.wake_fds = None
+        self.thread = None
+        self._stop = Event()
+        self._partial = b''
+
+    def read_master(self):
+        """read lines appended to the Master file since the last read,
+        returning the number of new rows"""
+        try:
+            size = os.stat(self.masterfile).st_size
+        except OSError:
+            return 0
+        if size < self.offset:       # Master file rewritten: start over
+            self.header, self.rows = [], []
+            self.offset, self.next_row = 0, self.start_row
+            self._partial = b''
+        if size == self.offset:
+            return 0
+        with open(self.masterfile, 'rb') as fh:
+            fh.seek(self.offset)
+            text = fh.read(size - self.offset)
+        self.offset += len(text)
+        text = self._partial + text
+        # keep an incomplete last line for the next read
+        lines = text.split(b'\n')
+        self._partial = lines.pop()
+        nrows = len(self.rows)
+        for line in lines:
+            line = line.decode('utf-8', 'replace').rstrip('\r')
+            if line.startswith('#') or line.startswith(';'):
+                self.header.append(line)
+                continue
+            row = line.split()
+            if len(row) < 4:
+                continue
+            # skip repeated rows, as GSEXRM_MapFile.read_master()
+            if len(self.rows) > 0:
+                yval, xrff = self.rows[-1][0], self.rows[-1][1]
+                if not (row[0] != yval and row[1] != xrff):
+                    continue
+            self.rows.append(row)
+        return len(self.rows) - nrows
+
+    def row_ready(self, irow):
+        "return whether all data files for a row are finished"
+        required, optional = row_files(self.rows[irow])
+        tnow = time.time()
+        for fname in required + optional:
+            try:
+                mtime = os.stat(os.path.join(self.folder, fname)).st_mtime
+            except OSError:
+                if fname in required:
+                    return False
+                continue
+            if tnow - mtime < self.settle:
+                return False
+        return True
+
+    def check(self):
+        """read new rows from Master file and report rows that are
+        ready, returning list of newly ready rows"""
+        self.read_master()
+        ready = []
+        while self.next_row < len(self.rows) and self.row_ready(self.next_row):
+            ready.append(self.next_row)
+            self.queue.put(self.next_row)
+            if hasattr(self.callback, '__call__'):
+                self.callback(row=self.next_row, maxrow=len(self.rows),
+                              folder=self.folder, status='ready')
+            self.next_row += 1
+        return ready
+
+    @property
+    def pending(self):
+        "whether rows are listed in the Master file but not yet ready"
+        return self.next_row < len(self.rows)
+
+    def wait(self, timeout):
+        """wait up to timeout seconds for a change in the folder,
+        returning whether a change was seen"""
+        if self.inotify_fd is None:
+            self._stop.wait(timeout)
+            return False
+        fds = [self.inotify_fd]
+        if self.wake_fds is not None:
+            fds.append(self.wake_fds[0])
+        try:
+            ready = select.select(fds, [], [], timeout)[0]
+        except (OSError, select.error, ValueError):
+            return False
+        if self.inotify_fd not in ready:
+            return False
+        # drain events, and let a burst of writes finish
+        os.read(self.inotify_fd, 65536)
+        self._stop.wait(0.05)
+        return True
+
+    def run(self):
+        "watch folder until stop() is called"
+        while not self._stop.is_set():
+            self.check()
+            if self.pending:
+                timeout = self.settle
+            else:
+                timeout = self.poll_time
+                if self.inotify_fd is not None:
+                    timeout = 10*self.poll_time
+            self.wait(timeout)
+
+    def start(self):
+        "start watching folder in a background thread"
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self._stop.clear()
+        if self.use_inotify and self.inotify_fd is None:
+            self.inotify_fd = inotify_folder(self.folder)
+        if self.inotify_fd is not None and self.wake_fds is None:
+            self.wake_fds = os.pipe()
+        self.thread = Thread(target=self.run, name='MapFolderWatcher')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        "stop watching folder"
+        self._stop.set()
+        if self.wake_fds is not None:
+            os.write(self.wake_fds[1], b'x')
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+        if self.wake_fds is not None:
+            for fd in self.wake_fds:
+                os.close(fd)
+            self.wake_fds = None
+
+    def get_row(self, timeout=None):
+        """return index of next ready row, waiting up to timeout
+        seconds, or None if no row is ready"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def iter_rows(self, timeout=None):
+        """iterate over ready rows as they are completed, until the
+        watcher is stopped or no row is ready for timeout seconds"""
+        while True:
+            if timeout is None:
+                irow = self.get_row(timeout=self.poll_time)
+            else:
+                irow = self.get_row(timeout=timeout)
+            if irow is None:
+                if timeout is not None or self._stop.is_set():
+                    return
+                continue
+            yield irow
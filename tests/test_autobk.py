@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+""" Larch Tests: autobk() background removal """
+import unittest
+import importlib
+import numpy as np
+from scipy.special import erf
+
+from utils import TestCase
+
+class TestAutobk(TestCase):
+    '''test autobk() results and its residual Jacobian'''
+    def setUp(self):
+        TestCase.setUp(self)
+        self.autobk = importlib.import_module('larch_plugins.xafs.autobk')
+        self.ETOK = importlib.import_module('larch_plugins.xafs').ETOK
+
+    def test_known_spectrum(self):
+        # mu(E) from a smooth background and a chi(k) with
+        # no components below rbkg
+        e0 = 9000.0
+        energy = np.concatenate((np.arange(8800, 8980, 2.0),
+                                 np.arange(8980, 9020, 0.5),
+                                 e0 + np.arange(20.0, 1001, 1.0)))
+        de = energy - e0
+        dep = np.maximum(de, 0)
+        step = 0.5 + 0.5*erf(de/3.0)
+        bkg = 0.1 - 1.e-5*de + step*(1.0 - 2.e-4*dep + 8.e-8*dep**2)
+        k = np.sqrt(dep*self.ETOK)
+        chi = (0.5*np.sin(5.0*k + 0.3)*np.exp(-0.010*k*k) +
+               0.3*np.sin(7.2*k - 0.4)*np.exp(-0.016*k*k))/(1+k)
+        grp = self.session._larch.symtable.create_group()
+        self.autobk.autobk(energy, bkg + step*chi, group=grp, rbkg=1.0,
+                           kweight=2, e0=e0, edge_step=1.0,
+                           _larch=self.session._larch)
+        expected = np.interp(grp.k, k[de > 0], chi[de > 0])
+        self.assertTrue(np.allclose(grp.chi[grp.k > 2], expected[grp.k > 2],
+                                    rtol=0, atol=0.01))
+        self.assertTrue(np.allclose(grp.bkg[de > 30], bkg[de > 30],
+                                    rtol=0, atol=0.003))
+
+    def test_cu_spectrum(self):
+        self.trytext("""
+dat = read_ascii('../examples/xafsdata/cu_rt01.xmu', labels='energy mu')
+autobk(dat, rbkg=1.0, kweight=2, clamp_hi=10)
+""")
+        self.NoExceptionRaised()
+        dat = self.getSym('dat')
+        self.assertTrue(np.allclose(dat.e0, 8980.5))
+        self.assertTrue(np.allclose(dat.edge_step, 2.73575, rtol=1.e-5))
+        # chi(k) away from the edge, where the fit is well determined
+        kvals = [4, 6, 8, 10, 12, 14]
+        chi = [-0.034426, -0.002648, 0.022763, -0.007306, 0.001740, -0.001423]
+        ik = [np.argmin(abs(dat.k - k)) for k in kvals]
+        self.assertTrue(np.allclose(dat.chi[ik], chi, rtol=0, atol=1.e-4))
+        ie = [np.argmin(abs(dat.energy - dat.e0 - de)) for de in (30, 100, 300)]
+        self.assertTrue(np.allclose(dat.bkg[ie],
+                                    [1.271455, 1.277585, 1.038709],
+                                    rtol=0, atol=2.e-4))
+        # the fit is at least as good as with the earlier autobk(),
+        # which reached a sum of squares of 0.005833
+        autobk = self.autobk
+        prep = autobk._autobk_prep(dat.energy, dat.mu, group=dat, rbkg=1.0,
+                                   kweight=2, _larch=self.session._larch)
+        basis = autobk._autobk_basis(prep, kweight=2, nclamp=4)
+        chis, chis_std, ftchis = autobk._autobk_chis([prep])
+        resid = autobk.__dict__['__resid'](
+            dat.autobk_details.params, ncoefs=len(prep.coefs),
+            ftchi=ftchis[0], ftbasis=basis.ft,
+            clampchi=chis_std[0][basis.iclamp]*basis.clampk,
+            clampbasis=basis.clamp, nclamp=4, clamp_lo=1, clamp_hi=10)
+        self.assertTrue((resid*resid).sum() < 0.00570)
+
+    def test_jacobian(self):
+        # analytic Jacobian, including the clamp scale, matches
+        # finite differences of the residual
+        autobk = self.autobk
+        self.trytext("dat = read_ascii('../examples/xafsdata/cu_10k.xmu', labels='energy mu')")
+        dat = self.getSym('dat')
+        prep = autobk._autobk_prep(dat.energy, dat.mu, group=dat, rbkg=1.0,
+                                   kweight=2, _larch=self.session._larch)
+        nvarys = prep.nspl
+        rng = np.random.RandomState(3)
+        for nclamp, clamp_lo, clamp_hi in ((0, 1, 1), (2, 1, 1), (4, 3, 20)):
+            basis = autobk._autobk_basis(prep, kweight=2, nclamp=nclamp)
+            chis, chis_std, ftchis = autobk._autobk_chis([prep])
+            kws = dict(ncoefs=len(prep.coefs), nvarys=nvarys,
+                       ftchi=ftchis[0], ftbasis=basis.ft,
+                       clampchi=chis_std[0][basis.iclamp]*basis.clampk,
+                       clampbasis=basis.clamp, nclamp=nclamp,
+                       clamp_lo=clamp_lo, clamp_hi=clamp_hi)
+            coefs = prep.coefs*(1 + 0.01*rng.normal(size=len(prep.coefs)))
+            params = autobk._autobk_params(coefs, nvarys)
+            jac = autobk.__dict__['__jacobian'](params, **kws)
+            fdjac = np.zeros_like(jac)
+            for i in range(nvarys):
+                delta = 1.e-6*max(1, abs(coefs[i]))
+                resids = []
+                for sign in (1, -1):
+                    trial = coefs.copy()
+                    trial[i] += sign*delta
+                    resids.append(autobk.__dict__['__resid'](
+                        autobk._autobk_params(trial, nvarys), **kws))
+                fdjac[:, i] = (resids[0] - resids[1])/(2*delta)
+            self.assertEqual(jac.shape, (len(basis.ft) + 2*nclamp, nvarys))
+            scale = abs(fdjac).max(axis=0)
+            self.assertTrue((abs(jac - fdjac) < 1.e-5*scale).all())
+            if nclamp > 0:
+                # the clamp Jacobian without the derivative of the
+                # scale would be far from the finite differences
+                out = ftchis[0] - basis.ft.dot(coefs)
+                cscale = (1.0 + 100*(out*out).sum())/(len(out)*nclamp)
+                wts = np.array(nclamp*[clamp_lo] + nclamp*[clamp_hi])
+                fixed = -(wts*cscale)[:, np.newaxis]*basis.clamp[:, :nvarys]
+                err = abs(fixed - fdjac[-2*nclamp:]).max(axis=0)
+                self.assertTrue((err > 1.e-3*scale).any())
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestAutobk,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+""" Larch Tests: autobk_batch() compared to autobk() """
+import unittest
+import numpy as np
+
+from utils import TestCase
+
+class TestAutobkBatch(TestCase):
+    '''test autobk_batch()'''
+    def setUp(self):
+        TestCase.setUp(self)
+        self.trytext("""
+fnames = ['cu_rt01.xmu', 'cu_10k.xmu', 'cu_50k.xmu', 'cu_150k.xmu']
+singles, batch = [], []
+for fname in fnames:
+    dat = read_ascii('../examples/xafsdata/%s' % fname, labels='energy mu')
+    pre_edge(dat)
+    singles.append(dat)
+    batch.append(group(energy=dat.energy[:], mu=dat.mu[:],
+                       e0=dat.e0, edge_step=dat.edge_step))
+#endfor
+""")
+        self.NoExceptionRaised()
+
+    def test_batch_matches_autobk(self):
+        self.trytext("""
+for dat in singles:
+    autobk(dat, rbkg=1.0, kweight=2, clamp_hi=10)
+#endfor
+autobk_batch(batch, rbkg=1.0, kweight=2, clamp_hi=10)
+""")
+        self.NoExceptionRaised()
+        singles = self.getSym('singles')
+        batch = self.getSym('batch')
+        # autobk() stops at a tolerance of 1.e-5, while the batch fit
+        # converges more tightly
+        for one, bat in zip(singles, batch):
+            self.assertTrue(np.allclose(one.k, bat.k))
+            self.assertTrue(np.allclose(one.chi, bat.chi, atol=2.e-4))
+            self.assertTrue(np.allclose(one.bkg, bat.bkg, atol=5.e-4))
+            self.assertTrue(np.allclose(one.delta_chi, bat.delta_chi,
+                                        atol=1.e-5))
+
+    def test_stack_fit(self):
+        # the stacked fit gives the least-squares solution for each spectrum
+        import importlib
+        autobk = importlib.import_module('larch_plugins.xafs.autobk')
+        _larch = self.session._larch
+        preps = []
+        for grp in self.getSym('batch'):
+            prep = autobk._autobk_prep(grp.energy, grp.mu, group=grp,
+                                       kweight=2, kmax=15, _larch=_larch)
+            prep.basis = autobk._autobk_basis(prep, kweight=2, nclamp=4)
+            preps.append(prep)
+        # with a common kmax, all spectra have the same number of knots
+        self.assertEqual(len(set(len(p.coefs) for p in preps)), 1)
+        nvarys = preps[0].nspl
+        chis, chis_std, ftchis = autobk._autobk_chis(preps)
+        clampwts = np.array(4*[1.0] + 4*[10.0])
+        clampchis = np.array([c[p.basis.iclamp]*p.basis.clampk
+                              for c, p in zip(chis_std, preps)])
+        args = (ftchis, np.array([p.basis.ft for p in preps]), clampchis,
+                np.array([p.basis.clamp for p in preps]), clampwts)
+        results = autobk._autobk_stackfit(np.array([p.coefs for p in preps]),
+                                          nvarys, *args)
+        coefs = np.array([[p.value for p in r.params.values()]
+                          for r in results])
+        resid, jac = autobk._stack_resid(coefs, nvarys, *args)
+        cost = (resid*resid).sum(axis=1)
+        # the gradient of the cost is 0, and the cost is not lowered
+        # by moving any coefficient
+        grad = np.einsum('sri,sr->si', jac, resid)
+        scale = np.sqrt((jac*jac).sum(axis=1)*cost[:, np.newaxis])
+        self.assertTrue((abs(grad) < 1.e-5*scale).all())
+        for i in range(nvarys):
+            for delta in (-1.e-4, 1.e-4):
+                trial = coefs.copy()
+                trial[:, i] += delta
+                tresid = autobk._stack_resid(trial, nvarys, *args)[0]
+                self.assertTrue(((tresid*tresid).sum(axis=1) >= cost).all())
+
+        # the same as from a tightly converged fit with lmfit
+        prep = preps[0]
+        kws = dict(ncoefs=len(prep.coefs), nvarys=nvarys, ftchi=ftchis[0],
+                   ftbasis=prep.basis.ft, clampchi=clampchis[0],
+                   clampbasis=prep.basis.clamp, nclamp=4, clamp_lo=1,
+                   clamp_hi=10)
+        fit = autobk.minimize(autobk.__dict__['__resid'],
+                              autobk._autobk_params(prep.coefs, nvarys),
+                              method='leastsq', kws=kws, ftol=1.e-13,
+                              xtol=1.e-13, gtol=1.e-13,
+                              Dfun=autobk.__dict__['__jacobian'])
+        lmcoefs = np.array([p.value for p in fit.params.values()])
+        self.assertTrue(np.allclose(lmcoefs, coefs[0], rtol=0, atol=1.e-6))
+        self.assertTrue(np.allclose(fit.redchi, results[0].redchi))
+        self.assertTrue(np.allclose(fit.covar, results[0].covar,
+                                    rtol=1.e-6))
+
+    def test_batch_common_e0(self):
+        self.trytext("""
+e0 = singles[0].e0
+for dat in singles:
+    autobk(dat, e0=e0)
+#endfor
+autobk_batch(batch, e0=e0)
+""")
+        self.NoExceptionRaised()
+        for one, bat in zip(self.getSym('singles'), self.getSym('batch')):
+            self.assertTrue(np.allclose(one.chi, bat.chi, atol=1.e-6))
+
+    def test_batch_missing_mu(self):
+        out, err = self.trytext("autobk_batch([batch[0], group(energy=batch[1].energy)])")
+        self.ExceptionRaised()
+        msg = str(err[0].exc_info[1])
+        self.assertTrue('group 1' in msg and "'mu'" in msg)
+        # no group was processed
+        self.assertFalse(hasattr(self.getSym('batch')[0], 'chi'))
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestAutobkBatch,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+""" Larch Tests: Cauchy wavelet transform """
+import unittest
+import importlib
+import numpy as np
+
+from utils import TestCase
+
+def cauchy_loop(k, chi, kweight=0, rmax_out=10, nfft=2048):
+    """the earlier cauchy_wavelet(), with one inverse FFT per R value"""
+    kstep = np.round(1000.*(k[1]-k[0]))/1000.0
+    rstep = (np.pi/2048)/kstep
+    nrpts = int(np.round((rmax_out-1.e-7)/rstep))
+    nkout = len(k)
+    if kweight != 0:
+        chi = chi * k**kweight
+    NFT = int(nfft/2)
+    xnew = np.zeros(NFT)
+    xnew[:min(len(k), NFT)] = chi[:NFT]
+    omega = 2*np.pi*(1.0/kstep)*np.arange(nfft)/(2*nfft)
+    tff = np.fft.fft(xnew, n=2*nfft)
+    r = np.linspace(0, rmax_out, nrpts)
+    r[0] = 1.e-19
+    a = nrpts/(2*r)
+    cauchy_sum = np.log(2*np.pi) - np.log(1.0+np.arange(nrpts)).sum()
+    out = np.zeros((nrpts, nkout), dtype='complex128')
+    for i in range(nrpts):
+        aom = a[i]*omega
+        aom[np.where(aom==0)] = 1.e-19
+        filt = cauchy_sum + nrpts*np.log(aom) - aom
+        tmp = np.conj(np.exp(filt))*tff[:nfft]
+        out[i, :] = np.fft.ifft(tmp, 2*nfft)[:nkout]
+    return r, out
+
+class TestCauchyWavelet(TestCase):
+    '''test cauchy_wavelet() against the per-R loop'''
+    def setUp(self):
+        TestCase.setUp(self)
+        self.wavelet = importlib.import_module('larch_plugins.xafs.cauchy_wavelet')
+        self._larch = self.session._larch
+        self.k = 0.05*np.arange(321)
+        k = self.k
+        rng = np.random.RandomState(4)
+        self.chi = (np.sin(2*2.5*k)*np.exp(-0.01*k*k) +
+                    0.4*np.sin(2*4.1*k + 0.5)*np.exp(-0.02*k*k) +
+                    0.01*rng.normal(size=len(k)))
+
+    def transform(self, **kws):
+        grp = self._larch.symtable.create_group()
+        self.wavelet.cauchy_wavelet(self.k, self.chi, group=grp,
+                                    _larch=self._larch, **kws)
+        return grp
+
+    def check(self, grp, r, out, rtol):
+        self.assertTrue(np.allclose(grp.r, r))
+        self.assertEqual(grp.wcauchy.shape, out.shape)
+        scale = abs(out).max()
+        self.assertTrue(scale > 0)
+        self.assertTrue(np.allclose(grp.wcauchy, out, rtol=0, atol=rtol*scale))
+        self.assertTrue(np.allclose(grp.wcauchy_mag, abs(out),
+                                    rtol=0, atol=rtol*scale))
+        self.assertTrue(np.allclose(grp.wcauchy_re, out.real,
+                                    rtol=0, atol=rtol*scale))
+        self.assertTrue(np.allclose(grp.wcauchy_im, out.imag,
+                                    rtol=0, atol=rtol*scale))
+
+    def test_matches_loop(self):
+        for kweight in (0, 2):
+            r, out = cauchy_loop(self.k, self.chi, kweight=kweight)
+            grp = self.transform(kweight=kweight)
+            self.assertEqual(grp.wcauchy.dtype, np.complex128)
+            self.check(grp, r, out, 1.e-10)
+
+    def test_rchunk(self):
+        r, out = cauchy_loop(self.k, self.chi, kweight=1, rmax_out=6)
+        # chunks that do and do not divide the number of R values,
+        # and all R values at once
+        for rchunk in (1, 7, 64, len(r), 5000, None, 0):
+            grp = self.transform(kweight=1, rmax_out=6, rchunk=rchunk)
+            self.check(grp, r, out, 1.e-10)
+
+    def test_single_precision(self):
+        r, out = cauchy_loop(self.k, self.chi, kweight=2)
+        for rchunk in (64, None):
+            grp = self.transform(kweight=2, single_precision=True,
+                                 rchunk=rchunk)
+            self.assertEqual(grp.wcauchy.dtype, np.complex64)
+            self.assertEqual(grp.wcauchy_mag.dtype, np.float32)
+            self.check(grp, r, out, 1.e-5)
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestCauchyWavelet,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+""" Larch Tests: compiled mode gives the same results and errors """
+import os
+import sys
+import unittest
+import larch
+from six.moves import StringIO
+
+from larch import Interpreter
+
+SCRIPTS = (('loops', '''
+out = []
+for i in range(10):
+    if i == 3:
+        continue
+    endif
+    if i == 8:
+        break
+    endif
+    out.append(i*i)
+endfor
+x, total = 0, 0
+while x < 20:
+    x += 1
+    if x % 2 == 0:
+        continue
+    endif
+    total += x
+    if total > 50:
+        break
+    endif
+endwhile
+pairs = [(i, j) for i in range(3) for j in range(i)]
+print('loops: ', out, x, total)
+'''),
+           ('procedures', '''
+def add(a, b=2, **kws):
+    return a + b, kws
+enddef
+def vsum(a, *args):
+    s = a
+    for v in args:
+        s += v
+    endfor
+    return s
+enddef
+def fact(n):
+    if n <= 1:
+        return 1
+    endif
+    return n * fact(n-1)
+enddef
+r1 = add(1)
+r2 = add(1, b=3, z=1), vsum(1, 3, 4, 5)
+r3 = fact(10)
+print('procedures: ', r1, r2, r3)
+'''),
+           ('tryexcept', '''
+try:
+    z = 1/0
+except ZeroDivisionError:
+    z = -1
+endtry
+try:
+    q = [1, 2][5]
+except IndexError:
+    q = None
+else:
+    q = 0
+endtry
+try:
+    w = {'a': 1}['a']
+except KeyError:
+    w = None
+endtry
+print('tryexcept: ', z, q, w)
+'''),
+           ('name_error', 'y = undefined_name + 1'),
+           ('proc_error', '''
+def inner(y):
+    return y['key']
+enddef
+def outer(x):
+    y = x + 1
+    return inner(y)
+enddef
+outer(3)
+'''),
+           ('loop_error', '''
+for i in range(3):
+    a = [1, 2][i]
+endfor
+'''),
+           ('zero_division', '''
+def ratio(a, b):
+    return a/b
+enddef
+val = ratio(1, 0)
+'''),
+           ('uncaught', '''
+try:
+    v = [1][3]
+except KeyError:
+    v = 0
+endtry
+'''),
+           ('bad_call', 'add(1, 2, b=3)'),
+           ('syntax_error', 'x = = 1'))
+
+RESULTS = ('out', 'x', 'total', 'pairs', 'r1', 'r2', 'r3', 'z', 'q', 'w')
+
+class TestCompiledMode(unittest.TestCase):
+    '''run scripts with and without use_compiler'''
+    def setUp(self):
+        # frames inside larch are left out of error messages only for
+        # an installed larch, so treat this larch as installed
+        self.prefix = sys.prefix
+        sys.prefix = os.path.dirname(os.path.dirname(larch.__file__))
+
+    def tearDown(self):
+        sys.prefix = self.prefix
+
+    def run_scripts(self, use_compiler):
+        "output, errors for each script, and final values"
+        interp = Interpreter(use_compiler=use_compiler)
+        interp.writer = StringIO()
+        out = []
+        for name, text in SCRIPTS:
+            interp.error = []
+            interp.eval(text, fname=name)
+            errors = [err.get_error() for err in interp.error]
+            out.append((name, errors))
+        values = {}
+        for sym in RESULTS:
+            values[sym] = interp.symtable.get_symbol(sym, create=True)
+        return out, interp.writer.getvalue(), values
+
+    def test_compare(self):
+        errs_int, text_int, vals_int = self.run_scripts(False)
+        errs_cmp, text_cmp, vals_cmp = self.run_scripts(True)
+        self.assertEqual(vals_int, vals_cmp)
+        self.assertEqual(text_int, text_cmp)
+        for (name, err_int), (_, err_cmp) in zip(errs_int, errs_cmp):
+            self.assertEqual(err_int, err_cmp, msg=name)
+            self.assertTrue('astcompiler' not in repr(err_cmp))
+
+    def test_results(self):
+        errors, text, values = self.run_scripts(True)
+        self.assertEqual(values['out'], [0, 1, 4, 16, 25, 36, 49])
+        self.assertEqual((values['x'], values['total']), (15, 64))
+        self.assertEqual(values['r2'], ((4, {'z': 1}), 13))
+        self.assertEqual(values['r3'], 3628800)
+        self.assertEqual((values['z'], values['q'], values['w']),
+                         (-1, None, 1))
+        errors = dict(errors)
+        for name in ('loops', 'procedures', 'tryexcept'):
+            self.assertEqual(errors[name], [])
+        for name, exc in (('name_error', 'NameError'),
+                          ('proc_error', 'AttributeError'),
+                          ('loop_error', 'IndexError'),
+                          ('zero_division', 'ZeroDivisionError'),
+                          ('uncaught', 'IndexError'),
+                          ('syntax_error', 'SyntaxError')):
+            self.assertTrue(len(errors[name]) > 0, msg=name)
+            self.assertEqual(errors[name][0][0], exc, msg=name)
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestCompiledMode,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
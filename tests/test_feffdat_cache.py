@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+""" Larch Tests: cached intermediate arrays for FeffPath chi(k) """
+import unittest
+import numpy as np
+
+from utils import TestCase
+
+FEFFDAT = '../examples/feffit/feff0001.dat'
+
+class TestFeffdatCache(TestCase):
+    '''test FeffPathGroup._calc_chi() cache'''
+    def setUp(self):
+        TestCase.setUp(self)
+        self.trytext("""
+path1 = feffpath('%s')
+path2 = feffpath('%s')
+""" % (FEFFDAT, FEFFDAT))
+        self.NoExceptionRaised()
+        self.path1 = self.getSym('path1')
+        self.path2 = self.getSym('path2')
+
+    def uncached_chi(self, **kws):
+        "chi(k) for path2 with an empty cache"
+        self.path2._calc_cache.clear()
+        self.path2._calc_chi(**kws)
+        return self.path2.chi
+
+    def test_cached_matches_uncached(self):
+        k = 0.05*np.arange(301)
+        steps = [dict(e0=0.0, ei=0.0, sigma2=0.002),
+                 dict(e0=1.5, ei=0.0, sigma2=0.002),
+                 dict(e0=1.5, ei=0.5, sigma2=0.002),
+                 dict(e0=1.5, ei=0.5, sigma2=0.006),
+                 dict(e0=1.5, ei=0.5, sigma2=0.006, deltar=0.01),
+                 dict(e0=-2.0, ei=0.5, sigma2=0.006, deltar=0.01),
+                 dict(e0=-2.0, ei=0.0, sigma2=0.003, degen=2, s02=0.9),
+                 dict(e0=0.0, ei=0.0, sigma2=0.002)]
+        for kws in steps:
+            self.path1._calc_chi(k=k, **kws)
+            expected = self.uncached_chi(k=k, **kws)
+            self.assertTrue(np.allclose(self.path1.chi, expected,
+                                        rtol=1.e-12, atol=1.e-14))
+
+    def test_cache_is_lru(self):
+        kgrids = [0.05*np.arange(200+i) for i in range(5)]
+        for k in kgrids[:4]:
+            self.path1._calc_chi(k=k, e0=1.0)
+        # use the first k grid again, so that the second is dropped
+        self.path1._calc_chi(k=kgrids[0], e0=1.0)
+        self.path1._calc_chi(k=kgrids[4], e0=1.0)
+        keys = [key[0] for key in self.path1._calc_cache.keys()]
+        self.assertEqual(len(keys), 4)
+        self.assertTrue(kgrids[0].tobytes() in keys)
+        self.assertFalse(kgrids[1].tobytes() in keys)
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestFeffdatCache,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+""" Larch Tests: feffit() with several workers """
+import unittest
+import numpy as np
+
+from utils import TestCase
+
+class TestFeffitWorkers(TestCase):
+    '''test that feffit() gives the same result with more workers'''
+    def setUp(self):
+        TestCase.setUp(self)
+        self.trytext("""
+cu_data = read_ascii('../examples/xafsdata/cu.chi', labels='k, chi')
+dsets = []
+for i, kw in enumerate((1, 2, 3)):
+    paths = [feffpath('../examples/feffit/feff000%i.dat' % j, s02='amp',
+                      e0='del_e0', sigma2='sig2_%i' % j,
+                      deltar='alpha*reff') for j in (1, 2, 3)]
+    trans = feffit_transform(kmin=3, kmax=16-i, kw=kw, dk=4,
+                             window='kaiser', rmin=1.4, rmax=3.4)
+    dsets.append(feffit_dataset(data=cu_data, pathlist=paths,
+                                transform=trans))
+#endfor
+""")
+        self.NoExceptionRaised()
+
+    def fit(self, **kws):
+        self.trytext("""
+pars = group(amp=param(1, vary=True), del_e0=guess(0.1),
+             sig2_1=param(.002, vary=True), sig2_2=param(.002, vary=True),
+             sig2_3=param(.002, vary=True), alpha=guess(0))
+out = feffit(pars, dsets, %s)
+""" % ', '.join('%s=%r' % item for item in kws.items()))
+        self.NoExceptionRaised()
+        out = self.getSym('out')
+        names = ('amp', 'del_e0', 'sig2_1', 'sig2_2', 'sig2_3', 'alpha')
+        return (np.array([out.params[n].value for n in names]),
+                np.array([out.params[n].stderr for n in names]),
+                out.chi_square, out.nfev)
+
+    def check_same(self, result, expected):
+        vals, stderrs, chisqr, nfev = result
+        self.assertTrue(np.allclose(vals, expected[0], rtol=1.e-12))
+        self.assertTrue(np.allclose(stderrs, expected[1], rtol=1.e-12))
+        self.assertTrue(np.allclose(chisqr, expected[2], rtol=1.e-12))
+        self.assertEqual(nfev, expected[3])
+
+    def test_threads(self):
+        expected = self.fit(workers=1)
+        self.check_same(self.fit(workers=2), expected)
+        self.check_same(self.fit(workers=3), expected)
+
+    def test_processes(self):
+        expected = self.fit(workers=1)
+        self.check_same(self.fit(workers=2, processes=True), expected)
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestFeffitWorkers,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
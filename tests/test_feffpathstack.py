@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+""" Larch Tests: chi(k) for a stack of Feff paths """
+import unittest
+import importlib
+import numpy as np
+
+from utils import TestCase
+
+FEFFDATS = ['../examples/feffit/feff_feo0%i.dat' % i for i in range(1, 7)]
+FEFFDATS.append('../examples/feffit/feff0001.dat')
+
+class TestFeffPathStack(TestCase):
+    '''test FeffPathStack.calc_chi() against _calc_chi() for each path'''
+    def setUp(self):
+        TestCase.setUp(self)
+        self.trytext("""
+paths = []
+for i, fname in enumerate(%r):
+    paths.append(feffpath(fname, label='p%%i' %% i, s02='amp', e0='de0',
+                          deltar='alpha*reff', sigma2='sig2 + 0.001*reff',
+                          third='sigma2_eins(10, 400)/100'))
+#endfor
+paths[1].e0 = 'de0 + de0_1'
+paths[2].ei = 'ei_2'
+paths[3].degen = 2
+""" % FEFFDATS)
+        self.NoExceptionRaised()
+        self.paths = self.getSym('paths')
+        feffdat = importlib.import_module('larch_plugins.xafs.feffdat')
+        self.FeffPathStack = feffdat.FeffPathStack
+        self.fiteval = self.session._larch.symtable._sys.fiteval
+        self.set_pars(amp=0.9, de0=1.0, de0_1=0.0, ei_2=0.0,
+                      alpha=0.0, sig2=0.003)
+        for path in self.paths:
+            path.create_path_params()
+        self.k = 0.05*np.arange(341)
+
+    def set_pars(self, **kws):
+        self.fiteval.symtable.update(kws)
+
+    def summed_chi(self, interp):
+        "sum of chi(k) from _calc_chi() of each path"
+        out = []
+        for path in self.paths:
+            path._calc_cache.clear()
+            path._calc_chi(k=self.k, interp=interp)
+            out.append(path.chi)
+        return np.array(out)
+
+    def stack_chi(self, stack):
+        "chi(k) for each path, and its sum, from FeffPathStack"
+        chi = stack.calc_chi()
+        return chi, np.array([path.chi for path in self.paths])
+
+    def check_stack(self, interp):
+        stack = self.FeffPathStack(self.paths, self.k, interp=interp)
+        steps = [{},
+                 dict(de0=2.5),
+                 dict(de0_1=-3.0),
+                 dict(ei_2=0.8),
+                 dict(alpha=0.01, sig2=0.005),
+                 dict(amp=0.7),
+                 dict(de0=-1.0, de0_1=0.0, ei_2=0.0, alpha=0.0)]
+        for kws in steps:
+            self.set_pars(**kws)
+            total, chis = self.stack_chi(stack)
+            expected = self.summed_chi(interp)
+            self.assertTrue(np.allclose(chis, expected, rtol=1.e-10,
+                                        atol=1.e-13))
+            self.assertTrue(np.allclose(total, expected.sum(axis=0),
+                                        rtol=1.e-10, atol=1.e-13))
+
+    def test_cubic(self):
+        self.check_stack('cubic')
+
+    def test_linear(self):
+        self.check_stack('linear')
+
+    def test_path_values(self):
+        stack = self.FeffPathStack(self.paths, self.k)
+        self.set_pars(amp=0.8, de0=1.5, de0_1=0.5, ei_2=0.3,
+                      alpha=0.02, sig2=0.004)
+        vals = stack.path_values()
+        for path, row in zip(self.paths, vals):
+            pvals = path.path_paramvals()
+            self.assertTrue(np.allclose(row, [pvals[p] for p in
+                                              ('degen', 's02', 'e0', 'ei',
+                                               'deltar', 'sigma2', 'third',
+                                               'fourth')]))
+        # values that do not depend on the path are shared, but are
+        # still evaluated on each call
+        self.set_pars(amp=0.6, de0=-1.0)
+        vals = stack.path_values()
+        self.assertTrue(np.allclose(vals[:, 1], 0.6))
+        self.assertTrue(np.allclose(vals[[0, 2, 3, 4, 5, 6], 2], -1.0))
+        self.assertTrue(np.allclose(vals[1, 2], -0.5))
+
+    def test_path_arrays_are_copies(self):
+        stack = self.FeffPathStack(self.paths, self.k)
+        stack.calc_chi()
+        p0, chi0 = self.paths[0].p.copy(), self.paths[0].chi.copy()
+        self.set_pars(de0=4.0, sig2=0.008)
+        stack.calc_chi()
+        self.assertFalse(np.allclose(self.paths[0].p, p0))
+        saved_p, saved_chi = self.paths[0].p, self.paths[0].chi
+        self.set_pars(de0=1.0, sig2=0.003)
+        stack.calc_chi()
+        self.assertTrue(np.allclose(self.paths[0].p, p0))
+        self.assertTrue(np.allclose(self.paths[0].chi, chi0))
+        # arrays from the previous call are unchanged
+        self.assertFalse(np.allclose(saved_p, p0))
+        self.assertFalse(np.allclose(saved_chi, chi0))
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestFeffPathStack,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+""" Larch Tests: cache of parsed larch code """
+import os
+import ast
+import time
+import shutil
+import unittest
+from tempfile import mkdtemp
+
+from larch.inputText import InputText
+from larch.parsecache import ParseCache
+
+CODE = """a = 1
+def f(x):
+    return x + a
+enddef
+show a
+"""
+
+class TestParseCache(unittest.TestCase):
+    '''test cache files of parsed larch files'''
+    def setUp(self):
+        self.tmpdir = mkdtemp(prefix='larch_parsecache')
+        self.cachedir = os.path.join(self.tmpdir, 'cache')
+        self.filename = os.path.join(self.tmpdir, 'code.lar')
+        self.commands = ['show']
+        self.write_file(CODE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_file(self, text, mtime=None):
+        with open(self.filename, 'w') as fh:
+            fh.write(text)
+        if mtime is not None:
+            os.utime(self.filename, (mtime, mtime))
+
+    def entries(self):
+        "lines queued by InputText for the file"
+        inp = InputText()
+        inp.valid_commands = self.commands
+        with open(self.filename, 'r') as fh:
+            inp.put(fh.read(), filename=self.filename, lineno=0)
+        return list(inp.deque)
+
+    def test_save_load(self):
+        cache = ParseCache(cachedir=self.cachedir)
+        entries = self.entries()
+        self.assertTrue(cache.save_file(self.filename, entries,
+                                        commands=self.commands))
+        self.assertTrue(os.path.exists(cache.cachefile(self.filename)))
+        cache = ParseCache(cachedir=self.cachedir)
+        self.assertEqual(cache.load_file(self.filename,
+                                         commands=self.commands), entries)
+        # the parsed statements are added to the memory cache
+        node = cache.get('show(a)', self.filename)
+        self.assertTrue(isinstance(node, ast.Module))
+        # different valid commands are queued differently
+        self.assertEqual(cache.load_file(self.filename, commands=['print']),
+                         None)
+
+    def test_file_changed(self):
+        mtime = time.time() - 100
+        self.write_file(CODE, mtime=mtime)
+        cache = ParseCache(cachedir=self.cachedir)
+        cache.save_file(self.filename, self.entries(),
+                        commands=self.commands)
+        self.assertTrue(cache.load_file(self.filename,
+                                        commands=self.commands) is not None)
+        # same text and size, new modification time
+        self.write_file(CODE, mtime=mtime + 10)
+        self.assertEqual(cache.load_file(self.filename,
+                                         commands=self.commands), None)
+        cache.save_file(self.filename, self.entries(),
+                        commands=self.commands)
+        self.assertTrue(cache.load_file(self.filename,
+                                        commands=self.commands) is not None)
+        # same modification time, new size
+        self.write_file(CODE + 'b = 2\n', mtime=mtime + 10)
+        self.assertEqual(cache.load_file(self.filename,
+                                         commands=self.commands), None)
+
+    def test_corrupt_cache_file(self):
+        cache = ParseCache(cachedir=self.cachedir)
+        entries = self.entries()
+        cache.save_file(self.filename, entries, commands=self.commands)
+        cfile = cache.cachefile(self.filename)
+        for garbage in (b'', b'not a pickle', b'\x80\x04\x95garbage'):
+            with open(cfile, 'wb') as fh:
+                fh.write(garbage)
+            self.assertEqual(cache.load_file(self.filename,
+                                             commands=self.commands), None)
+        # the cache file is replaced when saved again
+        self.assertTrue(cache.save_file(self.filename, entries,
+                                        commands=self.commands))
+        self.assertEqual(cache.load_file(self.filename,
+                                         commands=self.commands), entries)
+
+    def test_no_cachedir(self):
+        cache = ParseCache(cachedir=None)
+        self.assertFalse(cache.save_file(self.filename, self.entries(),
+                                         commands=self.commands))
+        self.assertEqual(cache.load_file(self.filename,
+                                         commands=self.commands), None)
+        self.assertFalse(os.path.exists(self.cachedir))
+        # parsed statements are still held in memory
+        self.assertTrue(cache.get('a = 1', self.filename) is not None)
+
+    def test_put_cache_commands(self):
+        # text is queued again when the valid commands change,
+        # even if their number does not
+        inp = InputText()
+        inp.valid_commands = ['show']
+        inp.put('show a')
+        self.assertEqual(inp.get()[0], 'show(a)')
+        inp.valid_commands = ['other']
+        inp.put('show a')
+        self.assertEqual(inp.get()[0], 'show a')
+        inp.valid_commands = ['show']
+        inp.put('show a')
+        self.assertEqual(inp.get()[0], 'show(a)')
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestParseCache,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
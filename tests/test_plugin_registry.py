@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+""" Larch Tests: plugin modules imported on first use from the manifest """
+import os
+import sys
+import json
+import unittest
+import shutil
+from tempfile import mkdtemp
+from six.moves import StringIO
+
+from larch import Interpreter, builtins, site_config
+from larch.pluginregistry import PluginRegistry, LazySymbol
+
+PLUGIN = '''
+import lazydep
+def lazy_scale(x, _larch=None):
+    return %s*x
+def registerLarchPlugin():
+    return ('_lazytest', {'lazy_scale': lazy_scale})
+'''
+
+class TestLazyPlugins(unittest.TestCase):
+    '''test lazy import of plugin modules'''
+    def setUp(self):
+        self.tmpdir = mkdtemp(prefix='larch_plugins')
+        self.plugindir = os.path.join(self.tmpdir, 'plugins')
+        self.depdir = os.path.join(self.tmpdir, 'deps')
+        os.mkdir(self.plugindir)
+        os.mkdir(self.depdir)
+        self.manifest = os.path.join(self.tmpdir, 'plugin_manifest.json')
+        self.modpath = os.path.join(self.plugindir, 'lazymod.py')
+        self.write_plugin(2)
+        with open(os.path.join(self.depdir, 'lazydep.py'), 'w') as fh:
+            fh.write('\n')
+        sys.path.insert(0, self.depdir)
+
+    def tearDown(self):
+        if self.depdir in sys.path:
+            sys.path.remove(self.depdir)
+        for name in ('lazymod', 'lazydep'):
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.tmpdir)
+
+    def write_plugin(self, scale):
+        with open(self.modpath, 'w') as fh:
+            fh.write(PLUGIN % scale)
+        sys.modules.pop('lazymod', None)
+
+    def interp(self, lazy=True):
+        "interpreter with the test plugin folder added"
+        interp = Interpreter(with_plugins=False)
+        interp.writer = StringIO()
+        interp.plugins = PluginRegistry(interp.symtable,
+                                        manifest=self.manifest)
+        interp.add_plugin(self.plugindir, lazy=lazy)
+        interp.plugins.save()
+        return interp
+
+    def mode(self, interp):
+        return interp.plugins.profile[self.modpath]['mode']
+
+    def test_default(self):
+        calls = []
+        def addplugin(plugin, lazy=False, **kws):
+            calls.append(lazy)
+        _addplugin = builtins._addplugin
+        builtins._addplugin = addplugin
+        try:
+            Interpreter()
+            self.assertTrue(len(calls) > 0)
+            self.assertFalse(any(calls))
+            # as with LARCHLAZYPLUGINS=1
+            site_config.lazy_plugins = True
+            calls[:] = []
+            Interpreter()
+            self.assertTrue(all(calls))
+        finally:
+            builtins._addplugin = _addplugin
+            site_config.lazy_plugins = False
+
+    def test_first_use(self):
+        interp = self.interp()
+        self.assertEqual(self.mode(interp), 'imported')
+        self.assertTrue(os.path.exists(self.manifest))
+        sys.modules.pop('lazymod', None)
+
+        interp = self.interp()
+        self.assertEqual(self.mode(interp), 'lazy')
+        self.assertTrue('lazymod' not in sys.modules)
+        group = interp.symtable.get_group('_lazytest')
+        self.assertTrue(isinstance(group.lazy_scale, LazySymbol))
+        self.assertEqual(interp.eval('lazy_scale(3)'), 6)
+        self.assertEqual(interp.error, [])
+        self.assertEqual(self.mode(interp), 'loaded')
+        self.assertTrue('lazymod' in sys.modules)
+        self.assertFalse(isinstance(group.lazy_scale, LazySymbol))
+        self.assertEqual(interp.eval('lazy_scale(4)'), 8)
+
+        # without lazy, plugins in the manifest are imported
+        sys.modules.pop('lazymod', None)
+        interp = self.interp(lazy=False)
+        self.assertEqual(self.mode(interp), 'imported')
+
+    def test_stale_manifest(self):
+        self.interp()
+        self.write_plugin(10)
+        interp = self.interp()
+        self.assertEqual(self.mode(interp), 'imported')
+        self.assertEqual(interp.eval('lazy_scale(3)'), 30)
+        # the changed module is now in the manifest
+        sys.modules.pop('lazymod', None)
+        interp = self.interp()
+        self.assertEqual(self.mode(interp), 'lazy')
+        self.assertEqual(interp.eval('lazy_scale(2)'), 20)
+
+    def test_failed_import(self):
+        self.interp()
+        # a required module is removed after the manifest is saved
+        sys.path.remove(self.depdir)
+        for name in ('lazymod', 'lazydep'):
+            sys.modules.pop(name, None)
+        interp = self.interp()
+        self.assertEqual(self.mode(interp), 'lazy')
+        interp.eval('x = lazy_scale(3)')
+        self.assertTrue(len(interp.error) > 0)
+        exc, msg = interp.error[0].get_error()
+        self.assertEqual(exc, 'ImportError')
+        self.assertTrue(self.modpath in msg)
+        self.assertTrue('lazydep' in msg)
+        self.assertEqual(self.mode(interp), 'failed')
+        # the module is no longer in the manifest, so it is imported,
+        # and the error reported, at the next startup
+        with open(self.manifest, 'r') as fh:
+            self.assertFalse(self.modpath in json.load(fh)['modules'])
+        interp = self.interp()
+        self.assertFalse(self.modpath in interp.plugins.lazy_plugins)
+        self.assertTrue('lazymod' in interp.writer.getvalue())
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestLazyPlugins,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+""" Larch Tests: sigma2 models for Feff paths """
+import unittest
+import importlib
+import numpy as np
+
+from utils import TestCase
+
+# values from the earlier implementation, which looped over atom pairs
+DEBINT = [((0.0, 1.0), 2.055009268204874),
+          ((1.5, 0.5), 3.554446840314158),
+          ((4.0, 2.0), 0.44932729679360167),
+          ((10.0, 3.0), 0.11407045041380326),
+          ((25.0, 0.1), 1.2251594719191)]
+
+CORRELDEBYE = [('feff0001.dat', 10, 300, 0.003317811336314255),
+               ('feff0001.dat', 300, 250, 0.014107062599115715),
+               ('feff0003.dat', 10, 300, 0.003732537753353537),
+               ('feff0003.dat', 300, 250, 0.015870445424005182),
+               ('feff_feo04.dat', 10, 300, 0.006645839834625826),
+               ('feff_feo04.dat', 300, 250, 0.02991537148277785),
+               ('Feff_Cu/feff0013.dat', 10, 300, 0.0036389910723488485),
+               ('Feff_Cu/feff0013.dat', 300, 250, 0.018276355246698597)]
+
+class TestSigma2Models(TestCase):
+    '''test correlated Debye model and the sigma2_debye() cache'''
+    def setUp(self):
+        TestCase.setUp(self)
+        self.sigma2 = importlib.import_module('larch_plugins.xafs.sigma2_models')
+        self.feffdat = importlib.import_module('larch_plugins.xafs.feffdat')
+
+    def feffpath(self, fname):
+        return self.feffdat.feffpath('../examples/feffit/%s' % fname,
+                                     _larch=self.session._larch)
+
+    def test_debint(self):
+        for (rx, tx), expected in DEBINT:
+            self.assertTrue(np.allclose(self.sigma2.debint(rx, tx), expected,
+                                        rtol=1.e-13, atol=0))
+        # arrays give the same values as each value in turn
+        rx = np.array([[rx for (rx, tx), val in DEBINT]]*2)
+        out = self.sigma2.debint(rx, 2.0)
+        self.assertEqual(out.shape, rx.shape)
+        for val, rxval in zip(out[1], rx[1]):
+            self.assertEqual(val, self.sigma2.debint(rxval, 2.0))
+
+    def test_correldebye(self):
+        for fname, t, theta, expected in CORRELDEBYE:
+            fdat = self.feffpath(fname)._feffdat
+            atwt, x, y, z = zip(*[(am, x, y, z) for sym, iz, ipot, am, x, y, z
+                                  in fdat.geom])
+            sig2 = self.sigma2.sigma2_correldebye_py(len(x), t, theta,
+                                                     fdat.rnorman, x, y, z,
+                                                     atwt)
+            self.assertTrue(np.allclose(sig2, expected, rtol=1.e-13, atol=0))
+
+    def test_debye_cache(self):
+        sigma2 = self.sigma2
+        calls = []
+        def correldebye(*args):
+            calls.append(args[1:3])
+            return sigma2.sigma2_correldebye_py(*args)
+        _correldebye, _cache = sigma2.sigma2_correldebye, sigma2._sigma2_cache
+        sigma2.sigma2_correldebye = correldebye
+        sigma2._sigma2_cache = sigma2.LRUCache(maxsize=3)
+        try:
+            path1 = self.feffpath('feff0001.dat')
+            path2 = self.feffpath('feff0001.dat')
+            path3 = self.feffpath('feff0003.dat')
+            _larch = self.session._larch
+            val = sigma2.sigma2_debye(10, 300, path=path1, _larch=_larch)
+            self.assertTrue(np.allclose(val, CORRELDEBYE[0][3]))
+            # the same geometry, t, and theta are not calculated again
+            self.assertEqual(sigma2.sigma2_debye(10, 300, path=path2,
+                                                 _larch=_larch), val)
+            self.assertEqual(len(calls), 1)
+            sigma2.sigma2_debye(300, 250, path=path1, _larch=_larch)
+            sigma2.sigma2_debye(10, 300, path=path3, _larch=_larch)
+            self.assertEqual(len(calls), 3)
+            # least recently used values are dropped when full
+            sigma2.sigma2_debye(10, 300, path=path1, _larch=_larch)
+            sigma2.sigma2_debye(300, 250, path=path3, _larch=_larch)
+            self.assertEqual(len(calls), 4)
+            self.assertEqual(len(sigma2._sigma2_cache), 3)
+            sigma2.sigma2_debye(10, 300, path=path1, _larch=_larch)
+            self.assertEqual(len(calls), 4)
+            sigma2.sigma2_debye(300, 250, path=path1, _larch=_larch)
+            self.assertEqual(len(calls), 5)
+        finally:
+            sigma2.sigma2_correldebye = _correldebye
+            sigma2._sigma2_cache = _cache
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestSigma2Models,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+""" Larch Tests: symbol lookups through the search path """
+import unittest
+
+from utils import TestCase
+
+class TestSymbolLookup(TestCase):
+    '''test that indexed symbol lookups follow changes to groups'''
+    def setUp(self):
+        TestCase.setUp(self)
+        self.trytext("""
+g1 = group()
+g2 = group(val=2, other=20)
+pars = param_group()
+_sys.searchGroups = ['pars', 'g1', 'g2'] + _sys.searchGroups
+""")
+        self.NoExceptionRaised()
+
+    def lookup(self, name):
+        return self.symtable.get_symbol(name)
+
+    def test_set_earlier_group(self):
+        self.assertEqual(self.lookup('val'), 2)
+        self.trytext('g1.val = 1')
+        self.assertEqual(self.lookup('val'), 1)
+        self.symtable.set_symbol('g1.other', 10)
+        self.assertEqual(self.lookup('other'), 10)
+        self.trytext('total = val + other')
+        self.isValue('total', 11)
+
+    def test_delete(self):
+        self.trytext('g1.val = 1')
+        self.assertEqual(self.lookup('val'), 1)
+        self.trytext('del g1.val')
+        self.NoExceptionRaised()
+        self.assertEqual(self.lookup('val'), 2)
+        self.trytext('del g2.val')
+        self.assertRaises(NameError, self.lookup, 'val')
+        self.assertFalse(self.symtable.has_symbol('val'))
+
+    def test_parameter_group(self):
+        self.assertEqual(self.lookup('val'), 2)
+        self.trytext("pars.val = param(5, vary=True)")
+        self.NoExceptionRaised()
+        self.assertEqual(self.lookup('val').value, 5)
+        self.trytext("pars.other = 7")
+        self.assertEqual(self.lookup('other'), 7)
+        # parameters added with the group
+        self.trytext("""
+pars2 = param_group(amp=param(3, vary=True))
+_sys.searchGroups = ['pars2'] + _sys.searchGroups
+""")
+        self.NoExceptionRaised()
+        self.assertEqual(self.lookup('amp').value, 3)
+        self.trytext("g1.amp = 0\npars2.amp = param(4)")
+        self.assertEqual(self.lookup('amp').value, 4)
+
+    def test_search_path_change(self):
+        self.assertEqual(self.lookup('val'), 2)
+        self.trytext("""
+g3 = group(val=3)
+_sys.searchGroups = ['g3'] + _sys.searchGroups
+""")
+        self.assertEqual(self.lookup('val'), 3)
+        self.trytext("_sys.searchGroups = [n for n in _sys.searchGroups if n != 'g3']")
+        self.assertEqual(self.lookup('val'), 2)
+
+    def test_procedure_frames(self):
+        self.trytext("""
+def shadow(x):
+    val = x
+    return val + other
+enddef
+def change(v):
+    g1.val = v
+    return val
+enddef
+def recurse(n):
+    if n <= 0:
+        return val
+    endif
+    val = n
+    return val + recurse(n-1)
+enddef
+r1 = shadow(100)
+r2 = val
+r3 = change(-1)
+r4 = val
+r5 = recurse(3)
+""")
+        self.NoExceptionRaised()
+        # local names hide global names only inside the procedure
+        self.isValue('r1', 120)
+        self.isValue('r2', 2)
+        # a group changed inside a procedure is seen inside and after it
+        self.isValue('r3', -1)
+        self.isValue('r4', -1)
+        self.isValue('r5', 5)
+
+    def test_procedure_sees_changes(self):
+        self.trytext("""
+def getval():
+    return val
+enddef
+r1 = getval()
+g1.val = 1
+r2 = getval()
+del g1.val
+r3 = getval()
+""")
+        self.NoExceptionRaised()
+        self.isValue('r1', 2)
+        self.isValue('r2', 1)
+        self.isValue('r3', 2)
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestSymbolLookup,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+""" Larch Tests: XAFS Fourier transforms """
+import unittest
+import importlib
+import threading
+import numpy as np
+
+from utils import TestCase
+
+class TestBatchFT(TestCase):
+    '''test xftf_batch() and xftr_batch() against xftf() and xftr()'''
+    def setUp(self):
+        TestCase.setUp(self)
+        self.xafsft = importlib.import_module('larch_plugins.xafs.xafsft')
+        self._larch = self.session._larch
+        rng = np.random.RandomState(5)
+        # a non-uniform k grid, as from data
+        self.k = np.sort(np.concatenate(([0], rng.uniform(0, 16, 300))))
+        k = self.k
+        self.chis = np.array([(1+0.1*i)*np.sin(2*(2.2+0.05*i)*k)*np.exp(-0.01*k*k)
+                              + 0.02*rng.normal(size=len(k)) for i in range(7)])
+
+    def group(self):
+        return self._larch.symtable.create_group()
+
+    def check_xftf(self, axis):
+        kws = dict(kmin=2, kmax=14, dk=2, kweight=2, window='hanning',
+                   with_phase=True)
+        chis = self.chis if axis == -1 else self.chis.T
+        batch = self.group()
+        self.xafsft.xftf_batch(self.k, chis, group=batch, axis=axis,
+                               chunksize=3, _larch=self._larch, **kws)
+        self.assertEqual(batch.chir.shape, (len(self.chis), len(batch.r)))
+        for i, chi in enumerate(self.chis):
+            one = self.group()
+            self.xafsft.xftf(self.k, chi, group=one, _larch=self._larch, **kws)
+            self.assertTrue(np.allclose(batch.r, one.r))
+            self.assertTrue(np.allclose(batch.kwin, one.kwin))
+            for attr in ('chir', 'chir_mag', 'chir_re', 'chir_im', 'chir_pha'):
+                self.assertTrue(np.allclose(getattr(batch, attr)[i],
+                                            getattr(one, attr),
+                                            rtol=1.e-12, atol=1.e-14))
+        return batch
+
+    def check_xftr(self, axis):
+        ft = self.group()
+        self.xafsft.xftf_batch(self.k, self.chis, group=ft, kmin=2, kmax=14,
+                               dk=2, kweight=2, _larch=self._larch)
+        kws = dict(rmin=1, rmax=3, dr=0.2, window='hanning', with_phase=True)
+        chirs = ft.chir if axis == -1 else ft.chir.T
+        batch = self.group()
+        self.xafsft.xftr_batch(ft.r, chirs, group=batch, axis=axis,
+                               chunksize=3, _larch=self._larch, **kws)
+        self.assertEqual(batch.chiq.shape, (len(self.chis), len(batch.q)))
+        for i, chir in enumerate(ft.chir):
+            one = self.group()
+            self.xafsft.xftr(ft.r, chir, group=one, _larch=self._larch, **kws)
+            self.assertTrue(np.allclose(batch.q, one.q))
+            self.assertTrue(np.allclose(batch.rwin, one.rwin))
+            for attr in ('chiq', 'chiq_mag', 'chiq_re', 'chiq_im', 'chiq_pha'):
+                self.assertTrue(np.allclose(getattr(batch, attr)[i],
+                                            getattr(one, attr),
+                                            rtol=1.e-12, atol=1.e-14))
+
+    def test_xftf_rows(self):
+        self.check_xftf(-1)
+
+    def test_xftf_columns(self):
+        self.check_xftf(0)
+
+    def test_xftr_rows(self):
+        self.check_xftr(-1)
+
+    def test_xftr_columns(self):
+        self.check_xftr(0)
+
+    def test_1d_input(self):
+        grp = self.group()
+        self.assertRaises(ValueError, self.xafsft.xftf_batch, self.k,
+                          self.chis[0], group=grp, _larch=self._larch)
+        self.assertRaises(ValueError, self.xafsft.xftr_batch,
+                          0.03*np.arange(100), np.ones(100), group=grp,
+                          _larch=self._larch)
+
+class TestFTContext(TestCase):
+    '''test FTContext against xftf_fast() and xftr_fast()'''
+    def setUp(self):
+        TestCase.setUp(self)
+        self.xafsft = importlib.import_module('larch_plugins.xafs.xafsft')
+        self.rng = np.random.RandomState(9)
+
+    def check(self, ctx, chi):
+        xafsft = self.xafsft
+        fast = xafsft.xftf_fast(chi, nfft=ctx.nfft, kstep=ctx.kstep)
+        self.assertTrue(np.allclose(ctx.xftf(chi), fast,
+                                    rtol=1.e-12, atol=1.e-14))
+        fast = xafsft.xftr_fast(chi, nfft=ctx.nfft, kstep=ctx.kstep)
+        self.assertTrue(np.allclose(ctx.xftr(chi), fast,
+                                    rtol=1.e-12, atol=1.e-14))
+
+    def test_matches_fast(self):
+        ctx = self.xafsft.FTContext(nfft=1024, kstep=0.04)
+        # real input uses the real-input FFT, and complex input the
+        # full FFT; shorter input after longer input must not see the
+        # values left in the work buffers
+        for npts in (400, 250, 251, 600, 1):
+            chi = self.rng.normal(size=npts)
+            self.check(ctx, chi)
+            self.check(ctx, chi + 1j*self.rng.normal(size=npts))
+        # 2-d input, and real input longer than nfft
+        self.check(ctx, self.rng.normal(size=(3, 200)))
+        chi = self.rng.normal(size=1500)
+        self.assertTrue(np.allclose(ctx.xftf(chi),
+                                    self.xafsft.xftf_fast(chi, nfft=1024,
+                                                          kstep=0.04)))
+
+    def test_threads(self):
+        ctx = self.xafsft.FTContext()
+        chis = [self.rng.normal(size=300+50*i) for i in range(4)]
+        expected = [self.xafsft.xftf_fast(chi) for chi in chis]
+        buffers, errors = [], []
+        def work(i):
+            try:
+                for j in range(50):
+                    out = ctx.xftf(chis[i])
+                    if not np.allclose(out, expected[i], rtol=1.e-12,
+                                       atol=1.e-14):
+                        errors.append((i, j))
+                buffers.append(ctx._local.__dict__['float64'][0])
+            except Exception as exc:
+                errors.append(exc)
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        # each thread has its own work buffer
+        self.assertEqual(len(set(id(b) for b in buffers)), 4)
+
+class TestFTWindow(TestCase):
+    '''test the cache of ftwindow()'''
+    def setUp(self):
+        TestCase.setUp(self)
+        self.xafsft = importlib.import_module('larch_plugins.xafs.xafsft')
+        self.xafsft.ftwindow_cache_clear()
+        self.k = 0.05*np.arange(401)
+
+    def tearDown(self):
+        self.xafsft.ftwindow_cache_clear()
+
+    def test_cached_matches_uncached(self):
+        ftwindow = self.xafsft.ftwindow
+        for window in ('hanning', 'fhanning', 'gaussian', 'kaiser',
+                       'parzen', 'welch', 'sine', 'bessel'):
+            for xmin, xmax, dx, dx2 in ((2, 14, 1, None), (3, 12.5, 2, 0.5)):
+                uncached = self.xafsft._ftwindow(self.k, xmin, xmax, dx,
+                                                 dx2, window[:3])
+                for i in range(2):
+                    win = ftwindow(self.k, xmin=xmin, xmax=xmax, dx=dx,
+                                   dx2=dx2, window=window)
+                    self.assertTrue(np.array_equal(win, uncached))
+        self.assertEqual(len(self.xafsft._ftwindow_cache), 16)
+
+    def test_returns_copy(self):
+        ftwindow = self.xafsft.ftwindow
+        win1 = ftwindow(self.k, xmin=2, xmax=14, dx=1)
+        expected = win1.copy()
+        win1[:] = -1.0
+        win1 *= 3
+        win2 = ftwindow(self.k, xmin=2, xmax=14, dx=1)
+        self.assertTrue(np.array_equal(win2, expected))
+        self.assertFalse(win2 is win1)
+        win2[10:20] = 7.0
+        self.assertTrue(np.array_equal(ftwindow(self.k, xmin=2, xmax=14,
+                                                dx=1), expected))
+
+    def test_keys(self):
+        xafsft = self.xafsft
+        # non-uniform grids are not cached
+        kvals = np.sort(np.random.RandomState(2).uniform(0, 20, 300))
+        win = xafsft.ftwindow(kvals, xmin=2, xmax=14, dx=1)
+        self.assertTrue(np.array_equal(win, xafsft._ftwindow(kvals, 2, 14, 1,
+                                                             None, 'han')))
+        self.assertEqual(len(xafsft._ftwindow_cache), 0)
+        # a different grid gives a different window
+        win1 = xafsft.ftwindow(self.k, xmin=2, xmax=14, dx=1)
+        win2 = xafsft.ftwindow(self.k[:300], xmin=2, xmax=14, dx=1)
+        win3 = xafsft.ftwindow(0.04*np.arange(401), xmin=2, xmax=14, dx=1)
+        self.assertEqual(len(win2), 300)
+        self.assertFalse(np.array_equal(win1, win3))
+        self.assertEqual(len(xafsft._ftwindow_cache), 3)
+
+    def test_lru(self):
+        xafsft = self.xafsft
+        size = xafsft.FTWINDOW_CACHE_SIZE
+        for i in range(size):
+            xafsft.ftwindow(self.k, xmin=1+0.01*i, xmax=14)
+        # use the first window again, so that the second is dropped
+        xafsft.ftwindow(self.k, xmin=1, xmax=14)
+        xafsft.ftwindow(self.k, xmin=0.5, xmax=14)
+        xmins = [key[1] for key in xafsft._ftwindow_cache.keys()]
+        self.assertEqual(len(xmins), size)
+        self.assertTrue(1 in xmins and 0.5 in xmins)
+        self.assertFalse(1.01 in xmins)
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestBatchFT, TestFTContext, TestFTWindow):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
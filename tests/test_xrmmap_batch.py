@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+""" Larch Tests: batch conversion of raw map folders """
+import os
+import unittest
+import shutil
+from tempfile import mkdtemp
+
+from utils import TestCase
+
+SCANFILE = """[scan]
+filename = %s
+dimension = 2
+"""
+
+class TestBatchConversion(TestCase):
+    '''test find_mapfolders() and convert_mapfolders() with a stub converter'''
+    def setUp(self):
+        TestCase.setUp(self)
+        from larch_plugins.xrmmap import xrm_batch
+        self.xrm_batch = xrm_batch
+        self.convert_mapfolder = xrm_batch.convert_mapfolder
+        xrm_batch.convert_mapfolder = self.convert
+        self.converted = []
+        self.tmpdir = mkdtemp(prefix='larch_batch')
+        self.outdir = os.path.join(self.tmpdir, 'out')
+
+    def tearDown(self):
+        self.xrm_batch.convert_mapfolder = self.convert_mapfolder
+        shutil.rmtree(self.tmpdir)
+
+    def convert(self, folder, filename=None, **kws):
+        "stand-in for convert_mapfolder(), recording the map file"
+        self.converted.append((folder, filename))
+        result = self.xrm_batch._new_result(folder, filename=filename)
+        result['status'] = 'converted'
+        return result
+
+    def make_folder(self, name, scanname, xrf=True):
+        folder = os.path.join(self.tmpdir, name)
+        os.mkdir(folder)
+        files = ['Master.dat', 'Environ.dat']
+        if xrf:
+            files.append('xsp3.0001')
+        for fname in files:
+            with open(os.path.join(folder, fname), 'w') as fh:
+                fh.write('\n')
+        with open(os.path.join(folder, 'Scan.ini'), 'w') as fh:
+            fh.write(SCANFILE % scanname)
+        return folder
+
+    def test_find_folders(self):
+        f1 = self.make_folder('map1', 'a')
+        f2 = self.make_folder('map2', 'b')
+        self.make_folder('other', 'c', xrf=False)
+        pattern = os.path.join(self.tmpdir, '*')
+        self.assertEqual(self.xrm_batch.find_mapfolders([pattern, f1]),
+                         [f1, f2])
+
+    def test_filename(self):
+        folder = self.make_folder('map1', 'sample_001')
+        fname = self.xrm_batch.mapfolder_filename(folder, outdir=self.outdir)
+        self.assertEqual(fname, os.path.join(self.outdir, 'sample_001.h5'))
+        folder = self.make_folder('map2', 'sample_002.h5')
+        fname = self.xrm_batch.mapfolder_filename(folder, outdir=self.outdir)
+        self.assertEqual(fname, os.path.join(self.outdir, 'sample_002.h5'))
+
+    def test_duplicate_filenames(self):
+        f1 = self.make_folder('map1', 'sample')
+        f2 = self.make_folder('map2', 'sample.h5')
+        f3 = self.make_folder('map3', 'other')
+        results = self.xrm_batch.convert_mapfolders([f1, f2, f3], nproc=1,
+                                                    outdir=self.outdir,
+                                                    verbose=False)
+        # the second folder for sample.h5 is not converted
+        fname = os.path.join(self.outdir, 'sample.h5')
+        self.assertEqual(self.converted,
+                         [(f1, fname), (f3, os.path.join(self.outdir,
+                                                         'other.h5'))])
+        self.assertEqual([r['folder'] for r in results], [f1, f2, f3])
+        self.assertEqual([r['status'] for r in results],
+                         ['converted', 'failed', 'converted'])
+        self.assertEqual(results[1]['filename'], fname)
+        self.assertTrue(f1 in results[1]['error'])
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestBatchConversion,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+""" Larch Tests: decoding of xMAP mapping mode netCDF buffers """
+import os
+import unittest
+import numpy as np
+from tempfile import mkdtemp
+import shutil
+
+from utils import TestCase
+
+NMODULES = 2
+NCHANS = 12
+NROIS = 3
+
+def make_buffers(npix_arrays, mapmode=1, first_pixel=70000):
+    """synthetic xMAP buffers, as (narrays, nmodules, buffersize) words,
+    with the expected counts and times for each (pixel, detector)"""
+    modpixs = max(124, max(npix_arrays))
+    if mapmode == 1:
+        blocksize = 256 + 4*NCHANS
+        nchans = NCHANS
+    else:
+        blocksize = 64 + 8*NROIS
+        nchans = NROIS
+    narrays = len(npix_arrays)
+    data = np.zeros((narrays, NMODULES, 256 + modpixs*blocksize), dtype='i2')
+    counts, times = [], []
+    pix0 = first_pixel
+    for iarr, npix in enumerate(npix_arrays):
+        for ipix in range(npix):
+            pixcounts, pixtimes = [], []
+            for imod in range(NMODULES):
+                buff = data[iarr, imod]
+                buff[8] = npix
+                buff[9:11] = np.array([pix0], dtype='i4').view('i2')
+                buff[20:24] = NCHANS
+                block = buff[256+ipix*blocksize:256+(ipix+1)*blocksize]
+                block[3] = mapmode
+                block[8:12] = NROIS
+                for ichan in range(4):
+                    det = 4*imod + ichan
+                    tvals = (1000*(iarr+1) + 10*ipix + det) * np.array([3, 2, 5, 4])
+                    i0 = 32 + 8*ichan
+                    block[i0:i0+8] = tvals.astype('i4').view('i2')
+                    pixtimes.append(tvals)
+                    spec = (np.arange(nchans) + 7*ipix + 3*det + 50*iarr) % 1000
+                    if mapmode == 1:
+                        i0 = 256 + ichan*NCHANS
+                        block[i0:i0+NCHANS] = spec
+                    else:
+                        i0 = 64 + 2*ichan*NROIS
+                        block[i0:i0+2*NROIS] = spec.astype('i4').view('i2')
+                    pixcounts.append(spec)
+            counts.append(pixcounts)
+            times.append(pixtimes)
+    return data, np.array(counts), np.array(times)
+
+class TestXMAPDecoder(TestCase):
+    '''test decode_xmap_buffers() and read_xrf_netcdf()'''
+    def setUp(self):
+        TestCase.setUp(self)
+        from larch_plugins.xrmmap import xrf_netcdf
+        self.xrf_netcdf = xrf_netcdf
+
+    def check(self, xmapdat, counts, times):
+        ctick = self.xrf_netcdf.CLOCKTICK
+        self.assertEqual(xmapdat.numPixels, len(counts))
+        self.assertEqual(xmapdat.counts.shape, counts.shape)
+        self.assertTrue((xmapdat.counts == counts).all())
+        self.assertTrue(np.allclose(xmapdat.realTime, ctick*times[:, :, 0]))
+        self.assertTrue(np.allclose(xmapdat.liveTime, ctick*times[:, :, 1]))
+        self.assertTrue((xmapdat.inputCounts == times[:, :, 2]).all())
+        self.assertTrue((xmapdat.outputCounts == times[:, :, 3]).all())
+
+    def test_full_spectra(self):
+        data, counts, times = make_buffers([124, 40], mapmode=1)
+        xmapdat = self.xrf_netcdf.decode_xmap_buffers(data)
+        self.assertEqual(xmapdat.firstPixel, 70000)
+        self.check(xmapdat, counts, times)
+
+    def test_roi_mode(self):
+        data, counts, times = make_buffers([124, 124, 9], mapmode=2)
+        xmapdat = self.xrf_netcdf.decode_xmap_buffers(data)
+        self.check(xmapdat, counts, times)
+
+    def test_single_buffer(self):
+        data, counts, times = make_buffers([31], mapmode=1)
+        # one array and one module are allowed as 1d array_data
+        xmapdat = self.xrf_netcdf.decode_xmap_buffers(data[0, 0])
+        self.assertEqual(xmapdat.counts.shape, (31, 4, NCHANS))
+        self.check(xmapdat, counts[:, :4], times[:, :4])
+
+    def test_read_netcdf(self):
+        data, counts, times = make_buffers([124, 60], mapmode=1)
+        tmpdir = mkdtemp(prefix='larch_xmap')
+        fname = os.path.join(tmpdir, 'xmap_001.nc')
+        try:
+            fh = self.xrf_netcdf.netcdf_open(fname, 'w')
+            for i, dim in enumerate(data.shape):
+                fh.createDimension('dim%i' % i, dim)
+            var = fh.createVariable('array_data', 'i2', ('dim0', 'dim1', 'dim2'))
+            var[:] = data
+            fh.close()
+            xmapdat = self.xrf_netcdf.read_xrf_netcdf(fname)
+        finally:
+            shutil.rmtree(tmpdir)
+        self.check(xmapdat, counts, times)
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestXMAPDecoder,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
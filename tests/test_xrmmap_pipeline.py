@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+""" Larch Tests: pipelined reading of map rows in GSEXRM_MapFile """
+import unittest
+import time
+import threading
+
+from utils import TestCase
+
+class StubRow(object):
+    """row 'read' by a worker: rows finish out of order, row fail_row
+    fails to read, and row error_row raises an exception"""
+    def __init__(self, irow, fail_row=None, error_row=None):
+        time.sleep(0.002*((7*irow) % 5))
+        if irow == error_row:
+            raise ValueError('cannot decode row %i' % irow)
+        self.irow = irow
+        self.read_ok = (irow != fail_row)
+
+class TestPipelinedRows(TestCase):
+    '''test GSEXRM_MapFile.process_rows_pipelined() with a stub row reader'''
+    def setUp(self):
+        TestCase.setUp(self)
+        from larch_plugins.xrmmap import xrm_mapfile
+        self.xrm_mapfile = xrm_mapfile
+        self.maprow = xrm_mapfile.GSEXRM_MapRow
+        xrm_mapfile.GSEXRM_MapRow = StubRow
+
+        self.written = []
+        self.requested = []
+        self.threads = set()
+        self.mapfile = xrm_mapfile.GSEXRM_MapFile.__new__(xrm_mapfile.GSEXRM_MapFile)
+        self.mapfile.filename = 'stub.h5'
+        self.mapfile.add_rowdata = self.add_rowdata
+        self.set_rows()
+
+    def tearDown(self):
+        self.xrm_mapfile.GSEXRM_MapRow = self.maprow
+
+    def set_rows(self, **kws):
+        def rowdata_args(irow):
+            self.requested.append(irow)
+            return (irow, ), kws
+        self.mapfile.rowdata_args = rowdata_args
+
+    def add_rowdata(self, row, verbose=False):
+        self.threads.add(threading.current_thread().name)
+        self.written.append(row.irow)
+
+    def test_rows_written_in_order(self):
+        self.mapfile.process_rows_pipelined(0, 40, nworkers=4, verbose=False)
+        self.assertEqual(self.written, list(range(40)))
+        self.assertEqual(self.threads, set(['xrmmap_writer']))
+
+    def test_start_row(self):
+        self.mapfile.process_rows_pipelined(5, 12, nworkers=3, verbose=False)
+        self.assertEqual(self.written, list(range(5, 12)))
+
+    def test_stop_at_failed_row(self):
+        self.set_rows(fail_row=9)
+        self.mapfile.process_rows_pipelined(0, 40, nworkers=4, verbose=False)
+        self.assertEqual(self.written, list(range(9)))
+        # reading stops within the read-ahead of the failed row
+        self.assertTrue(max(self.requested) <= 9 + 2*4 + 1)
+
+    def test_worker_exception_raised(self):
+        self.set_rows(error_row=6)
+        with self.assertRaises(ValueError):
+            self.mapfile.process_rows_pipelined(0, 40, nworkers=4,
+                                                verbose=False)
+        self.assertEqual(self.written, list(range(6)))
+
+    def test_callback(self):
+        calls = []
+        def callback(row=None, maxrow=None, filename=None, status=None):
+            calls.append((row, status))
+        self.mapfile.process_rows_pipelined(0, 6, nworkers=2, verbose=False,
+                                            callback=callback)
+        complete = [row for row, status in calls if status == 'complete']
+        reading = [row for row, status in calls if status == 'reading']
+        self.assertEqual(complete, list(range(6)))
+        self.assertEqual(reading, list(range(6)))
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestPipelinedRows,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+""" Larch Tests: ROI sums and ROI map blocks for XRF maps """
+import os
+import unittest
+import shutil
+import numpy as np
+from tempfile import mkdtemp
+
+from utils import TestCase
+from xrmmap_utils import make_mapfile, add_roimaps
+
+ROIS = ['Fe Ka', 'Cu Ka', 'Zn Ka']
+
+class TestROIIndex(TestCase):
+    '''test make_roi_index() and roi_sums() against slice sums'''
+    def setUp(self):
+        TestCase.setUp(self)
+        from larch_plugins.xrmmap import xrm_mapfile
+        self.xrm_mapfile = xrm_mapfile
+        rng = np.random.RandomState(17)
+        self.nmca, self.npts, self.nchan = 4, 25, 256
+        self.counts = rng.randint(0, 3000, size=(self.nmca, self.npts,
+                                                 self.nchan)).astype('i2')
+
+    def slice_sums(self, roi_slices):
+        out = np.zeros((self.nmca, self.npts, len(roi_slices)), dtype=np.int64)
+        for iroi, slices in enumerate(roi_slices):
+            for imca in range(self.nmca):
+                out[imca, :, iroi] = self.counts[imca, :, slices[imca]].sum(axis=1)
+        return out
+
+    def check(self, limits):
+        roi_slices = [[slice(lo+imca, hi+imca) for imca in range(self.nmca)]
+                      for lo, hi in limits]
+        index = self.xrm_mapfile.make_roi_index(roi_slices, self.nmca,
+                                                self.nchan)
+        sums = self.xrm_mapfile.roi_sums(self.counts, index)
+        self.assertEqual(sums.shape, (self.nmca, self.npts, len(limits)))
+        self.assertTrue((sums == self.slice_sums(roi_slices)).all())
+
+    def test_sorted(self):
+        self.check([(10, 20), (30, 45), (100, 160)])
+
+    def test_unsorted_overlapping(self):
+        self.check([(100, 160), (10, 40), (30, 45), (35, 36), (0, 250)])
+
+    def test_edges(self):
+        # ROIs ending at or beyond the last channel, empty ROIs,
+        # and ROIs starting beyond the last channel
+        self.check([(240, 252), (250, 300), (0, 252), (50, 50),
+                    (80, 70), (260, 270), (252, 253)])
+
+    def test_single_roi(self):
+        self.check([(0, 1)])
+
+    def test_no_pixels(self):
+        roi_slices = [[slice(1, 5)]*self.nmca]
+        index = self.xrm_mapfile.make_roi_index(roi_slices, self.nmca,
+                                                self.nchan)
+        sums = self.xrm_mapfile.roi_sums(self.counts[:, :0], index)
+        self.assertEqual(sums.shape, (self.nmca, 0, 1))
+
+    def test_index_cached(self):
+        mapfile = self.xrm_mapfile.GSEXRM_MapFile.__new__(
+            self.xrm_mapfile.GSEXRM_MapFile)
+        mapfile.roi_slices = [[slice(3, 9)]*self.nmca, [slice(1, 5)]*self.nmca]
+        mapfile.roi_index = None
+        index = mapfile.get_roi_index(self.nmca, self.nchan)
+        self.assertTrue(mapfile.get_roi_index(self.nmca, self.nchan) is index)
+        other = mapfile.get_roi_index(self.nmca, 128)
+        self.assertFalse(other is index)
+        sums = self.xrm_mapfile.roi_sums(self.counts[:, :, :128], other)
+        self.assertTrue((sums[:, :, 0] ==
+                         self.counts[:, :, 3:9].sum(axis=2)).all())
+
+class TestROIBlocks(TestCase):
+    '''test ROI map blocks, area statistics and correlations'''
+    def setUp(self):
+        TestCase.setUp(self)
+        self.tmpdir = mkdtemp(prefix='larch_xrmmap')
+        fname = os.path.join(self.tmpdir, 'map.h5')
+        self.mapfile, data = make_mapfile(fname, nchan=16, chunks=None)
+        self.maps = add_roimaps(self.mapfile, rois=ROIS)
+        self.ny, self.nx = 40, 52
+        amask = np.zeros((self.ny, self.nx), dtype=bool)
+        amask[5:20, 10:40] = True
+        self.amask = amask
+        self.mapfile.xrmmap['areas'].create_dataset('area_001', data=amask)
+
+    def tearDown(self):
+        self.mapfile.h5root.close()
+        shutil.rmtree(self.tmpdir)
+
+    def det_maps(self, det, kind='cor'):
+        dat = self.maps['det_%s' % kind]
+        return np.array([dat[:, :, 2+(det-1)*len(ROIS)+i]
+                         for i in range(len(ROIS))])
+
+    def test_block(self):
+        names, block = self.mapfile.get_roimap_block(det=None)
+        self.assertEqual(names, ['TSCALER', 'I0'] + ROIS)
+        self.assertTrue(np.allclose(block,
+                                    self.maps['sum_cor'].transpose(2, 0, 1)))
+        names, block = self.mapfile.get_roimap_block(det=2, dtcorrect=False)
+        self.assertEqual(names, ROIS)
+        self.assertTrue(np.allclose(block, self.det_maps(2, 'raw')))
+        names, block = self.mapfile.get_roimap_block(det='all')
+        self.assertEqual(len(names), 2+2*len(ROIS))
+        self.assertRaises(Exception, self.mapfile.get_roimap_block, det=5)
+
+    def test_roimap(self):
+        # get_roimap() gives the same map before and after loading blocks
+        before = self.mapfile.get_roimap('Cu Ka', det=1, no_hotcols=False)
+        self.mapfile.get_roimap_block(det=1)
+        after = self.mapfile.get_roimap('Cu Ka', det=1, no_hotcols=False)
+        self.assertTrue(np.allclose(before, self.det_maps(1)[1]))
+        self.assertTrue(np.allclose(after, before))
+
+    def test_block_cache(self):
+        names, block1 = self.mapfile.get_roimap_block(det=None)
+        names, block2 = self.mapfile.get_roimap_block(det=None)
+        self.assertTrue(block1 is block2)
+        # a new row invalidates the cached block
+        roimap = self.mapfile.xrmmap['roimap']
+        roimap['sum_cor'].resize((self.ny+1, self.nx, 2+len(ROIS)))
+        roimap['sum_cor'][self.ny] = 5.0
+        self.mapfile.last_row = self.ny
+        names, block3 = self.mapfile.get_roimap_block(det=None)
+        self.assertEqual(block3.shape, (2+len(ROIS), self.ny+1, self.nx))
+        self.assertTrue((block3[:, self.ny, :] == 5.0).all())
+
+    def test_cache_cleared_and_bounded(self):
+        self.mapfile.get_roimap_block(det=None)
+        self.mapfile.get_area_roistats(det=2)
+        self.assertTrue(len(self.mapfile.roimap_cache) > 0)
+        # cached values for the previous map size are dropped
+        roimap = self.mapfile.xrmmap['roimap']
+        roimap['sum_cor'].resize((self.ny+1, self.nx, 2+len(ROIS)))
+        self.mapfile.last_row = self.ny
+        names, block = self.mapfile.get_roimap_block(det=None)
+        self.assertEqual(list(self.mapfile.roimap_cache.keys()),
+                         ['names', ('block', 'roimap/sum_cor')])
+        # statistics for many areas do not grow the cache without limit
+        maxsize = self.mapfile.roimap_cache.maxsize
+        areas = self.mapfile.xrmmap['areas']
+        for i in range(maxsize + 5):
+            areas.create_dataset('extra_%i' % i, data=self.amask)
+        self.mapfile.get_area_roistats(det=None)
+        self.assertEqual(len(self.mapfile.roimap_cache), maxsize)
+
+    def test_area_stats(self):
+        stats = self.mapfile.get_area_roistats(det=2)['area_001']
+        pixels = self.det_maps(2)[:, self.amask]
+        self.assertEqual(stats['names'], ROIS)
+        self.assertEqual(stats['npts'], self.amask.sum())
+        for stat in ('mean', 'std', 'median', 'min', 'max', 'sum'):
+            self.assertTrue(np.allclose(stats[stat],
+                                        getattr(np, stat)(pixels, axis=1)))
+        # a changed area is not taken from the cache
+        self.mapfile.xrmmap['areas/area_001'][0:5, :] = True
+        stats = self.mapfile.get_area_roistats(det=2)['area_001']
+        self.assertEqual(stats['npts'], self.amask.sum() + 5*self.nx)
+
+    def test_correlations(self):
+        names, corr = self.mapfile.get_roi_correlations(det=None,
+                                                        no_hotcols=False)
+        dat = self.maps['sum_cor'].transpose(2, 0, 1)
+        expected = np.corrcoef(dat.reshape(dat.shape[0], -1))
+        self.assertTrue(np.allclose(corr, expected))
+        self.assertTrue(corr[1, 3] > 0.9)
+        names, corr = self.mapfile.get_roi_correlations(det=None,
+                                                        area='area_001')
+        expected = np.corrcoef(dat[:, self.amask])
+        self.assertTrue(np.allclose(corr, expected))
+
+    def test_constant_roi(self):
+        self.mapfile.xrmmap['roimap/sum_cor'][:, :, 2] = 1.0
+        names, corr = self.mapfile.get_roi_correlations(det=None)
+        self.assertTrue((corr[2] == 0).all() and (corr[:, 2] == 0).all())
+        self.assertFalse(np.isnan(corr).any())
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestROIIndex, TestROIBlocks):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
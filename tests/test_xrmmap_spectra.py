@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+""" Larch Tests: summed spectra and energy range maps for XRF maps """
+import os
+import unittest
+import shutil
+import numpy as np
+from tempfile import mkdtemp
+
+from utils import TestCase
+from xrmmap_utils import make_mapfile, expected_counts
+
+class MapFileTestCase(TestCase):
+    '''test case with a synthetic map file'''
+    def setUp(self):
+        TestCase.setUp(self)
+        self.tmpdir = mkdtemp(prefix='larch_xrmmap')
+        fname = os.path.join(self.tmpdir, 'map.h5')
+        self.mapfile, self.data = make_mapfile(fname)
+        self.ny, self.nx = 40, 52
+
+    def tearDown(self):
+        self.mapfile.h5root.close()
+        shutil.rmtree(self.tmpdir)
+
+    def assertClose(self, a, b):
+        self.assertTrue(np.allclose(a, b, rtol=1.e-5, atol=1.e-3))
+
+class TestMCAIndex(MapFileTestCase):
+    '''test build_mca_index() and area sums from the index'''
+    def areas(self):
+        y, x = np.mgrid[:self.ny, :self.nx]
+        ellipse = ((y-19.5)/17.0)**2 + ((x-24.0)/22.0)**2 < 1
+        rect = np.zeros((self.ny, self.nx), dtype=bool)
+        rect[3:37, 5:50] = True
+        edge = np.zeros((self.ny, self.nx), dtype=bool)
+        edge[30:, 40:] = True
+        pixel = np.zeros((self.ny, self.nx), dtype=bool)
+        pixel[7, 11] = True
+        full = np.ones((self.ny, self.nx), dtype=bool)
+        return [ellipse, rect, edge, pixel, full, ellipse & ~rect]
+
+    def check_index(self, det, dtcorrect, tilesize=8):
+        self.mapfile.build_mca_index(det=det, dtcorrect=dtcorrect,
+                                     tilesize=tilesize)
+        index = self.mapfile.get_mca_index(det=det, dtcorrect=dtcorrect)
+        self.assertTrue(index is not None)
+        counts = expected_counts(self.data, det=det, dtcorrect=dtcorrect)
+        for area in self.areas():
+            out = self.mapfile._get_counts_index(index, area, det=det,
+                                                 dtcorrect=dtcorrect)
+            self.assertClose(out, counts[area].sum(axis=0))
+
+    def test_sum_dtcorrect(self):
+        self.check_index(None, True)
+
+    def test_sum_raw(self):
+        self.check_index(None, False)
+
+    def test_detector(self):
+        self.check_index(2, True, tilesize=4)
+
+    def test_levels(self):
+        name = self.mapfile.build_mca_index(det=1, tilesize=8)
+        index = self.mapfile.xrmmap['mca_index'][name]
+        # 40x52 map: 5x7, 3x4, 2x2, 1x1 tiles
+        self.assertEqual(index.attrs['nlevels'], 4)
+        self.assertEqual(index['level0'].shape[:2], (5, 7))
+        self.assertEqual(index['level3'].shape[:2], (1, 1))
+        counts = expected_counts(self.data, det=1)
+        self.assertClose(index['level3'][0, 0], counts.sum(axis=(0, 1)))
+
+    def test_stale_index(self):
+        self.mapfile.build_mca_index(det=1)
+        self.assertTrue(self.mapfile.get_mca_index(det=1) is not None)
+        self.assertTrue(self.mapfile.get_mca_index(det=1, dtcorrect=False) is None)
+        self.mapfile.xrmmap.attrs['Last_Row'] = self.ny
+        self.assertTrue(self.mapfile.get_mca_index(det=1) is None)
+
+class TestEnergyRange(MapFileTestCase):
+    '''test get_mca_erange() and its saved maps'''
+    def expected(self, det=None, dtcorrect=True, chans=(10, 20)):
+        counts = expected_counts(self.data, det=det, dtcorrect=dtcorrect)
+        return counts[:, :, chans[0]:chans[1]+1].sum(axis=2)
+
+    def test_channels(self):
+        for det in (None, 1, 2):
+            for dtcorrect in (True, False):
+                out = self.mapfile.get_mca_erange(det=det, dtcorrect=dtcorrect,
+                                                  emin=10, emax=20,
+                                                  by_energy=False)
+                self.assertClose(out, self.expected(det, dtcorrect))
+
+    def test_energy(self):
+        # energies are 0.01*channel: both limits inclusive
+        out = self.mapfile.get_mca_erange(det=1, emin=0.0999, emax=0.2001)
+        self.assertClose(out, self.expected(1, True))
+        out = self.mapfile.get_mca_erange(det=1, emin=0.6)
+        self.assertClose(out, self.expected(1, True, chans=(60, 63)))
+
+    def test_saved_map(self):
+        out = self.mapfile.get_mca_erange(det=1, emin=10, emax=20,
+                                          by_energy=False)
+        name = 'erange_det1_10_21_dtc'
+        self.assertTrue(name in self.mapfile.work_array_names())
+        # a saved map is returned for the same settings
+        dset = self.mapfile.get_work_array(name)
+        dset[0, 0] = -1
+        out = self.mapfile.get_mca_erange(det=1, emin=10, emax=20,
+                                          by_energy=False)
+        self.assertEqual(out[0, 0], -1)
+        # but not once rows are added
+        self.mapfile.xrmmap.attrs['Last_Row'] = self.ny
+        out = self.mapfile.get_mca_erange(det=1, emin=10, emax=20,
+                                          by_energy=False)
+        self.assertClose(out, self.expected(1, True))
+
+    def test_named_map(self):
+        get_erange = self.mapfile.get_mca_erange
+        out = get_erange(det=1, emin=10, emax=20, by_energy=False, name='fe')
+        self.assertClose(out, self.expected(1, True))
+        # the same name for other detectors or dead-time correction
+        # must not return the saved map
+        out = get_erange(det=2, emin=10, emax=20, by_energy=False, name='fe')
+        self.assertClose(out, self.expected(2, True))
+        out = get_erange(det=2, dtcorrect=False, emin=10, emax=20,
+                         by_energy=False, name='fe')
+        self.assertClose(out, self.expected(2, False))
+        out = get_erange(det=None, dtcorrect=False, emin=10, emax=20,
+                         by_energy=False, name='fe')
+        self.assertClose(out, self.expected(None, False))
+        self.assertEqual(self.mapfile.work_array_names(), ['fe'])
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestMCAIndex, TestEnergyRange):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+""" Larch Tests: storage profiles and repacking of XRF map files """
+import os
+import unittest
+import shutil
+import h5py
+import numpy as np
+from tempfile import mkdtemp
+
+from utils import TestCase
+from xrmmap_utils import make_mapfile
+
+class TestStorageProfiles(TestCase):
+    '''test mca_chunks(), mca_storage(), repack_xrmmap()'''
+    def setUp(self):
+        TestCase.setUp(self)
+        from larch_plugins.xrmmap import xrm_storage
+        self.storage = xrm_storage
+        self.tmpdir = mkdtemp(prefix='larch_xrmmap')
+        self.fname = os.path.join(self.tmpdir, 'map.h5')
+        mapfile, self.data = make_mapfile(self.fname, chunks=(1, 32, 64))
+        mapfile.h5root.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_append_chunks(self):
+        # the chunks used before storage profiles were added
+        for npts, nchan in ((5, 2048), (52, 2048), (300, 4096), (1001, 2048)):
+            xnpts = max(10, npts)
+            nxx = min(xnpts-1, 2**int(np.log2(xnpts)))
+            nxm = 1024
+            if nxx > 256:
+                nxm = min(1024, int(65536*1.0/ nxx))
+            self.assertEqual(self.storage.mca_chunks('append', npts, nchan),
+                             (1, min(nxx, npts), min(nxm, nchan)))
+
+    def test_profile_chunks(self):
+        ny, nx, nc = self.storage.mca_chunks('area', 300, 2048, nrow=200)
+        self.assertEqual(nc, 2048)
+        self.assertTrue(ny > 1 and nx > 1 and nx <= 300)
+        ny, nx, nc = self.storage.mca_chunks('channel', 300, 2048, nrow=4)
+        self.assertEqual((ny, nc), (4, 16))
+        self.assertRaises(ValueError, self.storage.mca_chunks, 'rows', 10, 10)
+
+    def test_storage_kws(self):
+        kws = self.storage.mca_storage('append', 300, 2048, compression=4,
+                                       shuffle=True)
+        self.assertEqual(kws['compression'], 'gzip')
+        self.assertEqual(kws['compression_opts'], 4)
+        self.assertTrue(kws['shuffle'])
+        kws = self.storage.mca_storage(chunks=(1, 8, 8), compression='none',
+                                       shuffle=True)
+        self.assertEqual(kws, {'chunks': (1, 8, 8)})
+
+    def test_repack(self):
+        outfile = os.path.join(self.tmpdir, 'map_area.h5')
+        self.storage.repack_xrmmap(self.fname, outfile, profile='channel',
+                                   compression='gzip', shuffle=True)
+        with h5py.File(outfile, 'r') as fh:
+            for name in ('det1', 'det2', 'detsum'):
+                counts = fh['xrmmap/%s/counts' % name]
+                self.assertEqual(counts.chunks[2], 16)
+                self.assertEqual(counts.compression, 'gzip')
+                self.assertTrue((counts[()] == self.data[name][0]).all())
+            # other datasets and attributes are copied unchanged
+            self.assertTrue((fh['xrmmap/det1/dtfactor'][()] ==
+                             self.data['det1'][1]).all())
+            self.assertEqual(fh['xrmmap'].attrs['N_Detectors'], 2)
+            self.assertEqual(fh['xrmmap/det1'].attrs['type'], 'mca detector')
+
+    def test_repack_errors(self):
+        self.assertRaises(ValueError, self.storage.repack_xrmmap,
+                          self.fname, self.fname)
+        outfile = os.path.join(self.tmpdir, 'map_x.h5')
+        self.assertRaises(ValueError, self.storage.repack_xrmmap,
+                          self.fname, outfile, profile='rows')
+
+    def test_benchmark(self):
+        out = self.storage.benchmark_xrmmap(self.fname, nrepeat=2,
+                                            verbose=False)
+        self.assertEqual(sorted(out.keys()),
+                         ['area', 'channel', 'pixel', 'row'])
+        for msec, rate in out.values():
+            self.assertTrue(msec >= 0 and rate > 0)
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestStorageProfiles,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
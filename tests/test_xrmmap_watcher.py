@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+""" Larch Tests: watching raw map folders for completed rows """
+import os
+import time
+import unittest
+import shutil
+from tempfile import mkdtemp
+
+from utils import TestCase
+
+HEADER = """# Map Master File
+#
+# ROW   XRF_FILE  SIS_FILE  POS_FILE  TIME
+#-------------------------------------------
+"""
+
+class TestMapFolderWatcher(TestCase):
+    '''test MapFolderWatcher'''
+    def setUp(self):
+        TestCase.setUp(self)
+        from larch_plugins.xrmmap.xrm_watcher import MapFolderWatcher
+        self.MapFolderWatcher = MapFolderWatcher
+        self.folder = mkdtemp(prefix='larch_mapfolder')
+        self.master = os.path.join(self.folder, 'Master.dat')
+        with open(self.master, 'w') as fh:
+            fh.write(HEADER)
+        self.watcher = None
+
+    def tearDown(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+        shutil.rmtree(self.folder)
+
+    def row_files(self, irow, create=True):
+        names = ['xrf_%3.3i.nc' % irow, 'struck_%3.3i.dat' % irow,
+                 'xps_%3.3i.dat' % irow]
+        if create:
+            for name in names:
+                with open(os.path.join(self.folder, name), 'w') as fh:
+                    fh.write('data\n')
+        return names
+
+    def add_row(self, irow, files=True, newline=True):
+        names = self.row_files(irow, create=files)
+        line = '%.3f %s %s %s 12.0' % (0.1*irow, names[0], names[1], names[2])
+        with open(self.master, 'a') as fh:
+            fh.write(line + ('\n' if newline else ''))
+
+    def test_rows_in_order(self):
+        calls = []
+        def callback(row=None, maxrow=None, folder=None, status=None):
+            calls.append((row, maxrow, status))
+        self.watcher = self.MapFolderWatcher(self.folder, settle=0,
+                                             callback=callback)
+        self.add_row(0)
+        self.add_row(1, files=False)
+        self.add_row(2)
+        self.assertEqual(self.watcher.check(), [0])
+        self.assertTrue(self.watcher.pending)
+        # row 2 is only reported after row 1
+        self.row_files(1)
+        self.assertEqual(self.watcher.check(), [1, 2])
+        self.assertFalse(self.watcher.pending)
+        self.assertEqual(calls, [(0, 3, 'ready'), (1, 3, 'ready'),
+                                 (2, 3, 'ready')])
+        self.assertEqual([self.watcher.get_row(timeout=0) for i in range(4)],
+                         [0, 1, 2, None])
+
+    def test_partial_line(self):
+        self.watcher = self.MapFolderWatcher(self.folder, settle=0)
+        self.add_row(0)
+        self.add_row(1, newline=False)
+        self.assertEqual(self.watcher.check(), [0])
+        self.assertEqual(len(self.watcher.rows), 1)
+        with open(self.master, 'a') as fh:
+            fh.write('\n')
+        self.assertEqual(self.watcher.check(), [1])
+        self.assertEqual(len(self.watcher.header), 4)
+
+    def test_settle(self):
+        self.watcher = self.MapFolderWatcher(self.folder, settle=60)
+        self.add_row(0)
+        self.assertEqual(self.watcher.check(), [])
+        self.watcher.settle = 0
+        self.assertEqual(self.watcher.check(), [0])
+
+    def test_start_row(self):
+        self.watcher = self.MapFolderWatcher(self.folder, settle=0,
+                                             start_row=2)
+        for irow in range(4):
+            self.add_row(irow)
+        self.assertEqual(self.watcher.check(), [2, 3])
+
+    def check_thread(self, use_inotify):
+        self.watcher = self.MapFolderWatcher(self.folder, settle=0.05,
+                                             poll_time=5.0,
+                                             use_inotify=use_inotify)
+        self.watcher.start()
+        self.add_row(0)
+        self.add_row(1)
+        self.assertEqual(self.watcher.get_row(timeout=8.0), 0)
+        self.assertEqual(self.watcher.get_row(timeout=8.0), 1)
+        # stop() returns without waiting for the poll time
+        time.sleep(0.2)
+        t0 = time.time()
+        self.watcher.stop()
+        self.assertTrue(time.time()-t0 < 1.0)
+        self.assertTrue(self.watcher.thread is None)
+
+    def test_thread_inotify(self):
+        self.check_thread(True)
+
+    def test_thread_polling(self):
+        self.check_thread(False)
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestMapFolderWatcher,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+""" Larch Tests: streaming XRD frames into XRF map files """
+import os
+import unittest
+import shutil
+import threading
+import h5py
+import numpy as np
+from tempfile import mkdtemp
+
+from utils import TestCase
+
+NQ = 5
+
+class StubRow(object):
+    "row with lazily read XRD frames"
+    def __init__(self, xrdframes, npts, reverse=False):
+        self.xrdframes = xrdframes
+        self.npts = npts
+        self.reverse = reverse
+
+class TestXRDFrames(TestCase):
+    '''test integrate_xrd_frames() and GSEXRM_MapFile.add_xrd_frames()'''
+    def setUp(self):
+        TestCase.setUp(self)
+        from larch_plugins.xrmmap import xrm_mapfile, xrd_hdf5
+        self.xrm_mapfile = xrm_mapfile
+        self.integrate_xrd_row = xrm_mapfile.integrate_xrd_row
+        xrm_mapfile.integrate_xrd_row = self.integrate
+        self.calls = []
+
+        self.tmpdir = mkdtemp(prefix='larch_xrd')
+        fname = os.path.join(self.tmpdir, 'xrd_001.h5')
+        rng = np.random.RandomState(3)
+        self.frames = rng.randint(0, 500, size=(21, 6, 7)).astype('u2')
+        with h5py.File(fname, 'w') as fh:
+            fh.create_dataset(xrd_hdf5.XRDFramesHDF5.path, data=self.frames)
+        self.xrdframes = xrd_hdf5.XRDFramesHDF5(fname)
+
+    def tearDown(self):
+        self.xrm_mapfile.integrate_xrd_row = self.integrate_xrd_row
+        shutil.rmtree(self.tmpdir)
+
+    def integrate(self, frames, poni, steps=NQ, **kws):
+        "stand-in for pyFAI integration: (q, total counts) for each frame"
+        self.calls.append((len(frames), threading.current_thread().name))
+        return [np.array([np.arange(steps), np.ones(steps)*frame.sum()])
+                for frame in frames]
+
+    def expected_1d(self, npts):
+        out = np.zeros((npts, 2, NQ))
+        out[:, 0, :] = np.arange(NQ)
+        nframes = min(npts, len(self.frames))
+        out[:nframes, 1, :] = self.frames[:nframes].sum(axis=(1, 2))[:, None]
+        return out
+
+    def test_integrate_batches(self):
+        out = self.xrm_mapfile.integrate_xrd_frames(self.xrdframes, 21, {},
+                                                    batchsize=8, steps=NQ)
+        self.assertTrue(np.allclose(out, self.expected_1d(21)))
+        self.assertEqual([n for n, name in self.calls], [8, 8, 5])
+
+    def test_integrate_short_row(self):
+        out = self.xrm_mapfile.integrate_xrd_frames(self.xrdframes, 10, {},
+                                                    batchsize=8, steps=NQ)
+        self.assertTrue(np.allclose(out, self.expected_1d(10)))
+        self.assertEqual([n for n, name in self.calls], [8, 2])
+
+    def test_integrate_missing_frames(self):
+        # missing frames are integrated as empty images
+        out = self.xrm_mapfile.integrate_xrd_frames(self.xrdframes, 25, {},
+                                                    batchsize=8, steps=NQ)
+        self.assertEqual(out.shape, (25, 2, NQ))
+        self.assertTrue(np.allclose(out, self.expected_1d(25)))
+
+    def write_frames(self, reverse):
+        mapfile = self.xrm_mapfile.GSEXRM_MapFile.__new__(
+            self.xrm_mapfile.GSEXRM_MapFile)
+        fname = os.path.join(self.tmpdir, 'map.h5')
+        h5root = h5py.File(fname, 'w')
+        try:
+            mapfile.xrmmap = h5root.create_group('xrmmap')
+            data2d = mapfile.xrmmap.create_dataset('xrd/data2D',
+                                                   (3, 21, 6, 7), 'u2')
+            mapfile.flag_xrd2d = True
+            mapfile.xrd_batchsize = 4
+            mapfile.add_xrd_frames(1, StubRow(self.xrdframes, 21,
+                                              reverse=reverse))
+            out = data2d[()]
+        finally:
+            h5root.close()
+        return out
+
+    def test_write_frames(self):
+        out = self.write_frames(False)
+        self.assertTrue((out[1] == self.frames).all())
+        self.assertFalse(out[0].any() or out[2].any())
+        # 1D integration is done when reading rows, not when writing
+        self.assertEqual(self.calls, [])
+
+    def test_write_reversed_frames(self):
+        out = self.write_frames(True)
+        self.assertTrue((out[1] == self.frames[::-1]).all())
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestXRDFrames,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
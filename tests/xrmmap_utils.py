@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+synthetic XRF map files for testing GSEXRM_MapFile methods
+"""
+import os
+import socket
+import numpy as np
+import h5py
+
+def make_mapfile(fname, ny=40, nx=52, nchan=64, ndet=2, chunks=(4, 4, 64),
+                 seed=7):
+    """create a minimal HDF5 XRF map with ndet detectors and a detsum,
+    returning a GSEXRM_MapFile for it and a dict of the counts and
+    dead-time factors for each detector"""
+    from larch_plugins.xrmmap.xrm_mapfile import GSEXRM_MapFile
+    rng = np.random.RandomState(seed)
+    h5root = h5py.File(fname, 'w')
+    xrmmap = h5root.create_group('xrmmap')
+    xrmmap.attrs['N_Detectors'] = ndet
+    xrmmap.attrs['Last_Row'] = ny - 1
+    xrmmap.attrs['Map_Folder'] = ''
+    xrmmap.attrs['Process_Machine'] = socket.gethostname()
+    xrmmap.attrs['Process_ID'] = os.getpid()
+    pos = xrmmap.create_group('positions')
+    pos.create_dataset('pos', data=np.zeros((ny, nx, 2)))
+
+    data = {}
+    energy = 0.01*np.arange(nchan)
+    total = np.zeros((ny, nx, nchan), dtype='i2')
+    for idet in range(1, ndet+1):
+        counts = rng.randint(0, 100, size=(ny, nx, nchan)).astype('i2')
+        dtfactor = 1.0 + 0.1*rng.uniform(size=(ny, nx)).astype('f4')
+        group = xrmmap.create_group('det%i' % idet)
+        group.attrs['type'] = 'mca detector'
+        group.create_dataset('counts', data=counts, chunks=chunks)
+        group.create_dataset('dtfactor', data=dtfactor)
+        group.create_dataset('energy', data=energy)
+        data['det%i' % idet] = (counts, dtfactor)
+        total = total + counts
+    group = xrmmap.create_group('detsum')
+    group.attrs['type'] = 'virtual mca'
+    group.create_dataset('counts', data=total, chunks=chunks)
+    group.create_dataset('energy', data=energy)
+    data['detsum'] = (total, None)
+
+    mapfile = GSEXRM_MapFile.__new__(GSEXRM_MapFile)
+    mapfile.filename = fname
+    mapfile.h5root = h5root
+    mapfile.xrmmap = xrmmap
+    mapfile.ndet = None
+    return mapfile, data
+
+def expected_counts(data, det=None, dtcorrect=True):
+    """(ny, nx, nchan) counts for a detector, as float64"""
+    if det is not None:
+        counts, dtfactor = data['det%i' % det]
+        counts = counts.astype(np.float64)
+        if dtcorrect:
+            counts = counts * dtfactor[:, :, None]
+        return counts
+    if not dtcorrect:
+        return data['detsum'][0].astype(np.float64)
+    out = 0
+    for key, (counts, dtfactor) in data.items():
+        if key != 'detsum':
+            out = out + counts * dtfactor[:, :, None].astype(np.float64)
+    return out
+
+def add_roimaps(mapfile, rois=('Fe Ka', 'Cu Ka', 'Zn Ka'), seed=11):
+    """add ROI maps and an 'areas' group to a map from make_mapfile(),
+    with scalers 'TSCALER' and 'I0', returning a dict of the maps"""
+    from larch.utils import LRUCache
+    from larch_plugins.xrmmap.xrm_mapfile import ROIMAP_CACHE_SIZE
+    rng = np.random.RandomState(seed)
+    xrmmap = mapfile.xrmmap
+    ndet = xrmmap.attrs['N_Detectors']
+    ny, nx = xrmmap['positions/pos'].shape[:2]
+    scalers = ['TSCALER', 'I0']
+    sum_names = scalers + list(rois)
+    det_names = scalers + ['%s (mca%i)' % (roi, idet) for idet in
+                           range(1, ndet+1) for roi in rois]
+    xrmmap.create_dataset('config/rois/name', data=[r.encode() for r in rois])
+    maps = {}
+    roimap = xrmmap.create_group('roimap')
+    for label, names in (('sum', sum_names), ('det', det_names)):
+        roimap.create_dataset('%s_name' % label,
+                              data=[n.encode() for n in names])
+        for kind in ('raw', 'cor'):
+            dat = rng.uniform(0, 1000, size=(ny, nx, len(names)))
+            # correlate the first two ROIs with I0
+            dat[:, :, 3] = 0.5*dat[:, :, 1] + 0.1*dat[:, :, 3]
+            maps['%s_%s' % (label, kind)] = dat
+            roimap.create_dataset('%s_%s' % (label, kind), data=dat,
+                                  maxshape=(None, nx, len(names)))
+    xrmmap.create_group('areas')
+    mapfile.last_row = ny - 1
+    mapfile.roimap_cache = LRUCache(maxsize=ROIMAP_CACHE_SIZE)
+    mapfile.roimap_cache_key = None
+    mapfile.scan_version = 1.40
+    return maps